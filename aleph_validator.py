@@ -0,0 +1,113 @@
+import re
+
+# Checks MARC replies against the Aleph Sequential layout that
+# static/prompts/marc.txt asks for:
+#
+#   000000001 24510 L $$aTitle :$$bsubtitle
+#   |sysno   | |tag|ind| |data
+#
+# Lines are checked one at a time, so a reply can be fed in as it arrives.
+
+SEQUENCE_TOKEN = "000000001"
+RECORD_RETRIES_PER_GROUP = 2
+# Repair requests per job, as a share of its groups (at least the minimum).
+RECORD_RETRY_BUDGET_SHARE = 0.25
+RECORD_RETRY_BUDGET_MIN = 3
+MAX_REPORTED_ERRORS = 20
+
+_LINE_RE = re.compile(r"^(\d{9}) (.{3})(.{2}) L (.*)$")
+_INDICATORS_RE = re.compile(r"^[0-9 ]{2}$")
+_SUBFIELD_START_RE = re.compile(r"^\$\$[0-9a-z]")
+_BAD_SUBFIELD_RE = re.compile(r"\$\$(?![0-9a-z])")
+_MAIN_ENTRY_TAGS = {"100", "110", "111", "130"}
+_FIXED_LENGTHS = {"LDR": 24, "008": 40}
+
+class AlephRecordValidator:
+    def __init__(self, sequence_token=SEQUENCE_TOKEN):
+        self.sequence_token = sequence_token
+        self.errors = []
+        self._line_number = 0
+        self._tags = []
+
+    def _error(self, tag, message, line=None):
+        self.errors.append({"line": self._line_number if line is None else line, "tag": tag, "error": message})
+
+    def feed_line(self, line):
+        # Field-level checks, reported against the line they were found on.
+        self._line_number += 1
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            return
+        match = _LINE_RE.match(line)
+        if not match:
+            self._error("", "not an Aleph Sequential line (expected '<9 digits> <tag><ind> L <data>')")
+            return
+        sysno, tag, indicators, data = match.groups()
+        self._tags.append((self._line_number, tag))
+        if sysno != self.sequence_token:
+            self._error(tag, f"record number {sysno} instead of {self.sequence_token}")
+        if tag not in ("FMT", "LDR") and not tag.isdigit():
+            self._error(tag, "tag is not FMT, LDR or three digits")
+            return
+        if not _INDICATORS_RE.match(indicators):
+            self._error(tag, f"indicators {indicators!r} must be digits or blanks")
+        is_control = tag in ("FMT", "LDR") or tag < "010"
+        if is_control:
+            if indicators.strip():
+                self._error(tag, "control fields take no indicators")
+            expected = _FIXED_LENGTHS.get(tag)
+            if expected and len(data) != expected:
+                self._error(tag, f"{len(data)} characters instead of {expected}")
+        elif not _SUBFIELD_START_RE.match(data):
+            self._error(tag, "data does not start with a $$ subfield code")
+        elif _BAD_SUBFIELD_RE.search(data):
+            self._error(tag, "$$ not followed by a subfield code")
+
+    def finish(self):
+        # Record-level problems; line 0 means the field is missing altogether.
+        tags = [tag for _, tag in self._tags]
+        if not tags:
+            self._error("", "no Aleph Sequential lines", line=0)
+            return self.errors
+        if tags[0] != "FMT":
+            self._error("FMT", "record does not start with FMT", line=self._tags[0][0])
+        if "LDR" not in tags:
+            self._error("LDR", "LDR is missing", line=0)
+        main_entries = [(line, tag) for line, tag in self._tags if tag in _MAIN_ENTRY_TAGS]
+        if len(main_entries) > 1:
+            line, tag = main_entries[1]
+            self._error(tag, f"{len(main_entries)} main entry (1XX) fields; only one is allowed", line=line)
+        titles = [line for line, tag in self._tags if tag == "245"]
+        if not titles:
+            self._error("245", "245 is missing", line=0)
+        elif len(titles) > 1:
+            self._error("245", f"{len(titles)} 245 fields; only one is allowed", line=titles[1])
+        return self.errors
+
+def validate_aleph_record(text, sequence_token=SEQUENCE_TOKEN):
+    validator = AlephRecordValidator(sequence_token)
+    for line in str(text or "").splitlines():
+        validator.feed_line(line)
+    return validator.finish()
+
+def record_retry_budget(group_count):
+    return max(RECORD_RETRY_BUDGET_MIN, int(group_count * RECORD_RETRY_BUDGET_SHARE))
+
+def record_repair_messages(reply, errors):
+    # Appended to the original request: the model sees its own record and the
+    # specific problems, and answers with the whole corrected record.
+    listed = "\n".join(
+        f"- line {error['line']}{' (' + error['tag'] + ')' if error['tag'] else ''}: {error['error']}"
+        for error in errors[:MAX_REPORTED_ERRORS]
+    )
+    return [
+        {"role": "assistant", "content": reply},
+        {
+            "role": "user",
+            "content": (
+                "The record above is not valid Aleph Sequential:\n"
+                f"{listed}\n"
+                "Return the complete corrected record only, following the template exactly."
+            )
+        }
+    ]
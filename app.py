@@ -1,26 +1,107 @@
-from flask import Flask, request, render_template, redirect, url_for, send_file, jsonify
-import os, uuid, zipfile, json, shutil, tempfile, hashlib, threading
+from flask import Flask, Response, request, render_template, redirect, url_for, send_file, jsonify
+import os, uuid, zipfile, json, hashlib, threading, time, mimetypes
 from werkzeug.utils import secure_filename
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from config import UPLOAD_FOLDER, INPUT_ZIPS_FOLDER, ZIP_REGISTRY_PATH
-from worker import process_job
+from config import (
+    UPLOAD_FOLDER,
+    INPUT_ZIPS_FOLDER,
+    ZIP_REGISTRY_PATH,
+    MARC_FOLDERS_ROOT,
+    MARC_RESULTS_FOLDER,
+    MARC_HIDDEN_FOLDERS,
+    JOB_WORKERS,
+    JOB_EXECUTION_MODE,
+    JOB_QUEUE_PATH,
+    RETENTION_INTERVAL_SECONDS,
+    RETENTION_GRACE_SECONDS,
+    RETENTION_JOB_MAX_AGE_DAYS,
+    RETENTION_JOB_MAX_COUNT,
+    RETENTION_JOB_MAX_BYTES,
+    RETENTION_ZIP_MAX_AGE_DAYS,
+    RETENTION_ZIP_MAX_COUNT,
+    RETENTION_ZIP_MAX_BYTES
+)
+from worker import (
+    get_live_partials,
+    pause_job,
+    resume_job,
+    cancel_job,
+    get_job_control,
+    write_job_control_file,
+    load_job_rows,
+    is_failed_output,
+    row_needs_retry,
+    iter_partial_results_zip,
+    JOB_CONTROL_FILE,
+    PARTIAL_ROWS_FILE
+)
+from preflight import OVERSIZE_POLICIES
+from scheduler import scheduler, PRIORITIES
+from job_queue import enqueue_job, cancel_queued_job, forget_job
+from tracing import CHROME_TRACE_FILE
+from cassette import CASSETTE_FILE
+from upload_sessions import (
+    UPLOAD_CHUNK_BYTES,
+    UploadOffsetMismatch,
+    create_upload_session,
+    load_upload_session,
+    append_upload_chunk,
+    complete_upload_session,
+    mark_upload_registering,
+    fail_upload_session,
+    upload_part_path,
+    discard_upload_session,
+    pending_upload_zip_names
+)
+from job_runner import (
+    zip_registry_lock,
+    load_zip_registry_unlocked,
+    save_zip_registry_unlocked,
+    find_registered_zip_sha256,
+    register_uploaded_zip,
+    persist_job_meta,
+    resolve_job_input_zip,
+    resolve_existing_zip,
+    resolve_existing_folder,
+    run_job_pipeline
+)
+from openrouter_client import inflight_request_count, model_health_snapshot
+from listing_cache import get_listing, refresh_listings
+from structured_output import parse_json_schema
+from search_index import SEARCH_FIELDS, search_outputs, backfill_search_index, forget_job_outputs
+from results_browser import list_results_members, results_member_info, iter_results_member, read_results_rows
+from retention import (
+    TRASH_DIR_NAME,
+    touch_last_access,
+    scan_jobs,
+    scan_zips,
+    plan_evictions,
+    remove_job_directory,
+    empty_trash
+)
+import metrics
 
 app = Flask(__name__)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config["EXISTING_ZIPS_FOLDER"] = INPUT_ZIPS_FOLDER
 app.config["ZIP_REGISTRY_FILE"] = ZIP_REGISTRY_PATH
-app.config["MARC_EXISTING_ZIPS_FOLDER"] = "/mnt/mi_rek"
-app.config["MARC_EXISTING_FOLDERS_ROOT"] = "/mnt/mi_rek"
-app.config["MARC_RESULTS_FOLDER"] = "/mnt/mi_rek/results"
-app.config["MARC_HIDDEN_FOLDERS"] = {"results"}
+app.config["MARC_EXISTING_ZIPS_FOLDER"] = MARC_FOLDERS_ROOT
+app.config["MARC_EXISTING_FOLDERS_ROOT"] = MARC_FOLDERS_ROOT
+app.config["MARC_RESULTS_FOLDER"] = MARC_RESULTS_FOLDER
+app.config["MARC_HIDDEN_FOLDERS"] = MARC_HIDDEN_FOLDERS
 os.makedirs(app.config["EXISTING_ZIPS_FOLDER"], exist_ok=True)
 
-executor = ThreadPoolExecutor(max_workers=4)
+executor = ThreadPoolExecutor(max_workers=JOB_WORKERS)
 jobs = {}
 metas = {}
-zip_registry_lock = threading.Lock()
+upload_registrations = set()
+upload_registrations_lock = threading.Lock()
+retention_lock = threading.Lock()
+retention_thread_lock = threading.Lock()
+retention_state = {"thread": None, "last_report": None}
 
+FALLBACK_MODEL_SLOTS = 2
 MAIN_DEFAULT_MODEL_ID = "google/gemini-3.1-flash-lite-preview"
 MARC_DEFAULT_MODEL_ID = "openai/gpt-5.4"
 MODEL_DROPDOWN_GROUPS = [
@@ -81,579 +162,48 @@ def format_file_size(size_bytes):
         return f"{int(value)} {units[unit_idx]}"
     return f"{value:.2f} {units[unit_idx]}"
 
-def _file_sha256(path, chunk_size=1024 * 1024):
+def _uploaded_zip_name(filename, source_route):
+    uploaded_name = secure_filename(filename or "")
+    if not uploaded_name:
+        uploaded_name = "upload.zip"
+    elif not uploaded_name.lower().endswith(".zip"):
+        uploaded_name = f"{uploaded_name}.zip"
+    if source_route == "marc" and not uploaded_name.lower().startswith("inputs_"):
+        uploaded_name = f"inputs_{uploaded_name}"
+    return uploaded_name
+
+def _save_upload_with_sha256(file, target_path, chunk_size=1024 * 1024):
+    # Hash while saving so registration does not read the ZIP again.
     digest = hashlib.sha256()
-    with open(path, "rb") as f:
+    with open(target_path, "wb") as f:
         while True:
-            chunk = f.read(chunk_size)
+            chunk = file.stream.read(chunk_size)
             if not chunk:
                 break
             digest.update(chunk)
+            f.write(chunk)
     return digest.hexdigest()
 
-def _normalize_rel_path(path):
-    return path.replace("\\", "/").lstrip("./")
-
-def _iter_directory_files_sorted(source_dir):
-    files = []
-    for root, _, filenames in os.walk(source_dir):
-        for filename in filenames:
-            file_path = os.path.join(root, filename)
-            rel_path = _normalize_rel_path(os.path.relpath(file_path, source_dir))
-            files.append((rel_path, file_path))
-    files.sort(key=lambda row: row[0])
-    return files
-
-def _content_sha256_for_directory(source_dir, chunk_size=1024 * 1024):
-    digest = hashlib.sha256()
-    for rel_path, file_path in _iter_directory_files_sorted(source_dir):
-        digest.update(rel_path.encode("utf-8"))
-        digest.update(b"\0")
-        with open(file_path, "rb") as f:
-            while True:
-                chunk = f.read(chunk_size)
-                if not chunk:
-                    break
-                digest.update(chunk)
-        digest.update(b"\0")
-    return digest.hexdigest()
-
-def _content_sha256_for_zip(zip_path, chunk_size=1024 * 1024):
-    digest = hashlib.sha256()
-    with zipfile.ZipFile(zip_path, "r") as zf:
-        infos = [info for info in zf.infolist() if not info.is_dir()]
-        infos.sort(key=lambda info: _normalize_rel_path(info.filename))
-        for info in infos:
-            rel_path = _normalize_rel_path(info.filename)
-            digest.update(rel_path.encode("utf-8"))
-            digest.update(b"\0")
-            with zf.open(info, "r") as src:
-                while True:
-                    chunk = src.read(chunk_size)
-                    if not chunk:
-                        break
-                    digest.update(chunk)
-            digest.update(b"\0")
-    return digest.hexdigest()
-
-def write_deterministic_zip_from_directory_contents(source_dir, zip_path):
-    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-        for rel_path, file_path in _iter_directory_files_sorted(source_dir):
-            info = zipfile.ZipInfo(filename=rel_path, date_time=(1980, 1, 1, 0, 0, 0))
-            info.compress_type = zipfile.ZIP_DEFLATED
-            info.create_system = 0
-            with zf.open(info, "w") as dst, open(file_path, "rb") as src:
-                shutil.copyfileobj(src, dst, length=1024 * 1024)
-
-def _load_zip_registry_unlocked():
-    registry_path = app.config["ZIP_REGISTRY_FILE"]
-    if not os.path.exists(registry_path):
-        return {"version": 1, "entries": []}
-
-    try:
-        with open(registry_path, encoding="utf-8") as f:
-            data = json.load(f)
-    except Exception:
-        return {"version": 1, "entries": []}
-
-    if not isinstance(data, dict):
-        return {"version": 1, "entries": []}
-
-    entries = data.get("entries")
-    if not isinstance(entries, list):
-        data["entries"] = []
-
-    if "version" not in data:
-        data["version"] = 1
-
-    return data
-
-def _save_zip_registry_unlocked(registry):
-    registry_path = app.config["ZIP_REGISTRY_FILE"]
-    os.makedirs(os.path.dirname(registry_path), exist_ok=True)
-    temp_path = f"{registry_path}.tmp"
-    with open(temp_path, "w", encoding="utf-8") as f:
-        json.dump(registry, f, indent=2, ensure_ascii=False)
-    os.replace(temp_path, registry_path)
-
-def _prune_registry_entries_unlocked(registry, zips_folder):
-    valid_entries = []
-    for entry in registry.get("entries", []):
-        zip_name = os.path.basename((entry.get("zip_name") or "").strip())
-        if not zip_name:
-            continue
-        zip_path = os.path.join(zips_folder, zip_name)
-        if os.path.isfile(zip_path):
-            entry["zip_name"] = zip_name
-            valid_entries.append(entry)
-    registry["entries"] = valid_entries
-
-def _find_registry_match_unlocked(registry, zips_folder, content_sha256=None, zip_sha256=None):
-    for entry in registry.get("entries", []):
-        zip_name = os.path.basename((entry.get("zip_name") or "").strip())
-        if not zip_name:
-            continue
-        zip_path = os.path.join(zips_folder, zip_name)
-        if not os.path.isfile(zip_path):
-            continue
-        if content_sha256 and entry.get("content_sha256") == content_sha256:
-            return entry
-        if zip_sha256 and entry.get("zip_sha256") == zip_sha256:
-            return entry
-    return None
-
-def _build_storage_zip_name(original_name, content_sha256, zips_folder):
-    safe_name = secure_filename(os.path.basename((original_name or "").strip()))
-    if not safe_name:
-        safe_name = "input.zip"
-    if not safe_name.lower().endswith(".zip"):
-        safe_name = f"{safe_name}.zip"
-    stem, ext = os.path.splitext(safe_name)
-    stem = stem[:80] or "input"
-    suffix = content_sha256[:12]
-    candidate = f"{stem}_{suffix}{ext}"
-    final_path = os.path.join(zips_folder, candidate)
-    if not os.path.exists(final_path):
-        return candidate
-
-    counter = 2
-    while True:
-        candidate = f"{stem}_{suffix}_{counter}{ext}"
-        final_path = os.path.join(zips_folder, candidate)
-        if not os.path.exists(final_path):
-            return candidate
-        counter += 1
-
-def _build_registry_entry(zip_name, zip_sha256, content_sha256, source):
-    zips_folder = app.config["EXISTING_ZIPS_FOLDER"]
-    zip_path = os.path.join(zips_folder, zip_name)
-    size_bytes = os.path.getsize(zip_path) if os.path.exists(zip_path) else 0
+def _zip_listing_entry(zip_path, filename, stat):
     return {
-        "zip_name": zip_name,
-        "zip_sha256": zip_sha256,
-        "content_sha256": content_sha256,
-        "size_bytes": size_bytes,
-        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "source": source
+        "name": filename,
+        "size_label": format_file_size(stat.st_size),
+        "modified_at": datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M:%S")
     }
 
-def _find_matching_zip_file_on_disk(content_sha256=None, zip_sha256=None):
-    zips_folder = app.config["EXISTING_ZIPS_FOLDER"]
-    if not os.path.isdir(zips_folder):
-        return None, None, None
-
-    for filename in os.listdir(zips_folder):
-        if not filename.lower().endswith(".zip"):
-            continue
-        zip_path = os.path.join(zips_folder, filename)
-        if not os.path.isfile(zip_path):
-            continue
-
-        try:
-            file_zip_sha256 = _file_sha256(zip_path) if zip_sha256 else None
-        except Exception:
-            continue
-
-        if zip_sha256 and file_zip_sha256 == zip_sha256:
-            return zip_path, file_zip_sha256, None
-
-        if content_sha256:
-            try:
-                file_content_sha256 = _content_sha256_for_zip(zip_path)
-            except Exception:
-                continue
-            if file_content_sha256 == content_sha256:
-                if file_zip_sha256 is None:
-                    file_zip_sha256 = _file_sha256(zip_path)
-                return zip_path, file_zip_sha256, file_content_sha256
-
-    return None, None, None
-
-def _register_existing_zip_path(existing_zip_path, zip_sha256=None, content_sha256=None):
-    zips_folder = app.config["EXISTING_ZIPS_FOLDER"]
-    zip_name = os.path.basename(existing_zip_path)
-
-    with zip_registry_lock:
-        registry = _load_zip_registry_unlocked()
-        _prune_registry_entries_unlocked(registry, zips_folder)
-        for entry in registry.get("entries", []):
-            if entry.get("zip_name") == zip_name:
-                return entry, False
-
-    if zip_sha256 is None:
-        zip_sha256 = _file_sha256(existing_zip_path)
-    if content_sha256 is None:
-        content_sha256 = _content_sha256_for_zip(existing_zip_path)
-
-    with zip_registry_lock:
-        registry = _load_zip_registry_unlocked()
-        _prune_registry_entries_unlocked(registry, zips_folder)
-        existing_entry = _find_registry_match_unlocked(
-            registry,
-            zips_folder,
-            content_sha256=content_sha256,
-            zip_sha256=zip_sha256
-        )
-        if existing_entry:
-            return existing_entry, False
-
-        entry = _build_registry_entry(
-            zip_name=zip_name,
-            zip_sha256=zip_sha256,
-            content_sha256=content_sha256,
-            source="existing"
-        )
-        registry["entries"].append(entry)
-        _save_zip_registry_unlocked(registry)
-        return entry, True
-
-def _register_uploaded_zip(candidate_zip_path, original_name):
-    zips_folder = app.config["EXISTING_ZIPS_FOLDER"]
-    zip_sha256 = _file_sha256(candidate_zip_path)
-    content_sha256 = _content_sha256_for_zip(candidate_zip_path)
-
-    with zip_registry_lock:
-        registry = _load_zip_registry_unlocked()
-        _prune_registry_entries_unlocked(registry, zips_folder)
-        existing_entry = _find_registry_match_unlocked(
-            registry,
-            zips_folder,
-            content_sha256=content_sha256,
-            zip_sha256=zip_sha256
-        )
-        if existing_entry:
-            if os.path.exists(candidate_zip_path):
-                os.remove(candidate_zip_path)
-            return existing_entry, False
-
-    matched_path, matched_zip_sha256, matched_content_sha256 = _find_matching_zip_file_on_disk(
-        content_sha256=content_sha256,
-        zip_sha256=zip_sha256
-    )
-    if matched_path:
-        existing_entry, _ = _register_existing_zip_path(
-            matched_path,
-            zip_sha256=matched_zip_sha256 or zip_sha256,
-            content_sha256=matched_content_sha256 or content_sha256
-        )
-        if os.path.exists(candidate_zip_path):
-            os.remove(candidate_zip_path)
-        return existing_entry, False
-
-    with zip_registry_lock:
-        registry = _load_zip_registry_unlocked()
-        _prune_registry_entries_unlocked(registry, zips_folder)
-        existing_entry = _find_registry_match_unlocked(
-            registry,
-            zips_folder,
-            content_sha256=content_sha256,
-            zip_sha256=zip_sha256
-        )
-        if existing_entry:
-            if os.path.exists(candidate_zip_path):
-                os.remove(candidate_zip_path)
-            return existing_entry, False
-
-        zip_name = _build_storage_zip_name(original_name, content_sha256, zips_folder)
-        final_path = os.path.join(zips_folder, zip_name)
-        try:
-            os.replace(candidate_zip_path, final_path)
-        except OSError:
-            shutil.move(candidate_zip_path, final_path)
-
-        entry = _build_registry_entry(
-            zip_name=zip_name,
-            zip_sha256=zip_sha256,
-            content_sha256=content_sha256,
-            source="uploaded"
-        )
-        registry["entries"].append(entry)
-        _save_zip_registry_unlocked(registry)
-        return entry, True
-
-def _register_folder_contents(folder_path, original_name):
-    zips_folder = app.config["EXISTING_ZIPS_FOLDER"]
-    content_sha256 = _content_sha256_for_directory(folder_path)
-
-    with zip_registry_lock:
-        registry = _load_zip_registry_unlocked()
-        _prune_registry_entries_unlocked(registry, zips_folder)
-        existing_entry = _find_registry_match_unlocked(
-            registry,
-            zips_folder,
-            content_sha256=content_sha256
-        )
-        if existing_entry:
-            return existing_entry, False
-
-    matched_path, matched_zip_sha256, matched_content_sha256 = _find_matching_zip_file_on_disk(
-        content_sha256=content_sha256
-    )
-    if matched_path:
-        existing_entry, _ = _register_existing_zip_path(
-            matched_path,
-            zip_sha256=matched_zip_sha256,
-            content_sha256=matched_content_sha256 or content_sha256
-        )
-        return existing_entry, False
-
-    fd, temp_zip_path = tempfile.mkstemp(
-        prefix="input_build_",
-        suffix=".zip.tmp",
-        dir=zips_folder
-    )
-    os.close(fd)
-    try:
-        write_deterministic_zip_from_directory_contents(folder_path, temp_zip_path)
-        zip_sha256 = _file_sha256(temp_zip_path)
-
-        with zip_registry_lock:
-            registry = _load_zip_registry_unlocked()
-            _prune_registry_entries_unlocked(registry, zips_folder)
-            existing_entry = _find_registry_match_unlocked(
-                registry,
-                zips_folder,
-                content_sha256=content_sha256,
-                zip_sha256=zip_sha256
-            )
-            if existing_entry:
-                if os.path.exists(temp_zip_path):
-                    os.remove(temp_zip_path)
-                return existing_entry, False
-
-            zip_name = _build_storage_zip_name(original_name, content_sha256, zips_folder)
-            final_path = os.path.join(zips_folder, zip_name)
-            try:
-                os.replace(temp_zip_path, final_path)
-            except OSError:
-                shutil.move(temp_zip_path, final_path)
-
-            entry = _build_registry_entry(
-                zip_name=zip_name,
-                zip_sha256=zip_sha256,
-                content_sha256=content_sha256,
-                source="folder"
-            )
-            registry["entries"].append(entry)
-            _save_zip_registry_unlocked(registry)
-            return entry, True
-    finally:
-        if os.path.exists(temp_zip_path):
-            os.remove(temp_zip_path)
-
-def persist_job_meta(job_dir, meta):
-    meta_for_disk = dict(meta)
-    api_key = meta_for_disk.get("api_key", "")
-    meta_for_disk.pop("api_key", None)
-    meta_for_disk["api_key_last8"] = api_key[-8:] if api_key else ""
-    meta_path = os.path.join(job_dir, "meta.json")
-    with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump(meta_for_disk, f, indent=2, ensure_ascii=False)
-    return meta_path
-
-def resolve_job_input_zip(job_dir, meta):
-    shared_relpath = os.path.basename((meta.get("input_zip_relpath") or "").strip())
-    if shared_relpath:
-        _, shared_path = resolve_existing_zip(shared_relpath, app.config["EXISTING_ZIPS_FOLDER"])
-        if shared_path:
-            return shared_relpath, shared_path
-
-    shared_name = os.path.basename((meta.get("input_zip_name") or "").strip())
-    if shared_name:
-        _, shared_path = resolve_existing_zip(shared_name, app.config["EXISTING_ZIPS_FOLDER"])
-        if shared_path:
-            return shared_name, shared_path
-
-    if shared_name:
-        local_path = os.path.join(job_dir, shared_name)
-        if os.path.exists(local_path):
-            return shared_name, local_path
-
-    legacy_path = os.path.join(job_dir, "input.zip")
-    if os.path.exists(legacy_path):
-        return "input.zip", legacy_path
-
-    return None, None
-
-def resolve_existing_zip(zip_name, zips_folder):
-    candidate_name = os.path.basename((zip_name or "").strip())
-    if not candidate_name or not candidate_name.lower().endswith(".zip"):
-        return None, None
-
-    base_dir = os.path.abspath(zips_folder)
-    zip_path = os.path.abspath(os.path.join(base_dir, candidate_name))
-    if os.path.commonpath([base_dir, zip_path]) != base_dir:
-        return None, None
-
-    if not os.path.isfile(zip_path):
-        return None, None
-
-    return candidate_name, zip_path
-
 def list_existing_zips(zips_dir):
-    if not os.path.isdir(zips_dir):
-        return []
-
-    entries = []
-    for filename in os.listdir(zips_dir):
-        if not filename.lower().endswith(".zip"):
-            continue
-
-        zip_path = os.path.join(zips_dir, filename)
-        if not os.path.isfile(zip_path):
-            continue
-
-        stat = os.stat(zip_path)
-        entries.append({
-            "name": filename,
-            "size_label": format_file_size(stat.st_size),
-            "modified_at": datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M:%S"),
-            "modified_ts": stat.st_mtime
-        })
-
-    entries.sort(key=lambda row: row["modified_ts"], reverse=True)
-    for entry in entries:
-        entry.pop("modified_ts", None)
+    return get_listing(zips_dir, _zip_listing_entry, suffix=".zip")
 
-    return entries
-
-def resolve_existing_folder(folder_name, folders_root, excluded_names=None):
-    candidate_name = os.path.basename((folder_name or "").strip())
-    if not candidate_name:
-        return None, None
-    if excluded_names and candidate_name in excluded_names:
-        return None, None
-
-    base_dir = os.path.abspath(folders_root)
-    folder_path = os.path.abspath(os.path.join(base_dir, candidate_name))
-    if os.path.commonpath([base_dir, folder_path]) != base_dir:
-        return None, None
-
-    if not os.path.isdir(folder_path):
-        return None, None
-
-    return candidate_name, folder_path
+def _folder_listing_entry(folder_path, name, stat):
+    child_count = len(os.listdir(folder_path))
+    return {
+        "name": name,
+        "items_label": f"{child_count} item{'s' if child_count != 1 else ''}",
+        "modified_at": datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M:%S")
+    }
 
 def list_existing_folders(folders_root, excluded_names=None):
-    if not os.path.isdir(folders_root):
-        return []
-
-    excluded = set(excluded_names or [])
-    entries = []
-    for name in os.listdir(folders_root):
-        if name in excluded:
-            continue
-        folder_path = os.path.join(folders_root, name)
-        if not os.path.isdir(folder_path):
-            continue
-
-        stat = os.stat(folder_path)
-        child_count = len(os.listdir(folder_path))
-        entries.append({
-            "name": name,
-            "items_label": f"{child_count} item{'s' if child_count != 1 else ''}",
-            "modified_at": datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M:%S"),
-            "modified_ts": stat.st_mtime
-        })
-
-    entries.sort(key=lambda row: row["modified_ts"], reverse=True)
-    for entry in entries:
-        entry.pop("modified_ts", None)
-
-    return entries
-
-def extract_zip_to_directory(zip_path, target_dir):
-    if os.path.isdir(target_dir):
-        shutil.rmtree(target_dir, ignore_errors=True)
-    os.makedirs(target_dir, exist_ok=True)
-    with zipfile.ZipFile(zip_path, "r") as zf:
-        zf.extractall(target_dir)
-
-def prepare_job_input(job_id, meta):
-    job_dir = os.path.join(app.config["UPLOAD_FOLDER"], job_id)
-    input_source = meta.get("input_source")
-    source_route = meta.get("source_route", "index")
-
-    if input_source == "folder":
-        folder_name = meta.get("input_folder_name", "")
-        folder_root = meta.get("input_folder_root", app.config["MARC_EXISTING_FOLDERS_ROOT"])
-        excluded_folders = app.config["MARC_HIDDEN_FOLDERS"] if source_route == "marc" else None
-        resolved_name, folder_path = resolve_existing_folder(
-            folder_name,
-            folder_root,
-            excluded_names=excluded_folders
-        )
-        if not folder_path:
-            raise ValueError(f"Selected folder was not found in {folder_root}.")
-
-        folder_stem = secure_filename(resolved_name) or "folder"
-        suggested_name = f"inputs_{folder_stem}.zip" if source_route == "marc" else f"{folder_stem}.zip"
-        entry, _ = _register_folder_contents(folder_path, suggested_name)
-    elif input_source == "existing":
-        selected_zip_name = meta.get("selected_existing_zip", "")
-        _, existing_zip_path = resolve_existing_zip(selected_zip_name, app.config["EXISTING_ZIPS_FOLDER"])
-        if not existing_zip_path:
-            raise ValueError("Selected ZIP file was not found in data/zips.")
-        entry, _ = _register_existing_zip_path(existing_zip_path)
-    elif input_source == "uploaded":
-        staging_name = os.path.basename((meta.get("staging_upload_name") or "").strip())
-        if not staging_name:
-            raise ValueError("Uploaded ZIP staging file is missing.")
-        staging_path = os.path.join(job_dir, staging_name)
-        if not os.path.isfile(staging_path):
-            raise ValueError("Uploaded ZIP staging file was not found.")
-        original_name = meta.get("uploaded_original_name") or "upload.zip"
-        entry, _ = _register_uploaded_zip(staging_path, original_name)
-    else:
-        raise ValueError("Unknown input source.")
-
-    shared_zip_name = entry["zip_name"]
-    shared_zip_path = os.path.join(app.config["EXISTING_ZIPS_FOLDER"], shared_zip_name)
-    if not os.path.isfile(shared_zip_path):
-        raise ValueError("Shared input ZIP was not found after registration.")
-
-    input_dir = os.path.join(job_dir, "input")
-    extract_zip_to_directory(shared_zip_path, input_dir)
-
-    meta["input_zip_name"] = shared_zip_name
-    meta["input_zip_relpath"] = shared_zip_name
-    meta["input_zip_hash"] = entry.get("zip_sha256", "")
-    meta["input_content_hash"] = entry.get("content_sha256", "")
-    meta["input_storage"] = "shared"
-    meta["input_status"] = "ready"
-    meta["input_prepared_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    persist_job_meta(job_dir, meta)
-
-def cleanup_job_input_dir(job_id):
-    job_dir = os.path.join(app.config["UPLOAD_FOLDER"], job_id)
-    input_dir = os.path.join(job_dir, "input")
-    if os.path.isdir(input_dir):
-        shutil.rmtree(input_dir, ignore_errors=True)
-
-def cleanup_staged_upload(job_id, meta):
-    staging_name = os.path.basename((meta.get("staging_upload_name") or "").strip())
-    if not staging_name:
-        return
-    job_dir = os.path.join(app.config["UPLOAD_FOLDER"], job_id)
-    staging_path = os.path.join(job_dir, staging_name)
-    if os.path.isfile(staging_path):
-        os.remove(staging_path)
-
-def run_job_pipeline(job_id, meta):
-    job_dir = os.path.join(app.config["UPLOAD_FOLDER"], job_id)
-    try:
-        meta["input_status"] = "preparing"
-        persist_job_meta(job_dir, meta)
-        prepare_job_input(job_id, meta)
-        return process_job(job_id, meta)
-    except Exception as e:
-        meta["input_status"] = "error"
-        meta["input_error"] = str(e)
-        persist_job_meta(job_dir, meta)
-        raise
-    finally:
-        cleanup_staged_upload(job_id, meta)
-        cleanup_job_input_dir(job_id)
+    return get_listing(folders_root, _folder_listing_entry, want_dirs=True, excluded_names=excluded_names)
 
 def handle_submission(
     template_name,
@@ -670,6 +220,9 @@ def handle_submission(
     default_model_id = MARC_DEFAULT_MODEL_ID if source_route == "marc" else MAIN_DEFAULT_MODEL_ID
     template_context.setdefault("default_model_id", default_model_id)
     template_context.setdefault("model_dropdown_groups", MODEL_DROPDOWN_GROUPS)
+    template_context.setdefault("fallback_model_slots", FALLBACK_MODEL_SLOTS)
+    default_oversize_policy = "subsample" if source_route == "marc" else "chunk"
+    template_context.setdefault("default_oversize_policy", default_oversize_policy)
     if existing_zips_folder is None:
         existing_zips_folder = app.config["EXISTING_ZIPS_FOLDER"]
     if existing_zips_label is None:
@@ -693,9 +246,33 @@ def handle_submission(
         reasoning_mode = request.form.get("reasoning_mode", "off").strip().lower()
         if reasoning_mode not in {"off", "true", "false"}:
             reasoning_mode = "off"
+        stream_responses = "stream_responses" in request.form
+        hedge_requests = "hedge_requests" in request.form
+        pack_small_files = "pack_small_files" in request.form
+        record_cassette = "record_cassette" in request.form
+        validate_records = "validate_records" in request.form
+        structured_output = "structured_output" in request.form
+        oversize_policy = request.form.get("oversize_policy", default_oversize_policy).strip().lower()
+        if oversize_policy not in OVERSIZE_POLICIES:
+            oversize_policy = default_oversize_policy
+        fallback_models = []
+        for slot in range(1, FALLBACK_MODEL_SLOTS + 1):
+            fallback_model = request.form.get(f"fallback_model_{slot}", "").strip()
+            if fallback_model and fallback_model != model and fallback_model not in fallback_models:
+                fallback_models.append(fallback_model)
+        priority = request.form.get("priority", "normal").strip().lower()
+        if priority not in PRIORITIES:
+            priority = "normal"
+        try:
+            pack_token_budget = max(500, int(request.form.get("pack_token_budget", "").strip()))
+        except ValueError:
+            pack_token_budget = 0
+        hedge_model = request.form.get("hedge_model", "").strip()
         file = request.files.get("zipfile")
         selected_existing_zip = request.form.get("existing_zip", "").strip()
         selected_existing_folder = request.form.get("existing_folder", "").strip()
+        upload_id = request.form.get("upload_id", "").strip()
+        upload_session = None
 
         input_source = ""
         selected_folder_name = ""
@@ -721,14 +298,22 @@ def handle_submission(
                 context["error"] = f"Selected ZIP file was not found in {existing_zips_label}."
                 return render_template(template_name, **context), 400
             input_source = "existing"
+        elif upload_id:
+            # A chunked upload has already been stored in the ZIP registry.
+            upload_session = load_upload_session(upload_id)
+            registered_zip_name, _ = resolve_existing_zip(
+                (upload_session or {}).get("zip_name", ""),
+                app.config["EXISTING_ZIPS_FOLDER"]
+            )
+            if not upload_session or not upload_session.get("complete") or not registered_zip_name:
+                context = dict(template_context)
+                context["error"] = "The uploaded ZIP is incomplete or has expired. Please upload it again."
+                return render_template(template_name, **context), 400
+            selected_zip_name = registered_zip_name
+            uploaded_original_name = upload_session["filename"]
+            input_source = "existing"
         elif uploaded_filename:
-            uploaded_original_name = secure_filename(uploaded_filename)
-            if not uploaded_original_name:
-                uploaded_original_name = "upload.zip"
-            elif not uploaded_original_name.lower().endswith(".zip"):
-                uploaded_original_name = f"{uploaded_original_name}.zip"
-            if source_route == "marc" and not uploaded_original_name.lower().startswith("inputs_"):
-                uploaded_original_name = f"inputs_{uploaded_original_name}"
+            uploaded_original_name = _uploaded_zip_name(uploaded_filename, source_route)
             input_source = "uploaded"
         else:
             context = dict(template_context)
@@ -756,14 +341,26 @@ def handle_submission(
                 context = dict(template_context)
                 context["error"] = "Select at least one output format."
                 return render_template(template_name, **context), 400
+        structured_output = structured_output and "json" in output_formats
+        json_schema = None
+        if structured_output:
+            try:
+                json_schema = parse_json_schema(request.form.get("json_schema", ""))
+            except ValueError as e:
+                context = dict(template_context)
+                context["error"] = str(e)
+                return render_template(template_name, **context), 400
 
         job_id = str(uuid.uuid4())
         job_dir = os.path.join(app.config["UPLOAD_FOLDER"], job_id)
         os.makedirs(job_dir, exist_ok=True)
+        uploaded_zip_sha256 = ""
         if input_source == "uploaded":
             staged_upload_name = "uploaded_input_staging.zip"
             staged_upload_path = os.path.join(job_dir, staged_upload_name)
-            file.save(staged_upload_path)
+            uploaded_zip_sha256 = _save_upload_with_sha256(file, staged_upload_path)
+        elif upload_session:
+            discard_upload_session(upload_session["upload_id"])
 
         meta = {
             "api_key": api_key,
@@ -772,7 +369,20 @@ def handle_submission(
             "custom_footer": custom_footer if source_route == "marc" else "",
             "model": model,
             "reasoning_mode": reasoning_mode,
+            "stream_responses": stream_responses,
+            "hedge_requests": hedge_requests,
+            "hedge_model": hedge_model if hedge_requests else "",
+            "oversize_policy": oversize_policy,
+            "priority": priority,
+            "fallback_models": fallback_models,
+            "cassette_mode": "record" if record_cassette else "off",
+            "validate_records": validate_records if source_route == "marc" else False,
+            "pack_small_files": pack_small_files if source_route == "index" and not structured_output else False,
+            "structured_output": structured_output,
+            "json_schema": json_schema,
+            "pack_token_budget": pack_token_budget if source_route == "index" else 0,
             "submitted_at": timestamp,
+            "queued_at_ts": time.time(),
             "group_by_subfolder": group_by_subfolder,
             "separate_outputs": separate_outputs if source_route == "marc" else False,
             "output_formats": output_formats if source_route == "index" else [],
@@ -783,6 +393,7 @@ def handle_submission(
             "selected_existing_zip": selected_zip_name,
             "uploaded_original_name": uploaded_original_name,
             "staging_upload_name": staged_upload_name,
+            "uploaded_zip_sha256": uploaded_zip_sha256,
             "input_folder_name": selected_folder_name if input_source == "folder" else "",
             "input_folder_root": existing_folders_root if input_source == "folder" else "",
             "input_zip_name": selected_zip_name if input_source == "existing" else "",
@@ -793,6 +404,12 @@ def handle_submission(
             "input_status": "pending",
             "source_route": source_route
         }
+        if JOB_EXECUTION_MODE == "queue":
+            meta["queue_state"] = "queued"
+            persist_job_meta(job_dir, meta)
+            enqueue_job(job_id, api_key)
+            return redirect(url_for("status", job_id=job_id))
+
         persist_job_meta(job_dir, meta)
 
         future = executor.submit(run_job_pipeline, job_id, meta)
@@ -806,13 +423,15 @@ def handle_submission(
 @app.route("/", methods=["GET", "POST"])
 def index():
     existing_zips_folder = app.config["EXISTING_ZIPS_FOLDER"]
+    existing_zips, listing_refreshed_at = list_existing_zips(existing_zips_folder)
     return handle_submission(
         "index.html",
         group_by_subfolder=True,
         source_route="index",
         template_context={
-            "existing_zips": list_existing_zips(existing_zips_folder),
-            "existing_zips_label": "data/zips"
+            "existing_zips": existing_zips,
+            "existing_zips_label": "data/zips",
+            "listing_refreshed_at": listing_refreshed_at
         },
         existing_zips_folder=existing_zips_folder,
         existing_zips_label="data/zips"
@@ -823,13 +442,15 @@ def marc():
     existing_zips_folder = app.config["EXISTING_ZIPS_FOLDER"]
     existing_folders_root = app.config["MARC_EXISTING_FOLDERS_ROOT"]
     hidden_folders = app.config["MARC_HIDDEN_FOLDERS"]
+    existing_folders, listing_refreshed_at = list_existing_folders(existing_folders_root, excluded_names=hidden_folders)
     return handle_submission(
         "marc.html",
         group_by_subfolder=True,
         source_route="marc",
         template_context={
-            "existing_folders": list_existing_folders(existing_folders_root, excluded_names=hidden_folders),
-            "existing_folders_label": existing_folders_root
+            "existing_folders": existing_folders,
+            "existing_folders_label": existing_folders_root,
+            "listing_refreshed_at": listing_refreshed_at
         },
         existing_zips_folder=existing_zips_folder,
         existing_zips_label="data/zips",
@@ -838,10 +459,68 @@ def marc():
         existing_folders_label=existing_folders_root
     )
 
+def load_job_meta(job_id):
+    meta_file = os.path.join(app.config["UPLOAD_FOLDER"], job_id, "meta.json")
+    if not os.path.isfile(meta_file):
+        return None
+    try:
+        with open(meta_file, encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def read_job_control_request(job_dir):
+    try:
+        with open(os.path.join(job_dir, JOB_CONTROL_FILE), encoding="utf-8") as f:
+            return json.load(f).get("action")
+    except (OSError, ValueError):
+        return None
+
+def running_job_status(job_id):
+    control = get_job_control(job_id) or {}
+    if control.get("cancelled"):
+        return "Cancelling"
+    if control.get("paused"):
+        return "Paused"
+    return "Running"
+
+def stored_job_status(job_id, meta):
+    job_dir = os.path.join(app.config["UPLOAD_FOLDER"], job_id)
+    queue_state = meta.get("queue_state")
+    if not queue_state:
+        # Jobs run inline by an earlier web process only leave their files.
+        zips = [f for f in os.listdir(job_dir) if f.startswith("results_") and f.endswith(".zip")]
+        if not zips:
+            return "Unknown", None
+        status_text = "Cancelled" if meta.get("job_state") == "cancelled" else "Finished"
+        return status_text, os.path.join(job_dir, max(zips))
+    if queue_state == "finished":
+        result_zip = os.path.basename(meta.get("result_zip") or "")
+        status_text = "Cancelled" if meta.get("job_state") == "cancelled" else "Finished"
+        return status_text, os.path.join(job_dir, result_zip) if result_zip else None
+    if queue_state == "failed":
+        return f"Error: {meta.get('queue_error') or meta.get('input_error') or 'job failed'}", None
+    if queue_state == "cancelled":
+        return "Cancelled", None
+    if queue_state == "queued":
+        return "Queued", None
+    control_request = read_job_control_request(job_dir)
+    if control_request == "cancel":
+        return "Cancelling", None
+    if control_request == "pause":
+        return "Paused", None
+    return "Running", None
+
 @app.route("/status/<job_id>")
 def status(job_id):
+    job_dir = os.path.join(app.config["UPLOAD_FOLDER"], job_id)
+    if os.path.isdir(job_dir):
+        touch_last_access(job_dir)
     if job_id not in jobs:
-        return f"Unknown job {job_id}", 404
+        meta = load_job_meta(job_id)
+        if meta is None:
+            return f"Unknown job {job_id}", 404
+        return render_stored_status(job_id, meta)
 
     future = jobs[job_id]
     meta = metas[job_id]
@@ -849,6 +528,7 @@ def status(job_id):
     submitted_at = meta.get("submitted_at", "unknown")
     completed_at = meta.get("completed_at", None)
     elapsed_time = meta.get("elapsed_time", None)
+    validation = meta.get("validation")
 
     source_route = meta.get("source_route")
     if not source_route and meta.get("group_by_subfolder"):
@@ -865,13 +545,23 @@ def status(job_id):
             return render_template(
                 "status.html",
                 job_id=job_id,
-                status="Finished",
+                status="Cancelled" if meta.get("job_state") == "cancelled" else "Finished",
                 model=model,
                 submitted_at=submitted_at,
                 completed_at=completed_at,
                 elapsed_time=elapsed_time,
                 result_url=url_for("download", job_id=job_id),
                 zip_filename=zip_filename,
+                validation=validation,
+                failed_groups=meta.get("failed_groups", 0),
+                invalid_groups=meta.get("invalid_groups", 0),
+                record_validation=meta.get("record_validation"),
+                structured_output_summary=meta.get("structured_output_summary"),
+                has_session_key=bool(meta.get("api_key")),
+                timing_summary=meta.get("timing_summary"),
+                has_cassette=os.path.isfile(
+                    os.path.join(app.config["UPLOAD_FOLDER"], job_id, CASSETTE_FILE)
+                ),
                 back_url=back_url,
                 back_label=back_label
             )
@@ -882,6 +572,7 @@ def status(job_id):
                 status=f"Error: {e}",
                 model=model,
                 submitted_at=submitted_at,
+                validation=validation,
                 back_url=back_url,
                 back_label=back_label
             )
@@ -889,27 +580,381 @@ def status(job_id):
         return render_template(
             "status.html",
             job_id=job_id,
-            status="Running",
+            status=running_job_status(job_id),
             model=model,
             submitted_at=submitted_at,
+            stream_responses=meta.get("stream_responses", False),
+            validation=validation,
             back_url=back_url,
             back_label=back_label
         )
 
+@app.route("/status/<job_id>/<action>", methods=["POST"])
+def control_job(job_id, action):
+    if action not in {"cancel", "pause", "resume"}:
+        return f"Unknown action {action}", 404
+    job_dir = os.path.join(app.config["UPLOAD_FOLDER"], job_id)
+    abort_in_flight = request.form.get("abort") == "1"
+
+    if job_id in jobs:
+        if not jobs[job_id].done():
+            if action == "cancel":
+                cancel_job(job_id, abort_in_flight=abort_in_flight)
+            elif action == "pause":
+                pause_job(job_id)
+            else:
+                resume_job(job_id)
+        return redirect(url_for("status", job_id=job_id))
+
+    meta = load_job_meta(job_id)
+    if meta is None or not meta.get("queue_state"):
+        return f"Unknown job {job_id}", 404
+    if action == "cancel" and meta["queue_state"] == "queued" and cancel_queued_job(job_id):
+        meta["queue_state"] = "cancelled"
+        meta["job_state"] = "cancelled"
+        persist_job_meta(job_dir, meta)
+    elif meta["queue_state"] == "running":
+        # The worker process polls this file while the job runs.
+        write_job_control_file(job_dir, action, abort_in_flight=abort_in_flight)
+    return redirect(url_for("status", job_id=job_id))
+
+@app.route("/retry/<job_id>", methods=["POST"])
+def retry_failed_groups(job_id):
+    job_dir = os.path.join(app.config["UPLOAD_FOLDER"], job_id)
+    if job_id in jobs and not jobs[job_id].done():
+        return redirect(url_for("status", job_id=job_id))
+    meta = load_job_meta(job_id)
+    if meta is None:
+        return f"Unknown job {job_id}", 404
+    if meta.get("queue_state") in {"queued", "running"}:
+        return redirect(url_for("status", job_id=job_id))
+
+    previous_rows = load_job_rows(job_dir)
+    if not previous_rows:
+        return "This job has no results to retry.", 400
+    if not any(row_needs_retry(row, meta) for row in previous_rows):
+        return redirect(url_for("status", job_id=job_id))
+    _, input_zip_path = resolve_job_input_zip(job_dir, meta)
+    if not input_zip_path:
+        return "The input ZIP of this job is no longer available.", 400
+
+    # meta.json never stores the key, so it comes from the form unless this
+    # process still holds the job that used it.
+    api_key = request.form.get("api_key", "").strip() or (metas.get(job_id) or {}).get("api_key", "")
+    if not api_key:
+        return "An API key is required to retry failed groups.", 400
+
+    previous_cost_summaries = meta.get("previous_cost_summaries") or []
+    if meta.get("cost_summary"):
+        previous_cost_summaries.append(meta["cost_summary"])
+    meta.update({
+        "api_key": api_key,
+        "input_source": "existing",
+        "selected_existing_zip": os.path.basename(input_zip_path),
+        "staging_upload_name": "",
+        "input_status": "pending",
+        "retry_failed_only": True,
+        "retry_count": int(meta.get("retry_count") or 0) + 1,
+        "retry_started_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "queued_at_ts": time.time(),
+        "previous_cost_summaries": previous_cost_summaries
+    })
+    for key in ("job_state", "cancelled_groups", "input_error", "queue_error", "result_zip", "completed_at"):
+        meta.pop(key, None)
+
+    if JOB_EXECUTION_MODE == "queue":
+        meta["queue_state"] = "queued"
+        persist_job_meta(job_dir, meta)
+        enqueue_job(job_id, api_key)
+        return redirect(url_for("status", job_id=job_id))
+
+    persist_job_meta(job_dir, meta)
+    jobs[job_id] = executor.submit(run_job_pipeline, job_id, meta)
+    metas[job_id] = meta
+    return redirect(url_for("status", job_id=job_id))
+
+@app.route("/replay/<job_id>", methods=["POST"])
+def replay_job(job_id):
+    job_dir = os.path.join(app.config["UPLOAD_FOLDER"], job_id)
+    if job_id in jobs and not jobs[job_id].done():
+        return redirect(url_for("status", job_id=job_id))
+    meta = load_job_meta(job_id)
+    if meta is None:
+        return f"Unknown job {job_id}", 404
+    if meta.get("queue_state") in {"queued", "running"}:
+        return redirect(url_for("status", job_id=job_id))
+    if not os.path.isfile(os.path.join(job_dir, CASSETTE_FILE)):
+        return "This job has no recorded responses to replay.", 400
+    _, input_zip_path = resolve_job_input_zip(job_dir, meta)
+    if not input_zip_path:
+        return "The input ZIP of this job is no longer available.", 400
+    try:
+        latency_scale = max(0.0, float(request.form.get("latency_scale", "0")))
+    except ValueError:
+        latency_scale = 0.0
+
+    # Replayed responses are served from the cassette, so no API key is sent.
+    meta.update({
+        "api_key": "",
+        "cassette_mode": "replay",
+        "replay_latency_scale": latency_scale,
+        "input_source": "existing",
+        "selected_existing_zip": os.path.basename(input_zip_path),
+        "staging_upload_name": "",
+        "input_status": "pending",
+        "retry_failed_only": False,
+        "retry_started_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "queued_at_ts": time.time()
+    })
+    for key in ("job_state", "cancelled_groups", "input_error", "queue_error", "result_zip", "completed_at"):
+        meta.pop(key, None)
+
+    if JOB_EXECUTION_MODE == "queue":
+        meta["queue_state"] = "queued"
+        persist_job_meta(job_dir, meta)
+        enqueue_job(job_id, "")
+        return redirect(url_for("status", job_id=job_id))
+
+    persist_job_meta(job_dir, meta)
+    jobs[job_id] = executor.submit(run_job_pipeline, job_id, meta)
+    metas[job_id] = meta
+    return redirect(url_for("status", job_id=job_id))
+
+def _upload_session_response(session, status_code=200):
+    return jsonify({
+        "upload_id": session["upload_id"],
+        "offset": session["offset"],
+        "size": session["size"],
+        "chunk_size": UPLOAD_CHUNK_BYTES,
+        "complete": session.get("complete", False),
+        "registering": session.get("registering", False),
+        "error": session.get("error", ""),
+        "zip_name": session.get("zip_name", ""),
+        "skipped_bytes": session.get("skipped_bytes", 0)
+    }), status_code
+
+def _register_upload_session(session):
+    upload_id = session["upload_id"]
+    part_path = upload_part_path(upload_id)
+    try:
+        if os.path.isfile(part_path):
+            entry, created = register_uploaded_zip(part_path, session["filename"], zip_sha256=session["sha256"])
+        else:
+            # The web process stopped after the part file had been moved
+            # into the registry but before the session was completed.
+            entry, created = find_registered_zip_sha256(session["sha256"]), False
+        if entry is None:
+            fail_upload_session(session, "The upload was interrupted. Please upload the ZIP again.")
+            return
+        metrics.inc("batch_zip_registry_lookups_total", source="chunked_upload", result="miss" if created else "hit")
+        complete_upload_session(session, entry["zip_name"])
+    except (zipfile.BadZipFile, OSError) as e:
+        fail_upload_session(session, f"Uploaded file is not a valid ZIP: {e}")
+    finally:
+        with upload_registrations_lock:
+            upload_registrations.discard(upload_id)
+
+def _start_upload_registration(session):
+    # Hashing the members of a multi-GB archive takes far longer than a
+    # request should, so it runs on its own thread while the client polls.
+    with upload_registrations_lock:
+        if session["upload_id"] in upload_registrations:
+            return
+        upload_registrations.add(session["upload_id"])
+    threading.Thread(target=_register_upload_session, args=(dict(session),), daemon=True).start()
+
+@app.route("/uploads", methods=["POST"])
+def start_upload():
+    payload = request.get_json(silent=True) or request.form
+    try:
+        size = int(payload.get("size", ""))
+    except (TypeError, ValueError):
+        return jsonify({"error": "size is required"}), 400
+    if size <= 0:
+        return jsonify({"error": "size must be positive"}), 400
+    source_route = "marc" if payload.get("source_route") == "marc" else "index"
+    declared_sha256 = str(payload.get("sha256", "") or "").strip().lower()
+    session = create_upload_session(
+        _uploaded_zip_name(payload.get("filename", ""), source_route),
+        size,
+        sha256=declared_sha256,
+        source_route=source_route
+    )
+    # A client that already knows the file's hash skips uploading a ZIP the
+    # registry already holds.
+    if declared_sha256:
+        existing_entry = find_registered_zip_sha256(declared_sha256)
+        if existing_entry and int(existing_entry.get("size_bytes") or 0) == size:
+            metrics.inc("batch_zip_registry_lookups_total", source="chunked_upload", result="hit")
+            complete_upload_session(session, existing_entry["zip_name"], skipped_bytes=size)
+    return _upload_session_response(session, 201)
+
+@app.route("/uploads/<upload_id>", methods=["GET"])
+def upload_status(upload_id):
+    session = load_upload_session(upload_id)
+    if session is None:
+        return jsonify({"error": "No such upload"}), 404
+    if session.get("registering") and not session.get("error"):
+        # Picks a registration back up after a restart of the web process.
+        _start_upload_registration(session)
+    return _upload_session_response(session)
+
+@app.route("/uploads/<upload_id>", methods=["PUT"])
+def upload_chunk(upload_id):
+    session = load_upload_session(upload_id)
+    if session is None:
+        return jsonify({"error": "No such upload"}), 404
+    try:
+        offset = int(request.args.get("offset", ""))
+    except ValueError:
+        return jsonify({"error": "offset is required"}), 400
+    if session.get("error"):
+        return jsonify({"error": session["error"]}), 422
+    try:
+        zip_sha256 = append_upload_chunk(session, offset, request.stream)
+    except UploadOffsetMismatch as e:
+        # The client resumes from the offset the server actually has.
+        return jsonify({"error": str(e), "offset": e.offset}), 409
+    if zip_sha256 is None:
+        return _upload_session_response(session)
+
+    if session["declared_sha256"] and session["declared_sha256"] != zip_sha256:
+        discard_upload_session(session["upload_id"])
+        return jsonify({"error": "Uploaded bytes do not match the declared SHA-256."}), 422
+    session["sha256"] = zip_sha256
+    # A byte-identical ZIP is found from the running hash alone.
+    existing_entry = find_registered_zip_sha256(zip_sha256)
+    if existing_entry:
+        metrics.inc("batch_zip_registry_lookups_total", source="chunked_upload", result="hit")
+        complete_upload_session(session, existing_entry["zip_name"])
+        return _upload_session_response(session)
+    mark_upload_registering(session, zip_sha256)
+    response = _upload_session_response(session, 202)
+    _start_upload_registration(session)
+    return response
+
+@app.route("/uploads/<upload_id>", methods=["DELETE"])
+def cancel_upload(upload_id):
+    session = load_upload_session(upload_id)
+    if session is None:
+        return jsonify({"error": "No such upload"}), 404
+    discard_upload_session(session["upload_id"])
+    return jsonify({"upload_id": session["upload_id"], "discarded": True})
+
+def render_stored_status(job_id, meta):
+    status_text, result_path = stored_job_status(job_id, meta)
+    is_marc = meta.get("source_route") == "marc"
+    return render_template(
+        "status.html",
+        job_id=job_id,
+        status=status_text,
+        model=meta.get("model", "unknown"),
+        submitted_at=meta.get("submitted_at", "unknown"),
+        completed_at=meta.get("completed_at"),
+        elapsed_time=meta.get("elapsed_time"),
+        result_url=url_for("download", job_id=job_id) if result_path else None,
+        zip_filename=os.path.basename(result_path) if result_path else None,
+        validation=meta.get("validation"),
+        failed_groups=meta.get("failed_groups", 0) if result_path else 0,
+        invalid_groups=meta.get("invalid_groups", 0) if result_path else 0,
+        record_validation=meta.get("record_validation") if result_path else None,
+        structured_output_summary=meta.get("structured_output_summary") if result_path else None,
+        timing_summary=meta.get("timing_summary") if result_path else None,
+        has_cassette=bool(result_path) and os.path.isfile(
+            os.path.join(app.config["UPLOAD_FOLDER"], job_id, CASSETTE_FILE)
+        ),
+        back_url=url_for("marc") if is_marc else url_for("index"),
+        back_label="Back to MARC" if is_marc else "Back to home"
+    )
+
+def latest_results_zip(job_id):
+    job_dir = os.path.join(app.config["UPLOAD_FOLDER"], job_id)
+    if not os.path.isdir(job_dir):
+        return None
+    zips = [f for f in os.listdir(job_dir) if f.startswith("results_") and f.endswith(".zip")]
+    return os.path.join(job_dir, max(zips)) if zips else None
+
 @app.route("/download/<job_id>")
 def download(job_id):
     job_dir = os.path.join(app.config["UPLOAD_FOLDER"], job_id)
     if not os.path.exists(job_dir):
         return f"Job {job_id} not found", 404
+    touch_last_access(job_dir)
+
+    # A job that is still running has no results ZIP yet; its finished rows
+    # are packaged on the fly instead. Once it ends the full ZIP is served.
+    if request.args.get("partial") == "1" and os.path.isfile(os.path.join(job_dir, PARTIAL_ROWS_FILE)):
+        meta = load_job_meta(job_id)
+        if meta is not None:
+            filename = f"results_partial_{datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}.zip"
+            return Response(
+                iter_partial_results_zip(job_dir, meta),
+                mimetype="application/zip",
+                headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+            )
 
-    zips = [f for f in os.listdir(job_dir) if f.startswith("results_") and f.endswith(".zip")]
-    if not zips:
+    zip_path = latest_results_zip(job_id)
+    if not zip_path:
         return f"No results for job {job_id}", 404
-
-    latest_zip = max(zips)
-    zip_path = os.path.join(job_dir, latest_zip)
     return send_file(zip_path, as_attachment=True)
 
+def _int_arg(name, default):
+    try:
+        return int(request.args.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+@app.route("/results/<job_id>")
+def results_members(job_id):
+    zip_path = latest_results_zip(job_id)
+    if not zip_path:
+        return jsonify({"error": f"No results for job {job_id}"}), 404
+    touch_last_access(os.path.dirname(zip_path))
+    listing = list_results_members(
+        zip_path,
+        offset=_int_arg("offset", 0),
+        limit=_int_arg("limit", 100),
+        prefix=request.args.get("prefix", "")
+    )
+    listing["zip_filename"] = os.path.basename(zip_path)
+    return jsonify(listing)
+
+@app.route("/results/<job_id>/member")
+def results_member(job_id):
+    zip_path = latest_results_zip(job_id)
+    if not zip_path:
+        return jsonify({"error": f"No results for job {job_id}"}), 404
+    touch_last_access(os.path.dirname(zip_path))
+    name = request.args.get("name", "")
+    info = results_member_info(zip_path, name)
+    if info is None or info.is_dir():
+        return jsonify({"error": f"No member {name} in {os.path.basename(zip_path)}"}), 404
+    mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if mimetype.startswith("text/") or mimetype == "application/json":
+        mimetype = f"{mimetype}; charset=utf-8"
+    return Response(
+        iter_results_member(zip_path, name),
+        mimetype=mimetype,
+        headers={"Content-Length": str(info.file_size)}
+    )
+
+@app.route("/results/<job_id>/rows")
+def results_rows(job_id):
+    zip_path = latest_results_zip(job_id)
+    if not zip_path:
+        return jsonify({"error": f"No results for job {job_id}"}), 404
+    touch_last_access(os.path.dirname(zip_path))
+    name = request.args.get("name", "output.csv")
+    if results_member_info(zip_path, name) is None:
+        return jsonify({"error": f"No member {name} in {os.path.basename(zip_path)}"}), 404
+    start = _int_arg("start", 0)
+    try:
+        rows = read_results_rows(zip_path, name, start=start, stop=_int_arg("stop", start + 100))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    rows["name"] = name
+    return jsonify(rows)
+
 @app.route("/download-inputs/<job_id>")
 def download_inputs(job_id):
     job_dir = os.path.join(app.config["UPLOAD_FOLDER"], job_id)
@@ -935,6 +980,234 @@ def download_inputs(job_id):
 
     return send_file(input_zip_path, as_attachment=True)
 
+@app.route("/search")
+def search():
+    field = request.args.get("field") or None
+    if field is not None and field not in SEARCH_FIELDS:
+        return jsonify({"error": f"field must be one of {', '.join(SEARCH_FIELDS)}"}), 400
+    results = search_outputs(
+        request.args.get("q", ""),
+        field=field,
+        limit=_int_arg("limit", 20),
+        offset=_int_arg("offset", 0)
+    )
+    for result in results["results"]:
+        result["status_url"] = url_for("status", job_id=result["job_id"])
+    return jsonify(results)
+
+@app.route("/search/backfill", methods=["POST"])
+def search_backfill():
+    # Jobs whose latest results ZIP is already indexed are skipped; large
+    # archives are better backfilled with `python search_index.py backfill`.
+    return jsonify(backfill_search_index(app.config["UPLOAD_FOLDER"], force=request.args.get("force") == "1"))
+
+def _job_is_active(job_id, meta):
+    future = jobs.get(job_id)
+    if future is not None and not future.done():
+        return True
+    return (meta or {}).get("queue_state") in ("queued", "running")
+
+def _retention_references():
+    # Job ids that must stay, and the registry ZIPs their inputs come from.
+    active_job_ids = set()
+    zip_names = pending_upload_zip_names()
+    jobs_folder = app.config["UPLOAD_FOLDER"]
+    job_ids = set(jobs)
+    if os.path.isdir(jobs_folder):
+        job_ids.update(name for name in os.listdir(jobs_folder) if name != TRASH_DIR_NAME)
+    for job_id in job_ids:
+        meta = metas.get(job_id) or load_job_meta(job_id)
+        if not _job_is_active(job_id, meta):
+            continue
+        active_job_ids.add(job_id)
+        for key in ("input_zip_name", "selected_existing_zip"):
+            zip_name = os.path.basename(((meta or {}).get(key) or "").strip())
+            if zip_name:
+                zip_names.add(zip_name)
+    return active_job_ids, zip_names
+
+def _evict_job(job_id):
+    # Checked again right before removal: the job may have been resubmitted
+    # since the plan was made.
+    if _job_is_active(job_id, metas.get(job_id) or load_job_meta(job_id)):
+        return False
+    if os.path.exists(JOB_QUEUE_PATH) and not forget_job(job_id):
+        return False
+    remove_job_directory(app.config["UPLOAD_FOLDER"], job_id)
+    forget_job_outputs(job_id)
+    jobs.pop(job_id, None)
+    metas.pop(job_id, None)
+    return True
+
+def run_retention(dry_run=True):
+    with retention_lock:
+        now = time.time()
+        jobs_folder = app.config["UPLOAD_FOLDER"]
+        zips_folder = app.config["EXISTING_ZIPS_FOLDER"]
+        active_job_ids, referenced_zips = _retention_references()
+        with zip_registry_lock:
+            registry_entries = list(load_zip_registry_unlocked().get("entries", []))
+
+        job_plan, jobs_left = plan_evictions(
+            scan_jobs(jobs_folder),
+            active_job_ids,
+            max_age_days=RETENTION_JOB_MAX_AGE_DAYS,
+            max_count=RETENTION_JOB_MAX_COUNT,
+            max_bytes=RETENTION_JOB_MAX_BYTES,
+            grace_seconds=RETENTION_GRACE_SECONDS,
+            now=now
+        )
+        zip_plan, zips_left = plan_evictions(
+            scan_zips(zips_folder, registry_entries),
+            referenced_zips,
+            max_age_days=RETENTION_ZIP_MAX_AGE_DAYS,
+            max_count=RETENTION_ZIP_MAX_COUNT,
+            max_bytes=RETENTION_ZIP_MAX_BYTES,
+            grace_seconds=RETENTION_GRACE_SECONDS,
+            now=now
+        )
+
+        if not dry_run:
+            empty_trash(jobs_folder)
+            evicted_jobs = []
+            for entry in job_plan:
+                try:
+                    if _evict_job(entry["name"]):
+                        evicted_jobs.append(entry)
+                except OSError as e:
+                    app.logger.warning("Retention could not remove job %s: %s", entry["name"], e)
+            job_plan = evicted_jobs
+
+            # The registry entry goes before the file, and both under the
+            # registry lock, so a registration never matches a ZIP that is
+            # being deleted.
+            with zip_registry_lock:
+                _, referenced_zips = _retention_references()
+                zip_plan = [entry for entry in zip_plan if entry["name"] not in referenced_zips]
+                evicted_names = {entry["name"] for entry in zip_plan}
+                registry = load_zip_registry_unlocked()
+                registry["entries"] = [
+                    entry for entry in registry.get("entries", [])
+                    if entry.get("zip_name") not in evicted_names
+                ]
+                save_zip_registry_unlocked(registry)
+                for entry in zip_plan:
+                    try:
+                        os.remove(os.path.join(zips_folder, entry["name"]))
+                    except FileNotFoundError:
+                        pass
+            refresh_listings(zips_folder)
+
+            for kind, plan in (("job", job_plan), ("zip", zip_plan)):
+                if plan:
+                    metrics.inc("batch_retention_evictions_total", len(plan), kind=kind)
+                    metrics.inc("batch_retention_freed_bytes_total", sum(entry["bytes"] for entry in plan), kind=kind)
+
+        def describe(plan, left, limits):
+            return {
+                "limits": limits,
+                "evict": [
+                    {
+                        "name": entry["name"],
+                        "bytes": entry["bytes"],
+                        "size_label": format_file_size(entry["bytes"]),
+                        "last_access": datetime.fromtimestamp(entry["last_access"]).strftime("%Y-%m-%d %H:%M:%S"),
+                        "reason": entry["reason"]
+                    }
+                    for entry in plan
+                ],
+                "freed_bytes": sum(entry["bytes"] for entry in plan),
+                "remaining": left
+            }
+
+        report = {
+            "dry_run": dry_run,
+            "generated_at": datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S"),
+            "protected_jobs": sorted(active_job_ids),
+            "jobs": describe(job_plan, jobs_left, {
+                "max_age_days": RETENTION_JOB_MAX_AGE_DAYS,
+                "max_count": RETENTION_JOB_MAX_COUNT,
+                "max_bytes": RETENTION_JOB_MAX_BYTES
+            }),
+            "zips": describe(zip_plan, zips_left, {
+                "max_age_days": RETENTION_ZIP_MAX_AGE_DAYS,
+                "max_count": RETENTION_ZIP_MAX_COUNT,
+                "max_bytes": RETENTION_ZIP_MAX_BYTES
+            })
+        }
+        if not dry_run:
+            retention_state["last_report"] = report
+        return report
+
+def _retention_loop():
+    while True:
+        time.sleep(RETENTION_INTERVAL_SECONDS)
+        try:
+            run_retention(dry_run=False)
+        except Exception:
+            app.logger.exception("Retention run failed")
+
+@app.before_request
+def start_retention_thread():
+    # Started on the first request rather than at import, so the reloader's
+    # parent process and scripts importing this module do not collect.
+    if RETENTION_INTERVAL_SECONDS <= 0 or retention_state["thread"] is not None:
+        return
+    with retention_thread_lock:
+        if retention_state["thread"] is None:
+            retention_state["thread"] = threading.Thread(target=_retention_loop, daemon=True)
+            retention_state["thread"].start()
+
+@app.route("/retention", methods=["GET", "POST"])
+def retention():
+    # GET reports what a collection would remove; POST removes it.
+    report = run_retention(dry_run=request.method == "GET")
+    if request.method == "GET":
+        report["last_run"] = retention_state["last_report"]
+    return jsonify(report)
+
+def collect_runtime_metrics():
+    futures = list(jobs.values())
+    running_jobs = sum(1 for future in futures if future.running())
+    queued_jobs = sum(1 for future in futures if not future.done() and not future.running())
+    dispatch = scheduler.snapshot()
+    health = model_health_snapshot()
+    return [
+        ("batch_executor_jobs", "gauge", "Jobs held by this web process's executor, by state.", [
+            ({"state": "running"}, running_jobs),
+            ({"state": "queued"}, queued_jobs)
+        ]),
+        ("batch_dispatch_requests", "gauge", "Requests in the global dispatch scheduler, by state.", [
+            ({"state": "running"}, dispatch["running"]),
+            ({"state": "queued"}, dispatch["queued"])
+        ]),
+        ("batch_dispatch_capacity", "gauge", "Maximum concurrent OpenRouter requests.", [
+            ({}, dispatch["max_concurrency"])
+        ]),
+        ("batch_dispatch_jobs", "gauge", "Jobs registered with the dispatch scheduler.", [
+            ({}, len(dispatch["jobs"]))
+        ]),
+        ("openrouter_inflight_requests", "gauge", "Distinct OpenRouter requests in flight.", [
+            ({}, inflight_request_count())
+        ]),
+        ("openrouter_model_health_score", "gauge", "Model health score from recent errors and latency.", [
+            ({"model": model}, stats["score"]) for model, stats in health.items() if stats["score"] is not None
+        ])
+    ]
+
+metrics.register_collector(collect_runtime_metrics)
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return app.response_class(metrics.render_metrics(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/trace/<job_id>")
+def download_trace(job_id):
+    trace_path = os.path.join(app.config["UPLOAD_FOLDER"], job_id, CHROME_TRACE_FILE)
+    if not os.path.isfile(trace_path):
+        return f"No trace for job {job_id}", 404
+    return send_file(trace_path, as_attachment=True, download_name=f"trace_{job_id}.json")
+
 @app.route("/progress/<job_id>")
 def progress(job_id):
     job_dir = os.path.join(app.config["UPLOAD_FOLDER"], job_id)
@@ -945,7 +1218,17 @@ def progress(job_id):
         meta = json.load(f)
     total = meta.get("total_files", 0)
     done = meta.get("processed_files", 0)
-    return jsonify({"processed": done, "total": total})
+    return jsonify({"processed": done, "total": total, "scheduler": scheduler.job_snapshot(job_id)})
+
+@app.route("/partial/<job_id>")
+def partial_outputs(job_id):
+    if job_id not in metas:
+        return jsonify({"error": "No such job"}), 404
+    meta = metas[job_id]
+    return jsonify({
+        "in_flight": get_live_partials(job_id),
+        "stream_stats": meta.get("stream_stats")
+    })
 
 @app.route("/jobs")
 def jobs_archive():
@@ -969,7 +1252,7 @@ def jobs_archive():
     if os.path.exists(app.config["UPLOAD_FOLDER"]):
         for job_id in os.listdir(app.config["UPLOAD_FOLDER"]):
             job_dir = os.path.join(app.config["UPLOAD_FOLDER"], job_id)
-            if not os.path.isdir(job_dir):
+            if job_id == TRASH_DIR_NAME or not os.path.isdir(job_dir):
                 continue
 
             meta = {}
@@ -992,8 +1275,14 @@ def jobs_archive():
                 future = jobs[job_id]
                 if future.done():
                     status_text = "Failed" if future.exception() else "Finished"
+                    if status_text == "Finished" and meta.get("job_state") == "cancelled":
+                        status_text = "Cancelled"
                 else:
-                    status_text = "Running"
+                    status_text = running_job_status(job_id)
+            elif meta.get("queue_state"):
+                status_text, _ = stored_job_status(job_id, meta)
+                if status_text.startswith("Error"):
+                    status_text = "Failed"
             else:
                 if meta.get("completed_at") or zip_filename:
                     status_text = "Finished"
@@ -1025,13 +1314,16 @@ def jobs_archive():
                 "zip_filename": zip_filename,
                 "elapsed_time": meta.get("elapsed_time", ""),
                 "download_url": url_for("download", job_id=job_id)
-                if zip_filename and status_text == "Finished"
+                if zip_filename and status_text in {"Finished", "Cancelled"}
                 else None,
                 "input_download_url": url_for("download_inputs", job_id=job_id)
                 if input_zip_path
                 else None,
                 "input_zip_name": input_zip_name,
                 "input_zip_hash": meta.get("input_zip_hash", ""),
+                "failed_groups": meta.get("failed_groups", 0) + meta.get("invalid_groups", 0)
+                if status_text in {"Finished", "Cancelled"}
+                else 0,
                 "mtime": os.path.getmtime(job_dir)
             })
 
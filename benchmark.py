@@ -0,0 +1,312 @@
+import os, io, sys, json, time, uuid, zlib, struct, random, zipfile, argparse, resource, tempfile, shutil, statistics, subprocess
+from concurrent.futures import ThreadPoolExecutor
+from mock_openrouter import start_mock_server
+
+# End-to-end throughput benchmark against mock_openrouter.py. The mock is
+# started first and OPENROUTER_URL / BATCH_DATA_DIR are set before app and
+# worker are imported, so no real API calls are made and nothing is written
+# to the real data/ directory.
+
+SCENARIOS = {
+    "text-small": {"kind": "text", "files": 50, "size": 2 * 1024},
+    "text-large": {"kind": "text", "files": 20, "size": 200 * 1024},
+    "images": {"kind": "image", "files": 20, "size": 256},
+    "folders": {"kind": "folder", "files": 10, "size": 8 * 1024},
+}
+# Modules a web or worker process imports at start, and dependencies that
+# must not be pulled in by just importing them.
+STARTUP_MODULES = ["app", "worker", "worker_daemon"]
+HEAVY_MODULES = ["pandas", "numpy"]
+STARTUP_PROBE = """
+import sys, time, json, resource
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    "import_seconds": elapsed,
+    "rss_mb": peak / (1024 * 1024 if sys.platform == "darwin" else 1024),
+    "heavy_modules": [name for name in {heavy!r} if name in sys.modules]
+}}))
+"""
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore".split()
+
+def _text(rng, size):
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+def _png(rng, side):
+    # Noise keeps the image from compressing away, so byte sizes stay realistic.
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+    rows = b"".join(b"\x00" + rng.randbytes(side * 3) for _ in range(side))
+    header = struct.pack(">IIBBBBB", side, side, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+def build_zip(kind, files, size, seed=0):
+    rng = random.Random(seed)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for idx in range(files):
+            if kind == "text":
+                zf.writestr(f"doc_{idx:04d}.txt", _text(rng, size))
+            elif kind == "image":
+                zf.writestr(f"page_{idx:04d}.png", _png(rng, size))
+            else:
+                for page in range(3):
+                    zf.writestr(f"folder_{idx:04d}/part_{page}.txt", _text(rng, size))
+    return buf.getvalue()
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _run_direct(worker, upload_folder, zip_bytes, options):
+    job_id = str(uuid.uuid4())
+    job_dir = os.path.join(upload_folder, job_id)
+    input_dir = os.path.join(job_dir, "input")
+    os.makedirs(input_dir)
+    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
+        zf.extractall(input_dir)
+    meta = {
+        "api_key": "benchmark",
+        "system_prompt": "Summarize the input.",
+        "model": options["model"],
+        "stream_responses": options["stream"],
+        "group_by_subfolder": True,
+        "output_formats": ["csv"],
+        "source_route": "index",
+        "submitted_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    worker.process_job(job_id, meta)
+    return meta
+
+def _run_route(app_module, zip_bytes, options):
+    client = app_module.app.test_client()
+    form = {
+        "api_key": "benchmark",
+        "system_prompt": "Summarize the input.",
+        "model_custom": options["model"],
+        "output_formats": "csv",
+        "zipfile": (io.BytesIO(zip_bytes), "benchmark.zip"),
+    }
+    if options["stream"]:
+        form["stream_responses"] = "on"
+    response = client.post("/", data=form, content_type="multipart/form-data")
+    if response.status_code != 302:
+        raise RuntimeError(f"Submission failed with HTTP {response.status_code}")
+    job_id = response.headers["Location"].rstrip("/").rsplit("/", 1)[1]
+    future = app_module.jobs[job_id]
+    while not future.done():
+        progress = client.get(f"/progress/{job_id}")
+        if progress.status_code >= 500:
+            raise RuntimeError(f"/progress/{job_id} failed with HTTP {progress.status_code}")
+        time.sleep(0.2)
+    future.result()
+    return app_module.metas[job_id]
+
+def run_scenario(name, spec, mode, options, mock_state, modules):
+    zip_bytes = build_zip(spec["kind"], spec["files"], spec["size"], seed=options["seed"])
+    requests_before = mock_state.stats["requests"]
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+        if mode == "direct":
+            futures = [
+                pool.submit(_run_direct, modules["worker"], modules["upload_folder"], zip_bytes, options)
+                for _ in range(options["jobs"])
+            ]
+        else:
+            futures = [pool.submit(_run_route, modules["app"], zip_bytes, options) for _ in range(options["jobs"])]
+        metas = [future.result() for future in futures]
+    wall = time.time() - started
+    requests_sent = mock_state.stats["requests"] - requests_before
+
+    stage_totals = {}
+    for meta in metas:
+        for stage, stats in (meta.get("timing_summary") or {}).get("stage", {}).items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + stats["total"]
+    return {
+        "scenario": name,
+        "mode": mode,
+        "jobs": len(metas),
+        "zip_bytes": len(zip_bytes),
+        "groups_per_job": metas[0].get("total_files", 0) if metas else 0,
+        "failed_groups": sum(meta.get("failed_groups", 0) for meta in metas),
+        "wall_seconds": round(wall, 3),
+        "jobs_per_hour": round(len(metas) * 3600 / wall, 1) if wall else 0,
+        "requests_per_second": round(requests_sent / wall, 2) if wall else 0,
+        "peak_rss_mb": _peak_rss_mb(),
+        "stage_seconds_per_job": {
+            stage: round(total / len(metas), 3) for stage, total in sorted(stage_totals.items())
+        },
+    }
+
+def _print_result(result):
+    print(
+        f"{result['scenario']:<11} {result['mode']:<6} jobs={result['jobs']} groups/job={result['groups_per_job']} "
+        f"failed={result['failed_groups']} wall={result['wall_seconds']}s "
+        f"jobs/h={result['jobs_per_hour']} req/s={result['requests_per_second']} "
+        f"peak_rss={result['peak_rss_mb']}MB"
+    )
+    stages = ", ".join(f"{stage}={seconds}s" for stage, seconds in result["stage_seconds_per_job"].items())
+    print(f"{'':<11} stages/job: {stages}")
+
+def _slowest_imports(stderr, limit):
+    # -X importtime lines: "import time: self [us] | cumulative | imported package"
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = [part.strip() for part in line[len("import time:"):].split("|")]
+        if len(parts) == 3 and parts[1].isdigit():
+            timings.append((int(parts[1]), parts[2].strip()))
+    timings.sort(reverse=True)
+    return [{"module": name, "cumulative_seconds": round(micros / 1e6, 3)} for micros, name in timings[:limit]]
+
+def run_startup(module, runs):
+    # Each run is a fresh interpreter, so nothing is already imported. The
+    # last run also records -X importtime to show where the time goes.
+    data_dir = tempfile.mkdtemp(prefix="batch_startup_")
+    env = dict(os.environ, BATCH_DATA_DIR=data_dir, PYTHONDONTWRITEBYTECODE="")
+    probe = STARTUP_PROBE.format(module=module, heavy=HEAVY_MODULES)
+    samples = []
+    stderr = ""
+    try:
+        for run in range(runs):
+            command = [sys.executable] + (["-X", "importtime"] if run == runs - 1 else []) + ["-c", probe]
+            started = time.perf_counter()
+            completed = subprocess.run(
+                command,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True
+            )
+            sample = json.loads(completed.stdout.strip().splitlines()[-1])
+            sample["process_seconds"] = time.perf_counter() - started
+            samples.append(sample)
+            stderr = completed.stderr
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    # The -X importtime run is slower, so it is left out of the timings
+    # unless it is the only run.
+    timed = samples[:-1] or samples
+    return {
+        "module": module,
+        "runs": runs,
+        "import_seconds": round(statistics.median(s["import_seconds"] for s in timed), 3),
+        "process_seconds": round(statistics.median(s["process_seconds"] for s in timed), 3),
+        "rss_mb": round(statistics.median(s["rss_mb"] for s in timed), 1),
+        "heavy_modules": samples[-1]["heavy_modules"],
+        "slowest_imports": _slowest_imports(stderr, 8)
+    }
+
+def _print_startup(result):
+    heavy = ", ".join(result["heavy_modules"]) or "none"
+    print(
+        f"{result['module']:<14} import={result['import_seconds']}s process={result['process_seconds']}s "
+        f"rss={result['rss_mb']}MB heavy={heavy}"
+    )
+    slowest = ", ".join(f"{row['module']}={row['cumulative_seconds']}s" for row in result["slowest_imports"])
+    print(f"{'':<14} slowest: {slowest}")
+
+def startup_main(args):
+    results = [run_startup(module, max(1, args.runs)) for module in args.module or STARTUP_MODULES]
+    for result in results:
+        _print_startup(result)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"startup": results}, f, indent=2)
+    # Non-zero exit when a budget is exceeded, so the check can gate a build.
+    failures = []
+    for result in results:
+        if result["heavy_modules"]:
+            failures.append(f"{result['module']} imports {', '.join(result['heavy_modules'])}")
+        if args.max_import_seconds and result["import_seconds"] > args.max_import_seconds:
+            failures.append(f"{result['module']} took {result['import_seconds']}s to import")
+        if args.max_rss_mb and result["rss_mb"] > args.max_rss_mb:
+            failures.append(f"{result['module']} started at {result['rss_mb']}MB RSS")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the batch pipeline against a local OpenRouter mock.")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="defaults to all scenarios")
+    parser.add_argument("--mode", choices=["direct", "routes", "both"], default="both",
+                        help="call process_job directly, submit through the Flask routes, or both")
+    parser.add_argument("--jobs", type=int, default=4, help="jobs per scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="jobs submitted at once")
+    parser.add_argument("--model", default="mock/benchmark")
+    parser.add_argument("--stream", action="store_true", help="request streamed responses")
+    parser.add_argument("--latency", default="lognormal:0.3,0.5")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--max-concurrent-requests", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    parser.add_argument("--keep-data", action="store_true", help="keep the temporary data directory")
+    parser.add_argument("--startup", action="store_true",
+                        help="measure import time and baseline RSS of fresh processes instead of throughput")
+    parser.add_argument("--module", action="append", choices=STARTUP_MODULES, help="with --startup; defaults to all")
+    parser.add_argument("--runs", type=int, default=5, help="with --startup: fresh processes per module")
+    parser.add_argument("--max-import-seconds", type=float, default=0.0, help="with --startup: fail above this")
+    parser.add_argument("--max-rss-mb", type=float, default=0.0, help="with --startup: fail above this")
+    args = parser.parse_args()
+    if args.startup:
+        sys.exit(startup_main(args))
+
+    server, mock_state, url = start_mock_server(
+        latency=args.latency,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        tokens_per_second=args.tokens_per_second,
+        seed=args.seed
+    )
+    data_dir = tempfile.mkdtemp(prefix="batch_benchmark_")
+    os.environ["OPENROUTER_URL"] = url
+    os.environ["BATCH_DATA_DIR"] = data_dir
+    os.environ["JOB_EXECUTION_MODE"] = "inline"
+    if args.max_concurrent_requests:
+        os.environ["MAX_CONCURRENT_REQUESTS"] = str(args.max_concurrent_requests)
+
+    import app as app_module
+    import worker
+    from config import UPLOAD_FOLDER
+    modules = {"app": app_module, "worker": worker, "upload_folder": UPLOAD_FOLDER}
+    options = {
+        "jobs": max(1, args.jobs),
+        "concurrency": max(1, args.concurrency),
+        "model": args.model,
+        "stream": args.stream,
+        "seed": args.seed,
+    }
+    modes = ["direct", "routes"] if args.mode == "both" else [args.mode]
+
+    print(f"Mock OpenRouter at {url}, data in {data_dir}")
+    results = []
+    try:
+        for name in args.scenario or list(SCENARIOS):
+            for mode in modes:
+                result = run_scenario(name, SCENARIOS[name], mode, options, mock_state, modules)
+                results.append(result)
+                _print_result(result)
+    finally:
+        server.shutdown()
+        if not args.keep_data:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"mock": mock_state.stats, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import os, gzip, json, time, threading
+import requests
+import metrics
+from openrouter_client import request_fingerprint, classify_failure, RequestCancelled, ReplayMiss
+
+CASSETTE_FILE = "cassette.jsonl.gz"
+CASSETTE_MODES = {"off", "record", "replay"}
+REPLAY_POLL_INTERVAL = 0.1
+_RESULT_FIELDS = ("reply", "usage", "model", "latency", "streamed", "ttfb", "ttft", "tokens_per_second", "hedged", "hedge_won")
+
+class Cassette:
+    # Entries are appended to a gzip file as one member per write, so a
+    # recording survives a crashed job and gzip still reads it as one stream.
+    # Payloads are not stored (they carry the inputs); entries are keyed by
+    # request_fingerprint of the payload instead.
+
+    def __init__(self, path, mode, latency_scale=1.0):
+        self.path = path
+        self.mode = mode
+        self.latency_scale = max(0.0, float(latency_scale))
+        self._lock = threading.Lock()
+        self._entries = None
+        self._positions = {}
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def _append(self, entry):
+        with self._lock:
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        metrics.inc("openrouter_cassette_total", mode="record", result="error" if "error" in entry else "ok")
+
+    def record(self, payload, result):
+        entry = {"fingerprint": request_fingerprint(payload), "recorded_at": round(time.time(), 3)}
+        entry.update({field: result.get(field) for field in _RESULT_FIELDS})
+        self._append(entry)
+
+    def record_error(self, payload, error):
+        failure = classify_failure(error)
+        if failure == "cancelled":
+            return
+        response = getattr(error, "response", None)
+        self._append({
+            "fingerprint": request_fingerprint(payload),
+            "recorded_at": round(time.time(), 3),
+            "model": payload.get("model", ""),
+            "error": failure,
+            "status": response.status_code if response is not None else None,
+            "message": str(error)
+        })
+
+    def _load(self):
+        entries = {}
+        if os.path.isfile(self.path):
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A job killed mid-write leaves a truncated last line.
+                        continue
+                    entries.setdefault(entry["fingerprint"], []).append(entry)
+        return entries
+
+    def _next_entry(self, fingerprint):
+        # Identical requests were recorded once per send, so they replay in
+        # the same order; the last recording repeats once they run out.
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            recorded = self._entries.get(fingerprint)
+            if not recorded:
+                return None
+            position = self._positions.get(fingerprint, 0)
+            self._positions[fingerprint] = position + 1
+            return recorded[min(position, len(recorded) - 1)]
+
+    def replay(self, payload, abort_event=None):
+        entry = self._next_entry(request_fingerprint(payload))
+        if entry is None:
+            metrics.inc("openrouter_cassette_total", mode="replay", result="miss")
+            raise ReplayMiss("No recorded response for this request")
+        metrics.inc("openrouter_cassette_total", mode="replay", result="hit")
+
+        deadline = time.monotonic() + (entry.get("latency") or 0) * self.latency_scale
+        while time.monotonic() < deadline:
+            if abort_event is not None and abort_event.is_set():
+                raise RequestCancelled("Request cancelled")
+            time.sleep(min(REPLAY_POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+
+        if "error" in entry:
+            raise _replayed_error(entry)
+        result = {field: entry.get(field) for field in _RESULT_FIELDS}
+        result.update({
+            "timeout": None,
+            "coalesced": False,
+            "shared_with": 0,
+            "replayed": True
+        })
+        result["usage"] = result["usage"] or {}
+        return result
+
+def _replayed_error(entry):
+    message = entry.get("message") or entry["error"]
+    if entry.get("status"):
+        response = requests.Response()
+        response.status_code = entry["status"]
+        return requests.HTTPError(message, response=response)
+    if entry["error"] == "timeout":
+        return requests.Timeout(message)
+    if entry["error"] == "connection_error":
+        return requests.ConnectionError(message)
+    if entry["error"] == "invalid_response":
+        return ValueError(message)
+    return RuntimeError(message)
+
+def open_job_cassette(job_dir, meta):
+    mode = str(meta.get("cassette_mode") or "off").strip().lower()
+    if mode not in CASSETTE_MODES or mode == "off":
+        return None
+    path = os.path.join(job_dir, CASSETTE_FILE)
+    if mode == "record" and os.path.exists(path) and not meta.get("retry_failed_only"):
+        # A fresh full run replaces the previous recording; a retry adds to it.
+        os.remove(path)
+    return Cassette(path, mode, latency_scale=meta.get("replay_latency_scale", 1.0))
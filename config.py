@@ -1,8 +1,54 @@
 import os
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-UPLOAD_FOLDER = os.path.join(BASE_DIR, "data", "jobs")
-INPUT_ZIPS_FOLDER = os.path.join(BASE_DIR, "data", "zips")
+DATA_DIR = os.environ.get("BATCH_DATA_DIR", os.path.join(BASE_DIR, "data"))
+UPLOAD_FOLDER = os.path.join(DATA_DIR, "jobs")
+INPUT_ZIPS_FOLDER = os.path.join(DATA_DIR, "zips")
 ZIP_REGISTRY_PATH = os.path.join(INPUT_ZIPS_FOLDER, "index.json")
+UPLOAD_SESSIONS_FOLDER = os.path.join(DATA_DIR, "uploads")
+# Shared storage the /marc page lists existing ZIPs and folders from.
+MARC_FOLDERS_ROOT = "/mnt/mi_rek"
+MARC_RESULTS_FOLDER = os.path.join(MARC_FOLDERS_ROOT, "results")
+MARC_HIDDEN_FOLDERS = {"results"}
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(INPUT_ZIPS_FOLDER, exist_ok=True)
+os.makedirs(UPLOAD_SESSIONS_FOLDER, exist_ok=True)
+
+# Global cap on concurrent OpenRouter requests across all jobs, and the number
+# of jobs that may be preparing inputs or waiting on their requests at once.
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("MAX_CONCURRENT_REQUESTS", "8"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "16"))
+
+# Fair-share weights as "name=weight" lists, e.g. "marc=2,index=1". A job's
+# share of the request slots is its route weight times its user's weight;
+# anything not listed weighs 1.
+SCHEDULER_ROUTE_WEIGHTS = os.environ.get("SCHEDULER_ROUTE_WEIGHTS", "index=1,marc=1")
+SCHEDULER_USER_WEIGHTS = os.environ.get("SCHEDULER_USER_WEIGHTS", "")
+
+# "inline" runs jobs inside the web process; "queue" only enqueues them for
+# worker_daemon.py processes, which may run on any host sharing data/.
+JOB_EXECUTION_MODE = os.environ.get("JOB_EXECUTION_MODE", "inline").strip().lower()
+JOB_QUEUE_PATH = os.environ.get("JOB_QUEUE_PATH", os.path.join(DATA_DIR, "job_queue.sqlite3"))
+SEARCH_INDEX_PATH = os.environ.get("SEARCH_INDEX_PATH", os.path.join(DATA_DIR, "search_index.sqlite3"))
+JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+# Port for each worker_daemon.py process's own /metrics listener; 0 is off.
+WORKER_METRICS_PORT = int(os.environ.get("WORKER_METRICS_PORT", "0"))
+
+# Point at a local mock (see mock_openrouter.py) to run without real API calls.
+OPENROUTER_URL = os.environ.get("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+# Retention for data/jobs and data/zips; a limit of 0 is off. Entries used
+# within the grace period and inputs of active jobs are always kept.
+RETENTION_INTERVAL_SECONDS = int(os.environ.get("RETENTION_INTERVAL_SECONDS", "3600"))
+RETENTION_GRACE_SECONDS = int(os.environ.get("RETENTION_GRACE_SECONDS", "3600"))
+RETENTION_JOB_MAX_AGE_DAYS = float(os.environ.get("RETENTION_JOB_MAX_AGE_DAYS", "0"))
+RETENTION_JOB_MAX_COUNT = int(os.environ.get("RETENTION_JOB_MAX_COUNT", "0"))
+RETENTION_JOB_MAX_BYTES = int(os.environ.get("RETENTION_JOB_MAX_BYTES", "0"))
+RETENTION_ZIP_MAX_AGE_DAYS = float(os.environ.get("RETENTION_ZIP_MAX_AGE_DAYS", "0"))
+RETENTION_ZIP_MAX_COUNT = int(os.environ.get("RETENTION_ZIP_MAX_COUNT", "0"))
+RETENTION_ZIP_MAX_BYTES = int(os.environ.get("RETENTION_ZIP_MAX_BYTES", "0"))
+
+# How often the cached /mnt/mi_rek and data/zips listings are rebuilt; 0
+# rescans on every page load.
+LISTING_REFRESH_SECONDS = int(os.environ.get("LISTING_REFRESH_SECONDS", "30"))
@@ -0,0 +1,183 @@
+import os, sqlite3, time, socket, uuid
+from config import JOB_QUEUE_PATH, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+
+# The queue lives in a plain SQLite file so that several worker processes, on
+# this host or on other hosts mounting the same storage, can share it. The
+# default rollback journal is used instead of WAL because WAL needs shared
+# memory and does not work across hosts on network filesystems.
+
+def _connect():
+    os.makedirs(os.path.dirname(JOB_QUEUE_PATH), exist_ok=True)
+    # Queued jobs keep their API key here, so only the owner may read it.
+    # SQLite gives its journal the database file's permissions.
+    os.close(os.open(JOB_QUEUE_PATH, os.O_RDWR | os.O_CREAT, 0o600))
+    if os.stat(JOB_QUEUE_PATH).st_mode & 0o077:
+        os.chmod(JOB_QUEUE_PATH, 0o600)
+    conn = sqlite3.connect(JOB_QUEUE_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        "job_id TEXT PRIMARY KEY, "
+        "state TEXT NOT NULL, "
+        "api_key TEXT NOT NULL DEFAULT '', "
+        "attempts INTEGER NOT NULL DEFAULT 0, "
+        "lease_owner TEXT, "
+        "lease_token TEXT, "
+        "lease_expires_at REAL, "
+        "enqueued_at REAL NOT NULL, "
+        "updated_at REAL NOT NULL, "
+        "error TEXT)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, enqueued_at)")
+    return conn
+
+def new_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+def enqueue_job(job_id, api_key):
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO jobs (job_id, state, api_key, attempts, enqueued_at, updated_at) "
+            "VALUES (?, 'queued', ?, 0, ?, ?)",
+            (job_id, api_key, now, now)
+        )
+    finally:
+        conn.close()
+
+def expire_abandoned_jobs(max_attempts=JOB_MAX_ATTEMPTS):
+    # Jobs whose worker stopped renewing its lease after the last allowed
+    # attempt are failed instead of being reclaimed again.
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            "SELECT job_id FROM jobs WHERE state = 'running' AND lease_expires_at < ? AND attempts >= ?",
+            (now, max_attempts)
+        ).fetchall()
+        job_ids = [row["job_id"] for row in rows]
+        for job_id in job_ids:
+            conn.execute(
+                "UPDATE jobs SET state = 'failed', api_key = '', lease_owner = NULL, lease_token = NULL, "
+                "updated_at = ?, error = ? WHERE job_id = ?",
+                (now, f"Worker lease expired after {max_attempts} attempts", job_id)
+            )
+        conn.execute("COMMIT")
+        return job_ids
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+def claim_job(worker_id, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT job_id, api_key, attempts FROM jobs "
+            "WHERE state = 'queued' OR (state = 'running' AND lease_expires_at < ? AND attempts < ?) "
+            "ORDER BY enqueued_at LIMIT 1",
+            (now, max_attempts)
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        lease_token = uuid.uuid4().hex
+        conn.execute(
+            "UPDATE jobs SET state = 'running', attempts = attempts + 1, lease_owner = ?, lease_token = ?, "
+            "lease_expires_at = ?, updated_at = ? WHERE job_id = ?",
+            (worker_id, lease_token, now + lease_seconds, now, row["job_id"])
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return {
+        "job_id": row["job_id"],
+        "api_key": row["api_key"],
+        "attempt": row["attempts"] + 1,
+        "lease_token": lease_token
+    }
+
+def renew_lease(job_id, lease_token, lease_seconds=JOB_LEASE_SECONDS):
+    now = time.time()
+    conn = _connect()
+    try:
+        cursor = conn.execute(
+            "UPDATE jobs SET lease_expires_at = ?, updated_at = ? "
+            "WHERE job_id = ? AND state = 'running' AND lease_token = ?",
+            (now + lease_seconds, now, job_id, lease_token)
+        )
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+def finish_job(job_id, lease_token, error=None):
+    # Only the current lease holder may finish a job; a worker whose lease was
+    # reclaimed while it was stalled gets False back and must drop its result.
+    now = time.time()
+    conn = _connect()
+    try:
+        cursor = conn.execute(
+            "UPDATE jobs SET state = ?, api_key = '', lease_owner = NULL, lease_token = NULL, "
+            "lease_expires_at = NULL, updated_at = ?, error = ? "
+            "WHERE job_id = ? AND state = 'running' AND lease_token = ?",
+            ("failed" if error else "finished", now, error, job_id, lease_token)
+        )
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+def cancel_queued_job(job_id):
+    now = time.time()
+    conn = _connect()
+    try:
+        cursor = conn.execute(
+            "UPDATE jobs SET state = 'cancelled', api_key = '', updated_at = ? "
+            "WHERE job_id = ? AND state = 'queued'",
+            (now, job_id)
+        )
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+def job_state(job_id):
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT state, attempts, lease_owner, lease_expires_at, error FROM jobs WHERE job_id = ?",
+            (job_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return dict(row) if row else None
+
+def queue_summary():
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT state, COUNT(*) AS count FROM jobs GROUP BY state").fetchall()
+    finally:
+        conn.close()
+    return {row["state"]: row["count"] for row in rows}
+
+def forget_job(job_id):
+    # Drops the row of a job that has ended, under the same write lock that
+    # claim_job takes. Returns False while the job is queued or running.
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT state FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is not None and row["state"] in ("queued", "running"):
+            conn.execute("ROLLBACK")
+            return False
+        conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        conn.execute("COMMIT")
+        return True
+    finally:
+        conn.close()
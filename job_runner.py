@@ -0,0 +1,601 @@
+import os, zipfile, json, shutil, tempfile, hashlib, threading, time
+from datetime import datetime
+from werkzeug.utils import secure_filename
+from config import UPLOAD_FOLDER, INPUT_ZIPS_FOLDER, ZIP_REGISTRY_PATH, MARC_FOLDERS_ROOT, MARC_HIDDEN_FOLDERS
+from worker import process_job, JobAbandoned
+from tracing import start_job_trace, get_job_trace, finish_job_trace
+from listing_cache import refresh_listings
+import metrics
+
+# Preparing a job's input and running it, shared by the web process (inline
+# mode) and worker_daemon.py (queue mode).
+
+zip_registry_lock = threading.Lock()
+
+def _file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _normalize_rel_path(path):
+    return path.replace("\\", "/").lstrip("./")
+
+def _iter_directory_files_sorted(source_dir):
+    files = []
+    for root, _, filenames in os.walk(source_dir):
+        for filename in filenames:
+            file_path = os.path.join(root, filename)
+            rel_path = _normalize_rel_path(os.path.relpath(file_path, source_dir))
+            files.append((rel_path, file_path))
+    files.sort(key=lambda row: row[0])
+    return files
+
+def _content_sha256_for_directory(source_dir, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    for rel_path, file_path in _iter_directory_files_sorted(source_dir):
+        digest.update(rel_path.encode("utf-8"))
+        digest.update(b"\0")
+        with open(file_path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def _content_sha256_for_zip(zip_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        infos = [info for info in zf.infolist() if not info.is_dir()]
+        infos.sort(key=lambda info: _normalize_rel_path(info.filename))
+        for info in infos:
+            rel_path = _normalize_rel_path(info.filename)
+            digest.update(rel_path.encode("utf-8"))
+            digest.update(b"\0")
+            with zf.open(info, "r") as src:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+            digest.update(b"\0")
+    return digest.hexdigest()
+
+def write_deterministic_zip_from_directory_contents(source_dir, zip_path):
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for rel_path, file_path in _iter_directory_files_sorted(source_dir):
+            info = zipfile.ZipInfo(filename=rel_path, date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.create_system = 0
+            with zf.open(info, "w") as dst, open(file_path, "rb") as src:
+                shutil.copyfileobj(src, dst, length=1024 * 1024)
+
+def load_zip_registry_unlocked():
+    registry_path = ZIP_REGISTRY_PATH
+    if not os.path.exists(registry_path):
+        return {"version": 1, "entries": []}
+
+    try:
+        with open(registry_path, encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return {"version": 1, "entries": []}
+
+    if not isinstance(data, dict):
+        return {"version": 1, "entries": []}
+
+    entries = data.get("entries")
+    if not isinstance(entries, list):
+        data["entries"] = []
+
+    if "version" not in data:
+        data["version"] = 1
+
+    return data
+
+def save_zip_registry_unlocked(registry):
+    registry_path = ZIP_REGISTRY_PATH
+    os.makedirs(os.path.dirname(registry_path), exist_ok=True)
+    temp_path = f"{registry_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(registry, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, registry_path)
+    refresh_listings(INPUT_ZIPS_FOLDER)
+
+def _prune_registry_entries_unlocked(registry, zips_folder):
+    valid_entries = []
+    for entry in registry.get("entries", []):
+        zip_name = os.path.basename((entry.get("zip_name") or "").strip())
+        if not zip_name:
+            continue
+        zip_path = os.path.join(zips_folder, zip_name)
+        if os.path.isfile(zip_path):
+            entry["zip_name"] = zip_name
+            valid_entries.append(entry)
+    registry["entries"] = valid_entries
+
+def _mark_zip_used(zip_name):
+    # Retention evicts registry ZIPs by last use, not by when they arrived.
+    with zip_registry_lock:
+        registry = load_zip_registry_unlocked()
+        for entry in registry.get("entries", []):
+            if entry.get("zip_name") == zip_name:
+                entry["last_used_at"] = round(time.time(), 3)
+                save_zip_registry_unlocked(registry)
+                break
+
+def _find_registry_match_unlocked(registry, zips_folder, content_sha256=None, zip_sha256=None):
+    for entry in registry.get("entries", []):
+        zip_name = os.path.basename((entry.get("zip_name") or "").strip())
+        if not zip_name:
+            continue
+        zip_path = os.path.join(zips_folder, zip_name)
+        if not os.path.isfile(zip_path):
+            continue
+        if content_sha256 and entry.get("content_sha256") == content_sha256:
+            return entry
+        if zip_sha256 and entry.get("zip_sha256") == zip_sha256:
+            return entry
+    return None
+
+def _build_storage_zip_name(original_name, content_sha256, zips_folder):
+    safe_name = secure_filename(os.path.basename((original_name or "").strip()))
+    if not safe_name:
+        safe_name = "input.zip"
+    if not safe_name.lower().endswith(".zip"):
+        safe_name = f"{safe_name}.zip"
+    stem, ext = os.path.splitext(safe_name)
+    stem = stem[:80] or "input"
+    suffix = content_sha256[:12]
+    candidate = f"{stem}_{suffix}{ext}"
+    final_path = os.path.join(zips_folder, candidate)
+    if not os.path.exists(final_path):
+        return candidate
+
+    counter = 2
+    while True:
+        candidate = f"{stem}_{suffix}_{counter}{ext}"
+        final_path = os.path.join(zips_folder, candidate)
+        if not os.path.exists(final_path):
+            return candidate
+        counter += 1
+
+def _build_registry_entry(zip_name, zip_sha256, content_sha256, source):
+    zips_folder = INPUT_ZIPS_FOLDER
+    zip_path = os.path.join(zips_folder, zip_name)
+    size_bytes = os.path.getsize(zip_path) if os.path.exists(zip_path) else 0
+    return {
+        "zip_name": zip_name,
+        "zip_sha256": zip_sha256,
+        "content_sha256": content_sha256,
+        "size_bytes": size_bytes,
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "source": source
+    }
+
+def _find_matching_zip_file_on_disk(content_sha256=None, zip_sha256=None):
+    zips_folder = INPUT_ZIPS_FOLDER
+    if not os.path.isdir(zips_folder):
+        return None, None, None
+
+    for filename in os.listdir(zips_folder):
+        if not filename.lower().endswith(".zip"):
+            continue
+        zip_path = os.path.join(zips_folder, filename)
+        if not os.path.isfile(zip_path):
+            continue
+
+        try:
+            file_zip_sha256 = _file_sha256(zip_path) if zip_sha256 else None
+        except Exception:
+            continue
+
+        if zip_sha256 and file_zip_sha256 == zip_sha256:
+            return zip_path, file_zip_sha256, None
+
+        if content_sha256:
+            try:
+                file_content_sha256 = _content_sha256_for_zip(zip_path)
+            except Exception:
+                continue
+            if file_content_sha256 == content_sha256:
+                if file_zip_sha256 is None:
+                    file_zip_sha256 = _file_sha256(zip_path)
+                return zip_path, file_zip_sha256, file_content_sha256
+
+    return None, None, None
+
+def _register_existing_zip_path(existing_zip_path, zip_sha256=None, content_sha256=None):
+    zips_folder = INPUT_ZIPS_FOLDER
+    zip_name = os.path.basename(existing_zip_path)
+
+    with zip_registry_lock:
+        registry = load_zip_registry_unlocked()
+        _prune_registry_entries_unlocked(registry, zips_folder)
+        for entry in registry.get("entries", []):
+            if entry.get("zip_name") == zip_name:
+                return entry, False
+
+    if zip_sha256 is None:
+        zip_sha256 = _file_sha256(existing_zip_path)
+    if content_sha256 is None:
+        content_sha256 = _content_sha256_for_zip(existing_zip_path)
+
+    with zip_registry_lock:
+        registry = load_zip_registry_unlocked()
+        _prune_registry_entries_unlocked(registry, zips_folder)
+        existing_entry = _find_registry_match_unlocked(
+            registry,
+            zips_folder,
+            content_sha256=content_sha256,
+            zip_sha256=zip_sha256
+        )
+        if existing_entry:
+            return existing_entry, False
+
+        entry = _build_registry_entry(
+            zip_name=zip_name,
+            zip_sha256=zip_sha256,
+            content_sha256=content_sha256,
+            source="existing"
+        )
+        registry["entries"].append(entry)
+        save_zip_registry_unlocked(registry)
+        return entry, True
+
+def find_registered_zip_sha256(zip_sha256):
+    zips_folder = INPUT_ZIPS_FOLDER
+    with zip_registry_lock:
+        registry = load_zip_registry_unlocked()
+        _prune_registry_entries_unlocked(registry, zips_folder)
+        return _find_registry_match_unlocked(registry, zips_folder, zip_sha256=zip_sha256)
+
+def register_uploaded_zip(candidate_zip_path, original_name, zip_sha256=None):
+    zips_folder = INPUT_ZIPS_FOLDER
+    if zip_sha256 is None:
+        zip_sha256 = _file_sha256(candidate_zip_path)
+    # A byte-identical ZIP is found without reading the archive contents.
+    existing_entry = find_registered_zip_sha256(zip_sha256)
+    if existing_entry:
+        if os.path.exists(candidate_zip_path):
+            os.remove(candidate_zip_path)
+        return existing_entry, False
+    content_sha256 = _content_sha256_for_zip(candidate_zip_path)
+
+    with zip_registry_lock:
+        registry = load_zip_registry_unlocked()
+        _prune_registry_entries_unlocked(registry, zips_folder)
+        existing_entry = _find_registry_match_unlocked(
+            registry,
+            zips_folder,
+            content_sha256=content_sha256,
+            zip_sha256=zip_sha256
+        )
+        if existing_entry:
+            if os.path.exists(candidate_zip_path):
+                os.remove(candidate_zip_path)
+            return existing_entry, False
+
+    matched_path, matched_zip_sha256, matched_content_sha256 = _find_matching_zip_file_on_disk(
+        content_sha256=content_sha256,
+        zip_sha256=zip_sha256
+    )
+    if matched_path:
+        existing_entry, _ = _register_existing_zip_path(
+            matched_path,
+            zip_sha256=matched_zip_sha256 or zip_sha256,
+            content_sha256=matched_content_sha256 or content_sha256
+        )
+        if os.path.exists(candidate_zip_path):
+            os.remove(candidate_zip_path)
+        return existing_entry, False
+
+    with zip_registry_lock:
+        registry = load_zip_registry_unlocked()
+        _prune_registry_entries_unlocked(registry, zips_folder)
+        existing_entry = _find_registry_match_unlocked(
+            registry,
+            zips_folder,
+            content_sha256=content_sha256,
+            zip_sha256=zip_sha256
+        )
+        if existing_entry:
+            if os.path.exists(candidate_zip_path):
+                os.remove(candidate_zip_path)
+            return existing_entry, False
+
+        zip_name = _build_storage_zip_name(original_name, content_sha256, zips_folder)
+        final_path = os.path.join(zips_folder, zip_name)
+        try:
+            os.replace(candidate_zip_path, final_path)
+        except OSError:
+            shutil.move(candidate_zip_path, final_path)
+
+        entry = _build_registry_entry(
+            zip_name=zip_name,
+            zip_sha256=zip_sha256,
+            content_sha256=content_sha256,
+            source="uploaded"
+        )
+        registry["entries"].append(entry)
+        save_zip_registry_unlocked(registry)
+        return entry, True
+
+def _register_folder_contents(folder_path, original_name):
+    zips_folder = INPUT_ZIPS_FOLDER
+    content_sha256 = _content_sha256_for_directory(folder_path)
+
+    with zip_registry_lock:
+        registry = load_zip_registry_unlocked()
+        _prune_registry_entries_unlocked(registry, zips_folder)
+        existing_entry = _find_registry_match_unlocked(
+            registry,
+            zips_folder,
+            content_sha256=content_sha256
+        )
+        if existing_entry:
+            return existing_entry, False
+
+    matched_path, matched_zip_sha256, matched_content_sha256 = _find_matching_zip_file_on_disk(
+        content_sha256=content_sha256
+    )
+    if matched_path:
+        existing_entry, _ = _register_existing_zip_path(
+            matched_path,
+            zip_sha256=matched_zip_sha256,
+            content_sha256=matched_content_sha256 or content_sha256
+        )
+        return existing_entry, False
+
+    fd, temp_zip_path = tempfile.mkstemp(
+        prefix="input_build_",
+        suffix=".zip.tmp",
+        dir=zips_folder
+    )
+    os.close(fd)
+    try:
+        write_deterministic_zip_from_directory_contents(folder_path, temp_zip_path)
+        zip_sha256 = _file_sha256(temp_zip_path)
+
+        with zip_registry_lock:
+            registry = load_zip_registry_unlocked()
+            _prune_registry_entries_unlocked(registry, zips_folder)
+            existing_entry = _find_registry_match_unlocked(
+                registry,
+                zips_folder,
+                content_sha256=content_sha256,
+                zip_sha256=zip_sha256
+            )
+            if existing_entry:
+                if os.path.exists(temp_zip_path):
+                    os.remove(temp_zip_path)
+                return existing_entry, False
+
+            zip_name = _build_storage_zip_name(original_name, content_sha256, zips_folder)
+            final_path = os.path.join(zips_folder, zip_name)
+            try:
+                os.replace(temp_zip_path, final_path)
+            except OSError:
+                shutil.move(temp_zip_path, final_path)
+
+            entry = _build_registry_entry(
+                zip_name=zip_name,
+                zip_sha256=zip_sha256,
+                content_sha256=content_sha256,
+                source="folder"
+            )
+            registry["entries"].append(entry)
+            save_zip_registry_unlocked(registry)
+            return entry, True
+    finally:
+        if os.path.exists(temp_zip_path):
+            os.remove(temp_zip_path)
+
+def persist_job_meta(job_dir, meta):
+    meta_for_disk = dict(meta)
+    api_key = meta_for_disk.pop("api_key", None)
+    # Metas reloaded from disk carry no key; keep the suffix recorded earlier.
+    if api_key is not None or "api_key_last8" not in meta_for_disk:
+        meta_for_disk["api_key_last8"] = api_key[-8:] if api_key else ""
+    meta_path = os.path.join(job_dir, "meta.json")
+    temp_path = f"{meta_path}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(meta_for_disk, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, meta_path)
+    return meta_path
+
+def resolve_job_input_zip(job_dir, meta):
+    shared_relpath = os.path.basename((meta.get("input_zip_relpath") or "").strip())
+    if shared_relpath:
+        _, shared_path = resolve_existing_zip(shared_relpath, INPUT_ZIPS_FOLDER)
+        if shared_path:
+            return shared_relpath, shared_path
+
+    shared_name = os.path.basename((meta.get("input_zip_name") or "").strip())
+    if shared_name:
+        _, shared_path = resolve_existing_zip(shared_name, INPUT_ZIPS_FOLDER)
+        if shared_path:
+            return shared_name, shared_path
+
+    if shared_name:
+        local_path = os.path.join(job_dir, shared_name)
+        if os.path.exists(local_path):
+            return shared_name, local_path
+
+    legacy_path = os.path.join(job_dir, "input.zip")
+    if os.path.exists(legacy_path):
+        return "input.zip", legacy_path
+
+    return None, None
+
+def resolve_existing_zip(zip_name, zips_folder):
+    candidate_name = os.path.basename((zip_name or "").strip())
+    if not candidate_name or not candidate_name.lower().endswith(".zip"):
+        return None, None
+
+    base_dir = os.path.abspath(zips_folder)
+    zip_path = os.path.abspath(os.path.join(base_dir, candidate_name))
+    if os.path.commonpath([base_dir, zip_path]) != base_dir:
+        return None, None
+
+    if not os.path.isfile(zip_path):
+        return None, None
+
+    return candidate_name, zip_path
+
+def resolve_existing_folder(folder_name, folders_root, excluded_names=None):
+    candidate_name = os.path.basename((folder_name or "").strip())
+    if not candidate_name:
+        return None, None
+    if excluded_names and candidate_name in excluded_names:
+        return None, None
+
+    base_dir = os.path.abspath(folders_root)
+    folder_path = os.path.abspath(os.path.join(base_dir, candidate_name))
+    if os.path.commonpath([base_dir, folder_path]) != base_dir:
+        return None, None
+
+    if not os.path.isdir(folder_path):
+        return None, None
+
+    return candidate_name, folder_path
+
+def extract_zip_to_directory(zip_path, target_dir):
+    if os.path.isdir(target_dir):
+        shutil.rmtree(target_dir, ignore_errors=True)
+    os.makedirs(target_dir, exist_ok=True)
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        zf.extractall(target_dir)
+
+def prepare_job_input(job_id, meta):
+    job_dir = os.path.join(UPLOAD_FOLDER, job_id)
+    input_source = meta.get("input_source")
+    source_route = meta.get("source_route", "index")
+    trace = get_job_trace(job_id, job_dir)
+    register_started = time.time()
+
+    if input_source == "folder":
+        folder_name = meta.get("input_folder_name", "")
+        folder_root = meta.get("input_folder_root", MARC_FOLDERS_ROOT)
+        excluded_folders = MARC_HIDDEN_FOLDERS if source_route == "marc" else None
+        resolved_name, folder_path = resolve_existing_folder(
+            folder_name,
+            folder_root,
+            excluded_names=excluded_folders
+        )
+        if not folder_path:
+            raise ValueError(f"Selected folder was not found in {folder_root}.")
+
+        folder_stem = secure_filename(resolved_name) or "folder"
+        suggested_name = f"inputs_{folder_stem}.zip" if source_route == "marc" else f"{folder_stem}.zip"
+        entry, created = _register_folder_contents(folder_path, suggested_name)
+    elif input_source == "existing":
+        selected_zip_name = meta.get("selected_existing_zip", "")
+        _, existing_zip_path = resolve_existing_zip(selected_zip_name, INPUT_ZIPS_FOLDER)
+        if not existing_zip_path:
+            raise ValueError("Selected ZIP file was not found in data/zips.")
+        entry, created = _register_existing_zip_path(existing_zip_path)
+    elif input_source == "uploaded":
+        staging_name = os.path.basename((meta.get("staging_upload_name") or "").strip())
+        if not staging_name:
+            raise ValueError("Uploaded ZIP staging file is missing.")
+        staging_path = os.path.join(job_dir, staging_name)
+        # A retried queued job finds the upload already moved into data/zips.
+        _, registered_zip_path = resolve_existing_zip(
+            meta.get("input_zip_name", ""),
+            INPUT_ZIPS_FOLDER
+        )
+        if not os.path.isfile(staging_path) and registered_zip_path:
+            entry, created = _register_existing_zip_path(registered_zip_path)
+        elif not os.path.isfile(staging_path):
+            raise ValueError("Uploaded ZIP staging file was not found.")
+        else:
+            original_name = meta.get("uploaded_original_name") or "upload.zip"
+            entry, created = register_uploaded_zip(
+                staging_path,
+                original_name,
+                zip_sha256=meta.get("uploaded_zip_sha256") or None
+            )
+    else:
+        raise ValueError("Unknown input source.")
+
+    shared_zip_name = entry["zip_name"]
+    shared_zip_path = os.path.join(INPUT_ZIPS_FOLDER, shared_zip_name)
+    if not os.path.isfile(shared_zip_path):
+        raise ValueError("Shared input ZIP was not found after registration.")
+
+    _mark_zip_used(shared_zip_name)
+    trace.add_span("register_input", "stage", register_started, source=input_source)
+    metrics.inc("batch_zip_registry_lookups_total", source=input_source, result="miss" if created else "hit")
+
+    input_dir = os.path.join(job_dir, "input")
+    with trace.span("extract_input", bytes=os.path.getsize(shared_zip_path)):
+        extract_zip_to_directory(shared_zip_path, input_dir)
+
+    meta["input_zip_name"] = shared_zip_name
+    meta["input_zip_relpath"] = shared_zip_name
+    meta["input_zip_hash"] = entry.get("zip_sha256", "")
+    meta["input_content_hash"] = entry.get("content_sha256", "")
+    meta["input_storage"] = "shared"
+    meta["input_status"] = "ready"
+    meta["input_prepared_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    persist_job_meta(job_dir, meta)
+
+def cleanup_job_input_dir(job_id):
+    job_dir = os.path.join(UPLOAD_FOLDER, job_id)
+    input_dir = os.path.join(job_dir, "input")
+    if os.path.isdir(input_dir):
+        shutil.rmtree(input_dir, ignore_errors=True)
+
+def cleanup_staged_upload(job_id, meta):
+    staging_name = os.path.basename((meta.get("staging_upload_name") or "").strip())
+    if not staging_name:
+        return
+    job_dir = os.path.join(UPLOAD_FOLDER, job_id)
+    staging_path = os.path.join(job_dir, staging_name)
+    if os.path.isfile(staging_path):
+        os.remove(staging_path)
+
+def run_job_pipeline(job_id, meta):
+    job_dir = os.path.join(UPLOAD_FOLDER, job_id)
+    trace = start_job_trace(job_id, job_dir)
+    if meta.get("queued_at_ts"):
+        trace.add_span("job_queue_wait", "stage", meta["queued_at_ts"])
+    abandoned = False
+    try:
+        meta["input_status"] = "preparing"
+        persist_job_meta(job_dir, meta)
+        with trace.span("prepare_input"):
+            prepare_job_input(job_id, meta)
+        result_path = process_job(job_id, meta)
+        metrics.inc(
+            "batch_jobs_total",
+            route=meta.get("source_route", "index"),
+            status="cancelled" if meta.get("job_state") == "cancelled" else "finished"
+        )
+        return result_path
+    except JobAbandoned:
+        # The worker that took the job over owns its directory now.
+        abandoned = True
+        raise
+    except Exception as e:
+        metrics.inc("batch_jobs_total", route=meta.get("source_route", "index"), status="failed")
+        meta["input_status"] = "error"
+        meta["input_error"] = str(e)
+        persist_job_meta(job_dir, meta)
+        raise
+    finally:
+        if not abandoned:
+            with trace.span("cleanup"):
+                cleanup_staged_upload(job_id, meta)
+                cleanup_job_input_dir(job_id)
+            if meta.get("timing_summary"):
+                meta["timing_summary"] = trace.summary()
+                persist_job_meta(job_dir, meta)
+        finish_job_trace(job_id)
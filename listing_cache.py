@@ -0,0 +1,160 @@
+import os, time, errno, select, ctypes, ctypes.util, threading
+from datetime import datetime
+from config import LISTING_REFRESH_SECONDS
+
+# Directory listings for the upload pages, served from memory and rebuilt by
+# one background thread. A child entry is only rebuilt when its own mtime or
+# size changed, so an idle share costs one scandir and a stat per child.
+# Where inotify is available the thread wakes up as soon as a watched local
+# directory changes; network shares do not report remote changes through
+# inotify, so they are still polled every LISTING_REFRESH_SECONDS.
+
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_IN_WATCH_MASK = 0x2 | 0x4 | 0x40 | 0x80 | 0x100 | 0x200 | 0x400 | 0x800
+_EVENT_SETTLE_SECONDS = 0.5
+
+_caches = {}
+_caches_lock = threading.Lock()
+_refresher = {"thread": None}
+
+class _Inotify:
+    def __init__(self):
+        library = ctypes.util.find_library("c")
+        if not library:
+            raise OSError(errno.ENOSYS, "libc not found")
+        self._libc = ctypes.CDLL(library, use_errno=True)
+        self.fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watched = set()
+
+    def watch(self, path):
+        if path in self._watched:
+            return
+        if self._libc.inotify_add_watch(self.fd, os.fsencode(path), _IN_WATCH_MASK) >= 0:
+            self._watched.add(path)
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        # Writes usually arrive in bursts; refresh once they settle.
+        time.sleep(_EVENT_SETTLE_SECONDS)
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+class ListingCache:
+    def __init__(self, root, build_entry, want_dirs=False, suffix="", excluded_names=None):
+        self.root = root
+        self.build_entry = build_entry
+        self.want_dirs = want_dirs
+        self.suffix = suffix
+        self.excluded = set(excluded_names or [])
+        self._lock = threading.Lock()
+        self._children = {}
+        self._entries = None
+        self.refreshed_at = None
+        self.refresh_seconds = None
+
+    def _wanted(self, dir_entry):
+        if dir_entry.name in self.excluded:
+            return False
+        if self.want_dirs:
+            return dir_entry.is_dir()
+        return dir_entry.is_file() and dir_entry.name.lower().endswith(self.suffix)
+
+    def refresh(self):
+        started = time.monotonic()
+        previous = self._children
+        children = {}
+        if os.path.isdir(self.root):
+            with os.scandir(self.root) as scan:
+                for dir_entry in scan:
+                    try:
+                        if not self._wanted(dir_entry):
+                            continue
+                        stat = dir_entry.stat()
+                        stamp = (stat.st_mtime_ns, stat.st_size)
+                        cached = previous.get(dir_entry.name)
+                        if cached is not None and cached[0] == stamp:
+                            children[dir_entry.name] = cached
+                            continue
+                        children[dir_entry.name] = (stamp, self.build_entry(dir_entry.path, dir_entry.name, stat))
+                    except OSError:
+                        continue
+        ordered = sorted(children.values(), key=lambda child: child[0][0], reverse=True)
+        with self._lock:
+            self._children = children
+            self._entries = [dict(entry) for _, entry in ordered]
+            self.refreshed_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.refresh_seconds = round(time.monotonic() - started, 3)
+
+    def child_dirs(self):
+        if not self.want_dirs:
+            return []
+        return [os.path.join(self.root, name) for name in self._children]
+
+    def snapshot(self):
+        # Only the very first request for a directory waits for a scan.
+        if self._entries is None:
+            self.refresh()
+        with self._lock:
+            return [dict(entry) for entry in self._entries], self.refreshed_at
+
+def _refresh_all(notifier):
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        try:
+            cache.refresh()
+        except OSError:
+            continue
+        if notifier is not None:
+            # Watching the children too catches files added inside a folder,
+            # which changes its item count.
+            for path in [cache.root] + cache.child_dirs():
+                notifier.watch(path)
+
+def _refresh_loop():
+    try:
+        notifier = _Inotify()
+    except (OSError, AttributeError):
+        notifier = None
+    while True:
+        _refresh_all(notifier)
+        if notifier is not None:
+            notifier.wait(LISTING_REFRESH_SECONDS)
+        else:
+            time.sleep(LISTING_REFRESH_SECONDS)
+
+def _ensure_refresher():
+    with _caches_lock:
+        if _refresher["thread"] is None and LISTING_REFRESH_SECONDS > 0:
+            _refresher["thread"] = threading.Thread(target=_refresh_loop, daemon=True)
+            _refresher["thread"].start()
+
+def get_listing(root, build_entry, want_dirs=False, suffix="", excluded_names=None):
+    # Returns (entries, refreshed_at) for root, newest first.
+    key = (root, want_dirs, suffix, frozenset(excluded_names or []))
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = ListingCache(root, build_entry, want_dirs, suffix, excluded_names)
+            _caches[key] = cache
+    _ensure_refresher()
+    if LISTING_REFRESH_SECONDS <= 0:
+        cache.refresh()
+    return cache.snapshot()
+
+def refresh_listings(root):
+    # For changes this process made itself, e.g. a newly registered ZIP, so
+    # the next page load shows them without waiting for the refresher.
+    with _caches_lock:
+        caches = [cache for key, cache in _caches.items() if key[0] == root]
+    for cache in caches:
+        cache.refresh()
@@ -0,0 +1,106 @@
+import threading
+
+# In-process metric registry rendered in the Prometheus text exposition format.
+# Values live only in memory, so scraping never touches the filesystem.
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+METRICS = {
+    "batch_jobs_total": ("counter", "Jobs that ended, by route and outcome."),
+    "batch_stage_seconds": ("histogram", "Duration of job pipeline stages.", STAGE_BUCKETS),
+    "batch_groups_total": ("counter", "Groups written to job outputs, by result."),
+    "batch_fallback_attempts_total": ("counter", "Requests moved to the next model in a job's fallback chain."),
+    "batch_retention_evictions_total": ("counter", "Job directories and input ZIPs removed by retention, by kind."),
+    "batch_retention_freed_bytes_total": ("counter", "Bytes freed by retention, by kind."),
+    "batch_zip_registry_lookups_total": ("counter", "Input ZIP registry lookups, by source and result."),
+    "openrouter_requests_total": ("counter", "OpenRouter request attempts, by model and outcome."),
+    "openrouter_retries_total": ("counter", "Requests sent again for the same group, by reason."),
+    "openrouter_request_seconds": ("histogram", "Latency of successful OpenRouter requests.", LATENCY_BUCKETS),
+    "openrouter_ttft_seconds": ("histogram", "Time to first token of streamed requests.", LATENCY_BUCKETS),
+    "openrouter_tokens_total": ("counter", "Tokens reported in usage blocks, by model and kind."),
+    "openrouter_cost_total": ("counter", "Cost reported in usage blocks, in credits."),
+    "openrouter_hedges_total": ("counter", "Hedged requests, by which attempt won."),
+    "openrouter_hedges_skipped_total": ("counter", "Hedges not sent because every request slot was busy."),
+    "openrouter_coalesced_total": ("counter", "Requests that shared an identical in-flight request."),
+    "openrouter_cassette_total": ("counter", "Cassette recordings and replays, by mode and result."),
+}
+
+_values = {}
+_values_lock = threading.Lock()
+_collectors = []
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def inc(name, value=1, **labels):
+    key = _label_key(labels)
+    with _values_lock:
+        series = _values.setdefault(name, {})
+        series[key] = series.get(key, 0) + value
+
+def observe(name, value, **labels):
+    if value is None:
+        return
+    buckets = METRICS[name][2]
+    key = _label_key(labels)
+    with _values_lock:
+        series = _values.setdefault(name, {})
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0}
+            series[key] = histogram
+        for idx, bound in enumerate(buckets):
+            if value <= bound:
+                histogram["buckets"][idx] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+def register_collector(collector):
+    # A collector returns [(name, type, help, [(labels, value), ...]), ...]
+    # for gauges that are cheaper to read at scrape time than to maintain.
+    _collectors.append(collector)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+def render_metrics():
+    lines = []
+    with _values_lock:
+        snapshot = {
+            name: {
+                key: dict(value, buckets=list(value["buckets"])) if isinstance(value, dict) else value
+                for key, value in series.items()
+            }
+            for name, series in _values.items()
+        }
+    for name, definition in METRICS.items():
+        metric_type, help_text = definition[0], definition[1]
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for key, value in sorted(snapshot.get(name, {}).items()):
+            if metric_type != "histogram":
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                continue
+            for bound, count in zip(definition[2], value["buckets"]):
+                lines.append(f"{name}_bucket{_format_labels(key + (('le', str(bound)),))} {count}")
+            lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {value['count']}")
+            lines.append(f"{name}_sum{_format_labels(key)} {_format_value(value['sum'])}")
+            lines.append(f"{name}_count{_format_labels(key)} {value['count']}")
+    for collector in list(_collectors):
+        for name, metric_type, help_text, samples in collector():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(_label_key(labels))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
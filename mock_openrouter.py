@@ -0,0 +1,270 @@
+import sys, json, math, time, random, re, threading, argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Local stand-in for OpenRouter's /api/v1/chat/completions, for benchmarks and
+# offline runs. Start it and set OPENROUTER_URL to the printed URL.
+
+PROMPT_PRICE_PER_TOKEN = 0.0000003
+COMPLETION_PRICE_PER_TOKEN = 0.0000025
+IMAGE_PROMPT_TOKENS = 258
+PACK_SECTION_RE = re.compile(r"<<<FILE id=(\d+)>>>\n(.*?)\n<<<END FILE id=\1>>>", re.S)
+
+def parse_latency(spec):
+    # "fixed:0.5", "uniform:0.2,1.5", "exponential:0.8" (mean) or
+    # "lognormal:0.8,0.5" (median, sigma); all in seconds.
+    kind, _, raw_args = str(spec).partition(":")
+    args = [float(value) for value in raw_args.split(",") if value.strip()]
+    if kind == "fixed":
+        return lambda rng: args[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(args[0], args[1])
+    if kind == "exponential":
+        return lambda rng: rng.expovariate(1.0 / args[0])
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(args[0]), args[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+class MockState:
+    def __init__(
+        self,
+        latency="lognormal:0.8,0.5",
+        model_latency=None,
+        rate_429=0.0,
+        rate_5xx=0.0,
+        rate_bad_json=0.0,
+        tokens_per_second=80.0,
+        completion_tokens=(60, 400),
+        seed=None
+    ):
+        self.latency = parse_latency(latency)
+        self.model_latency = {model: parse_latency(spec) for model, spec in (model_latency or {}).items()}
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.rate_bad_json = rate_bad_json
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "ok": 0, "429": 0, "5xx": 0, "streamed": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def draw(self, model):
+        with self.lock:
+            roll = self.rng.random()
+            latency = (self.model_latency.get(model) or self.latency)(self.rng)
+            completion_tokens = self.rng.randint(*self.completion_tokens)
+        if roll < self.rate_429:
+            return "429", latency, completion_tokens
+        if roll < self.rate_429 + self.rate_5xx:
+            return "5xx", latency, completion_tokens
+        return "ok", latency, completion_tokens
+
+    def count(self, **values):
+        with self.lock:
+            for key, value in values.items():
+                self.stats[key] = self.stats.get(key, 0) + value
+
+def _prompt_tokens(messages):
+    tokens = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            tokens += len(content) // 4 + 4
+            continue
+        for part in content or []:
+            if part.get("type") == "image_url":
+                tokens += IMAGE_PROMPT_TOKENS
+            else:
+                tokens += len(part.get("text", "")) // 4
+    return max(1, tokens)
+
+def _user_text(messages):
+    texts = []
+    for message in messages:
+        if message.get("role") != "user":
+            continue
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        texts.extend(part.get("text", "") for part in content or [] if part.get("type") == "text")
+    return "\n".join(texts)
+
+def _mock_value(schema, text):
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type", "object")
+    kind = kind[0] if isinstance(kind, list) else kind
+    if kind == "object":
+        properties = schema.get("properties") or {}
+        if not properties:
+            return {"answer": text}
+        return {key: _mock_value(prop, text) for key, prop in properties.items()}
+    if kind == "array":
+        return [_mock_value(schema["items"], text)] if isinstance(schema.get("items"), dict) else []
+    return {"string": text, "integer": 1, "number": 1.0, "boolean": True, "null": None}.get(kind, text)
+
+def _reply_text(body, completion_tokens, bad_json=False):
+    user_text = _user_text(body.get("messages") or [])
+    response_format = body.get("response_format") or {}
+    json_schema = response_format.get("json_schema") or {}
+    if json_schema.get("name") == "packed_file_results":
+        sections = PACK_SECTION_RE.findall(user_text)
+        return json.dumps({
+            "results": [{"id": section_id, "output": f"mock output for file {section_id}"} for section_id, _ in sections]
+        })
+    words = ["mock"] * max(1, completion_tokens // 2)
+    text = f"Mock answer for {len(user_text)} characters of input. " + " ".join(words)
+    if response_format.get("type") in ("json_object", "json_schema"):
+        reply = json.dumps(_mock_value(json_schema.get("schema") or {}, text))
+        # Models that ignore the format tend to wrap the JSON in a code fence.
+        return f"```json\n{reply}\n```" if bad_json else reply
+    return text
+
+def _usage(prompt_tokens, completion_tokens):
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "cost": round(
+            prompt_tokens * PROMPT_PRICE_PER_TOKEN + completion_tokens * COMPLETION_PRICE_PER_TOKEN,
+            8
+        ),
+        "is_byok": False,
+        "prompt_tokens_details": {"cached_tokens": 0},
+        "completion_tokens_details": {"reasoning_tokens": 0}
+    }
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found", "code": 404}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        model = body.get("model", "")
+        state = self.state
+        outcome, latency, completion_tokens = state.draw(model)
+        state.count(requests=1)
+
+        if outcome == "429":
+            time.sleep(min(latency, 0.2))
+            state.count(**{"429": 1})
+            self._send_json(429, {"error": {"message": "Rate limit exceeded", "code": 429}}, {"Retry-After": "1"})
+            return
+        if outcome == "5xx":
+            time.sleep(latency)
+            state.count(**{"5xx": 1})
+            self._send_json(503, {"error": {"message": "Provider overloaded", "code": 503}})
+            return
+
+        prompt_tokens = _prompt_tokens(body.get("messages") or [])
+        with state.lock:
+            bad_json = state.rng.random() < state.rate_bad_json
+        reply = _reply_text(body, completion_tokens, bad_json)
+        usage = _usage(prompt_tokens, completion_tokens)
+        state.count(ok=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+        if not body.get("stream"):
+            time.sleep(latency + completion_tokens / state.tokens_per_second)
+            self._send_json(200, {
+                "id": f"gen-mock-{time.time_ns()}",
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": usage
+            })
+            return
+
+        state.count(streamed=1)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._write_chunk(b": OPENROUTER PROCESSING\n\n")
+        time.sleep(latency)
+        pieces = re.findall(r"\S+\s*", reply) or [reply]
+        delay = completion_tokens / state.tokens_per_second / len(pieces)
+        for piece in pieces:
+            event = {"choices": [{"index": 0, "delta": {"content": piece}}]}
+            self._write_chunk(("data: " + json.dumps(event) + "\n\n").encode("utf-8"))
+            time.sleep(delay)
+        final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}
+        self._write_chunk(("data: " + json.dumps(final) + "\n\n").encode("utf-8"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 resets connections under benchmark concurrency.
+    request_queue_size = 256
+
+    def handle_error(self, request, client_address):
+        # Clients drop streams after [DONE] and hedged requests get abandoned.
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+def start_mock_server(host="127.0.0.1", port=0, **options):
+    state = MockState(**options)
+    handler = type("BoundMockHandler", (MockHandler,), {"state": state})
+    server = MockServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="mock-openrouter", daemon=True).start()
+    url = f"http://{host}:{server.server_address[1]}/api/v1/chat/completions"
+    return server, state, url
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a mock OpenRouter chat completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="lognormal:0.8,0.5", help="fixed:S, uniform:A,B, exponential:MEAN or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SPEC", help="per-model latency override")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--rate-bad-json", type=float, default=0.0, help="fraction of JSON-mode replies wrapped in a code fence")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    model_latency = dict(item.split("=", 1) for item in args.model_latency)
+    server, state, url = start_mock_server(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        model_latency=model_latency,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        rate_bad_json=args.rate_bad_json,
+        tokens_per_second=args.tokens_per_second,
+        seed=args.seed
+    )
+    print(f"Mock OpenRouter listening on {url}", flush=True)
+    print(f"Run the app with OPENROUTER_URL={url}", flush=True)
+    try:
+        while True:
+            time.sleep(60)
+            print(json.dumps(state.stats), flush=True)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,680 @@
+import json, time, socket, threading, queue, hashlib
+from collections import deque
+import requests
+import metrics
+from config import OPENROUTER_URL, MAX_CONCURRENT_REQUESTS
+
+DEFAULT_REQUEST_TIMEOUT = 120
+MIN_REQUEST_TIMEOUT = 30
+MAX_REQUEST_TIMEOUT = 600
+CONNECT_TIMEOUT = 15
+TIMEOUT_LATENCY_MULTIPLIER = 2.5
+UPLOAD_BYTES_PER_SECOND = 256 * 1024
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 5
+DEFAULT_HEDGE_DELAY = 60
+MIN_HEDGE_DELAY = 5
+RESPONSE_CHUNK_SIZE = 64 * 1024
+STREAM_STALL_TIMEOUT = 45
+FOLLOWER_POLL_SECONDS = 0.5
+WATCH_POLL_SECONDS = 0.1
+
+_model_latencies = {}
+_model_latency_lock = threading.Lock()
+_inflight_requests = {}
+_inflight_lock = threading.Lock()
+_model_outcomes = {}
+_model_outcome_lock = threading.Lock()
+# Every HTTP attempt holds one of these. The scheduler runs as many dispatch
+# threads, so a hedge only goes out while a slot is spare, and a losing
+# attempt keeps its slot until it has hung up.
+_request_slots = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+
+HEALTH_WINDOW = 50
+HEALTH_MIN_SAMPLES = 5
+HEALTH_MAX_AGE = 300
+HEALTH_LATENCY_TARGET = 30.0
+UNHEALTHY_SCORE = 0.5
+FALLBACK_FAILURES = {
+    "timeout",
+    "connection_error",
+    "rate_limited",
+    "overloaded",
+    "server_error",
+    "model_unavailable",
+    "invalid_response",
+    "provider_error",
+    "replay_miss"
+}
+
+class RequestCancelled(Exception):
+    pass
+
+class ReplayMiss(Exception):
+    pass
+
+class HedgeAttempts:
+    # Losing hedge attempts outlive the request that started them. A job
+    # keeps one of these and drains it before its cost totals are final.
+    def __init__(self):
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def add(self, thread):
+        with self._lock:
+            self._threads = [item for item in self._threads if item.is_alive()]
+            self._threads.append(thread)
+
+    def drain(self, timeout):
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            threads = list(self._threads)
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        return sum(1 for thread in threads if thread.is_alive())
+
+class _AnyEvent:
+    def __init__(self, *events):
+        self._events = [event for event in events if event is not None]
+
+    def is_set(self):
+        return any(event.is_set() for event in self._events)
+
+def record_model_latency(model, seconds):
+    if not model or seconds is None or seconds < 0:
+        return
+    with _model_latency_lock:
+        samples = _model_latencies.get(model)
+        if samples is None:
+            samples = deque(maxlen=LATENCY_WINDOW)
+            _model_latencies[model] = samples
+        samples.append(float(seconds))
+
+def percentile(values, pct):
+    samples = sorted(value for value in values if value is not None)
+    if not samples:
+        return None
+    rank = max(0, min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1)))))
+    return samples[rank]
+
+def model_latency_percentile(model, pct):
+    with _model_latency_lock:
+        samples = list(_model_latencies.get(model) or [])
+    if len(samples) < LATENCY_MIN_SAMPLES:
+        return None
+    return percentile(samples, pct)
+
+def model_latency_snapshot():
+    with _model_latency_lock:
+        models = list(_model_latencies)
+    snapshot = {}
+    for model in models:
+        snapshot[model] = {
+            "samples": len(_model_latencies.get(model) or []),
+            "p50": model_latency_percentile(model, 50),
+            "p95": model_latency_percentile(model, 95),
+            "p99": model_latency_percentile(model, 99)
+        }
+    return snapshot
+
+def request_timeout_for(model, payload_bytes=0):
+    upload_allowance = float(payload_bytes or 0) / UPLOAD_BYTES_PER_SECOND
+    p99 = model_latency_percentile(model, 99)
+    if p99 is None:
+        base = DEFAULT_REQUEST_TIMEOUT
+    else:
+        base = max(MIN_REQUEST_TIMEOUT, p99 * TIMEOUT_LATENCY_MULTIPLIER)
+    return round(min(MAX_REQUEST_TIMEOUT, base + upload_allowance), 1)
+
+def classify_failure(error):
+    if isinstance(error, RequestCancelled):
+        return "cancelled"
+    if isinstance(error, ReplayMiss):
+        return "replay_miss"
+    if isinstance(error, requests.Timeout):
+        return "timeout"
+    if isinstance(error, requests.ConnectionError):
+        return "connection_error"
+    if isinstance(error, requests.HTTPError):
+        status_code = error.response.status_code if error.response is not None else 0
+        if status_code in (408, 524):
+            return "timeout"
+        if status_code == 429:
+            return "rate_limited"
+        if status_code in (502, 503, 529):
+            return "overloaded"
+        if status_code == 404:
+            return "model_unavailable"
+        if status_code >= 500:
+            return "server_error"
+        # 400/401/402/403 fail the same way on any model.
+        return "client_error"
+    if isinstance(error, (KeyError, ValueError)):
+        return "invalid_response"
+    if isinstance(error, RuntimeError):
+        return "provider_error"
+    return "unknown"
+
+def record_model_outcome(model, ok, latency=None):
+    if not model:
+        return
+    with _model_outcome_lock:
+        outcomes = _model_outcomes.get(model)
+        if outcomes is None:
+            outcomes = deque(maxlen=HEALTH_WINDOW)
+            _model_outcomes[model] = outcomes
+        outcomes.append((bool(ok), latency, time.monotonic()))
+
+def model_health(model):
+    # Old outcomes age out so a model that was demoted gets tried again.
+    oldest = time.monotonic() - HEALTH_MAX_AGE
+    with _model_outcome_lock:
+        outcomes = [
+            (ok, latency) for ok, latency, recorded_at in _model_outcomes.get(model) or []
+            if recorded_at >= oldest
+        ]
+    if len(outcomes) < HEALTH_MIN_SAMPLES:
+        return {"samples": len(outcomes), "success_rate": None, "p95": None, "score": None}
+    success_rate = sum(1 for ok, _ in outcomes if ok) / float(len(outcomes))
+    p95 = percentile([latency for ok, latency in outcomes if ok], 95)
+    # The score falls with the error rate and with p95 latency beyond the target.
+    latency_factor = 1.0 if not p95 else min(1.0, HEALTH_LATENCY_TARGET / p95)
+    return {
+        "samples": len(outcomes),
+        "success_rate": round(success_rate, 3),
+        "p95": round(p95, 3) if p95 is not None else None,
+        "score": round(success_rate * latency_factor, 3)
+    }
+
+def model_health_snapshot():
+    with _model_outcome_lock:
+        models = list(_model_outcomes)
+    return {model: model_health(model) for model in models}
+
+def order_models_by_health(models):
+    # The job's order is kept, except that models currently scoring below
+    # UNHEALTHY_SCORE are tried after the healthy ones.
+    healthy = []
+    unhealthy = []
+    for model in models:
+        score = model_health(model)["score"]
+        if score is not None and score < UNHEALTHY_SCORE:
+            unhealthy.append(model)
+        else:
+            healthy.append(model)
+    return healthy + unhealthy
+
+def hedge_delay_for(model):
+    p95 = model_latency_percentile(model, 95)
+    if p95 is None:
+        return DEFAULT_HEDGE_DELAY
+    return max(MIN_HEDGE_DELAY, p95)
+
+def parse_completion(data):
+    usage = data.get("usage") or {}
+    choices = data.get("choices") or []
+    if not choices:
+        raise KeyError("Missing completion choices")
+    message = choices[0].get("message") or {}
+    reply = message.get("content")
+    if reply is None:
+        raise KeyError("Missing completion content")
+    return reply, usage
+
+def _hang_up(response):
+    try:
+        sock = socket.fromfd(response.raw.fileno(), socket.AF_INET, socket.SOCK_STREAM)
+    except (OSError, ValueError):
+        return
+    with sock:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+def _watch_response(response, deadline, cancel_event):
+    # requests applies its read timeout to each socket read and fills whole
+    # chunks before returning them, so a body that keeps trickling in would
+    # outlast both the deadline and a cancel. Shutting the socket down fails
+    # whichever read is blocked at that moment.
+    finished = threading.Event()
+
+    def watch():
+        while not finished.wait(WATCH_POLL_SECONDS):
+            if time.monotonic() >= deadline or (cancel_event is not None and cancel_event.is_set()):
+                _hang_up(response)
+                return
+
+    threading.Thread(target=watch, name="openrouter-watch", daemon=True).start()
+    return finished
+
+def _read_within(deadline, timeout, cancel_event, read):
+    # Runs `read` and reports a read cut off by the watcher as a cancel or a
+    # timeout.
+    try:
+        result = read()
+    except RequestCancelled:
+        raise
+    except Exception:
+        if cancel_event is not None and cancel_event.is_set():
+            raise RequestCancelled("Request cancelled") from None
+        if time.monotonic() >= deadline:
+            raise requests.Timeout(f"Request exceeded {timeout:.0f}s timeout") from None
+        raise
+    if cancel_event is not None and cancel_event.is_set():
+        raise RequestCancelled("Request cancelled")
+    if time.monotonic() > deadline:
+        raise requests.Timeout(f"Request exceeded {timeout:.0f}s timeout")
+    return result
+
+def _post_completion(body, api_key, timeout, cancel_event=None):
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    started = time.monotonic()
+    deadline = started + timeout
+    with requests.post(
+        OPENROUTER_URL,
+        data=body,
+        headers=headers,
+        timeout=(CONNECT_TIMEOUT, timeout),
+        stream=True
+    ) as r:
+        ttfb = time.monotonic() - started
+        r.raise_for_status()
+        watching = _watch_response(r, deadline, cancel_event)
+
+        def read_body():
+            received = bytearray()
+            for chunk in r.iter_content(chunk_size=RESPONSE_CHUNK_SIZE):
+                # Leaving the with block closes the connection, so a cancelled
+                # request stops reading instead of draining the whole body.
+                if cancel_event is not None and cancel_event.is_set():
+                    raise RequestCancelled("Request cancelled")
+                received.extend(chunk)
+            return received
+
+        try:
+            received = _read_within(deadline, timeout, cancel_event, read_body)
+        finally:
+            watching.set()
+    return json.loads(bytes(received)), round(ttfb, 3)
+
+def _iter_sse_data(response):
+    for raw_line in response.iter_lines(chunk_size=None, decode_unicode=False):
+        if not raw_line:
+            yield None
+            continue
+        line = raw_line.decode("utf-8", errors="replace")
+        if line.startswith(":"):
+            # OpenRouter sends ": OPENROUTER PROCESSING" comments as keep-alives.
+            yield None
+            continue
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return
+        yield json.loads(data)
+
+def _stream_completion(body, api_key, timeout, cancel_event=None, on_delta=None):
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream"
+    }
+    started = time.monotonic()
+    deadline = started + timeout
+    stall_timeout = min(STREAM_STALL_TIMEOUT, timeout)
+    parts = []
+    usage = {}
+    first_token_at = None
+    last_progress_at = started
+    with requests.post(
+        OPENROUTER_URL,
+        data=body,
+        headers=headers,
+        timeout=(CONNECT_TIMEOUT, stall_timeout),
+        stream=True
+    ) as r:
+        ttfb = time.monotonic() - started
+        r.raise_for_status()
+        watching = _watch_response(r, deadline, cancel_event)
+
+        def read_events():
+            nonlocal usage, first_token_at, last_progress_at
+            for event in _iter_sse_data(r):
+                now = time.monotonic()
+                if cancel_event is not None and cancel_event.is_set():
+                    raise RequestCancelled("Request cancelled")
+                if event is None:
+                    if first_token_at is not None and now - last_progress_at > stall_timeout:
+                        raise requests.Timeout(f"Stream stalled for more than {stall_timeout:.0f}s")
+                    continue
+                if event.get("error"):
+                    error = event["error"]
+                    message = error.get("message") if isinstance(error, dict) else str(error)
+                    raise RuntimeError(f"Stream error: {message}")
+                if event.get("usage"):
+                    usage = event["usage"]
+                for choice in event.get("choices") or []:
+                    delta = choice.get("delta") or {}
+                    content = delta.get("content")
+                    if content is None and not delta.get("reasoning"):
+                        continue
+                    if first_token_at is None:
+                        first_token_at = now
+                    last_progress_at = now
+                    if content:
+                        parts.append(content)
+                        if on_delta is not None:
+                            on_delta("".join(parts))
+
+        try:
+            _read_within(deadline, timeout, cancel_event, read_events)
+        finally:
+            watching.set()
+    finished = time.monotonic()
+    if first_token_at is None:
+        raise KeyError("Missing completion content")
+    completion_tokens = usage.get("completion_tokens") if isinstance(usage, dict) else None
+    generation_seconds = finished - first_token_at
+    tokens_per_second = None
+    if completion_tokens and generation_seconds > 0:
+        tokens_per_second = round(float(completion_tokens) / generation_seconds, 2)
+    return "".join(parts), usage, {
+        "ttfb": round(ttfb, 3),
+        "ttft": round(first_token_at - started, 3),
+        "tokens_per_second": tokens_per_second
+    }
+
+def _record_usage_metrics(model, latency, ttft, usage):
+    metrics.inc("openrouter_requests_total", model=model, outcome="ok")
+    metrics.observe("openrouter_request_seconds", latency, model=model)
+    metrics.observe("openrouter_ttft_seconds", ttft, model=model)
+    if not isinstance(usage, dict):
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if isinstance(usage.get(kind), (int, float)):
+            metrics.inc("openrouter_tokens_total", usage[kind], model=model, kind=kind.split("_")[0])
+    if isinstance(usage.get("cost"), (int, float)):
+        metrics.inc("openrouter_cost_total", float(usage["cost"]), model=model)
+
+def _take_request_slot(cancel_event):
+    while not _request_slots.acquire(timeout=FOLLOWER_POLL_SECONDS):
+        if cancel_event.is_set():
+            raise RequestCancelled("Request cancelled before it was sent")
+
+def _attempt(payload, api_key, cancel_event=None, stream=False, on_delta=None, abort_event=None, holds_slot=False):
+    # `holds_slot` means the caller already took this attempt's request slot.
+    cancel_event = _AnyEvent(cancel_event, abort_event)
+    try:
+        if not holds_slot:
+            _take_request_slot(cancel_event)
+            holds_slot = True
+        return _attempt_in_slot(payload, api_key, cancel_event, stream, on_delta)
+    finally:
+        if holds_slot:
+            _request_slots.release()
+
+def _attempt_in_slot(payload, api_key, cancel_event, stream, on_delta):
+    model = payload.get("model", "")
+    if stream:
+        payload = dict(payload, stream=True)
+    body = json.dumps(payload).encode("utf-8")
+    timeout = request_timeout_for(model, len(body))
+    if cancel_event.is_set():
+        raise RequestCancelled("Request cancelled before it was sent")
+    started = time.monotonic()
+    stream_stats = {"ttfb": None, "ttft": None, "tokens_per_second": None}
+    try:
+        if stream:
+            reply, usage, stream_stats = _stream_completion(
+                body,
+                api_key,
+                timeout,
+                cancel_event=cancel_event,
+                on_delta=on_delta
+            )
+        else:
+            data, stream_stats["ttfb"] = _post_completion(body, api_key, timeout, cancel_event=cancel_event)
+            reply, usage = parse_completion(data)
+    except Exception as e:
+        failure = classify_failure(e)
+        metrics.inc("openrouter_requests_total", model=model, outcome=failure)
+        if failure not in ("cancelled", "client_error"):
+            record_model_outcome(model, False)
+        raise
+    latency = time.monotonic() - started
+    record_model_latency(model, latency)
+    record_model_outcome(model, True, latency)
+    _record_usage_metrics(model, latency, stream_stats["ttft"], usage)
+    return {
+        "reply": reply,
+        "usage": usage,
+        "model": model,
+        "latency": round(latency, 3),
+        "timeout": timeout,
+        "streamed": stream,
+        "ttfb": stream_stats["ttfb"],
+        "ttft": stream_stats["ttft"],
+        "tokens_per_second": stream_stats["tokens_per_second"],
+        "hedged": False,
+        "hedge_won": False
+    }
+
+def _start_attempt(
+    name,
+    payload,
+    api_key,
+    outcomes,
+    race,
+    on_extra_usage=None,
+    stream=False,
+    on_delta=None,
+    abort_event=None,
+    hedge_attempts=None,
+    holds_slot=False
+):
+    cancel_event = threading.Event()
+
+    def run():
+        try:
+            result = _attempt(
+                payload,
+                api_key,
+                cancel_event=cancel_event,
+                stream=stream,
+                on_delta=on_delta,
+                abort_event=abort_event,
+                holds_slot=holds_slot
+            )
+        except Exception as e:
+            with race["lock"]:
+                lost = race["winner"] not in (None, name)
+            if lost and isinstance(e, RequestCancelled) and on_extra_usage is not None:
+                # Dropped once the other attempt won; its tokens are unknown.
+                on_extra_usage({})
+            outcomes.put((name, None, e))
+            return
+        with race["lock"]:
+            is_winner = race["winner"] is None
+            if is_winner:
+                race["winner"] = name
+        if not is_winner:
+            if on_extra_usage is not None:
+                on_extra_usage(result.get("usage") or {})
+            return
+        outcomes.put((name, result, None))
+
+    thread = threading.Thread(target=run, name=f"openrouter-{name}", daemon=True)
+    thread.start()
+    if hedge_attempts is not None:
+        hedge_attempts.add(thread)
+    return cancel_event
+
+def _dispatch_completion(
+    payload,
+    api_key,
+    hedge=False,
+    hedge_model="",
+    on_extra_usage=None,
+    stream=False,
+    on_delta=None,
+    abort_event=None,
+    hedge_attempts=None
+):
+    if not hedge:
+        return _attempt(payload, api_key, stream=stream, on_delta=on_delta, abort_event=abort_event)
+
+    model = payload.get("model", "")
+    outcomes = queue.Queue()
+    race = {"winner": None, "lock": threading.Lock()}
+    attempts = {
+        "primary": _start_attempt(
+            "primary", payload, api_key, outcomes, race, on_extra_usage, stream, on_delta, abort_event, hedge_attempts
+        )
+    }
+    try:
+        name, result, error = outcomes.get(timeout=hedge_delay_for(model))
+    except queue.Empty:
+        name = None
+
+    if name is None and not _request_slots.acquire(blocking=False):
+        # Every request slot is busy; a hedge would go over the global cap.
+        metrics.inc("openrouter_hedges_skipped_total", model=model)
+        name, result, error = outcomes.get()
+
+    if name is not None:
+        if error is not None:
+            raise error
+        return result
+
+    hedge_payload = dict(payload)
+    if hedge_model:
+        hedge_payload["model"] = hedge_model
+    attempts["hedge"] = _start_attempt(
+        "hedge", hedge_payload, api_key, outcomes, race, on_extra_usage, stream, on_delta, abort_event, hedge_attempts,
+        holds_slot=True
+    )
+
+    last_error = None
+    for _ in range(len(attempts)):
+        name, result, error = outcomes.get()
+        if error is not None:
+            last_error = error
+            continue
+        for other_name, cancel_event in attempts.items():
+            if other_name != name:
+                cancel_event.set()
+        result["hedged"] = True
+        result["hedge_won"] = name == "hedge"
+        metrics.inc("openrouter_hedges_total", winner=name)
+        return result
+    raise last_error
+
+def request_fingerprint(payload):
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def _coalescing_key(payload, options):
+    # Followers share the leader's result, so requests only coalesce when
+    # they would also have been sent the same way.
+    hedge = bool(options.get("hedge"))
+    return request_fingerprint({
+        "payload": payload,
+        "stream": bool(options.get("stream")),
+        "hedge": hedge,
+        "hedge_model": (options.get("hedge_model") or "") if hedge else ""
+    })
+
+def _split_usage(value, position, participants):
+    # Integer counters are split so the shares of all participants add up to
+    # the original value exactly; costs are divided evenly.
+    if isinstance(value, dict):
+        return {key: _split_usage(item, position, participants) for key, item in value.items()}
+    if isinstance(value, bool) or participants <= 1:
+        return value
+    if isinstance(value, int):
+        return value * (position + 1) // participants - value * position // participants
+    if isinstance(value, float):
+        return value / participants
+    return value
+
+def inflight_request_count():
+    with _inflight_lock:
+        return len(_inflight_requests)
+
+def send_completion(payload, api_key, coalesce=True, cassette=None, **options):
+    # A replaying cassette answers from disk; a recording one stores what the
+    # job received, including a coalesced follower's share of the usage.
+    if cassette is not None and cassette.replaying:
+        return cassette.replay(payload, abort_event=options.get("abort_event"))
+    try:
+        result = _send_completion(payload, api_key, coalesce, **options)
+    except Exception as e:
+        if cassette is not None:
+            cassette.record_error(payload, e)
+        raise
+    if cassette is not None:
+        cassette.record(payload, result)
+    return result
+
+def _send_completion(payload, api_key, coalesce=True, **options):
+    if not coalesce:
+        result = _dispatch_completion(payload, api_key, **options)
+        result["coalesced"] = False
+        result["shared_with"] = 0
+        return result
+
+    key = _coalescing_key(payload, options)
+    member = object()
+    with _inflight_lock:
+        flight = _inflight_requests.get(key)
+        is_leader = flight is None
+        if is_leader:
+            flight = {"done": threading.Event(), "members": [member], "result": None, "error": None}
+            _inflight_requests[key] = flight
+        else:
+            flight["members"].append(member)
+
+    if is_leader:
+        try:
+            flight["result"] = _dispatch_completion(payload, api_key, **options)
+        except Exception as e:
+            flight["error"] = e
+        finally:
+            with _inflight_lock:
+                _inflight_requests.pop(key, None)
+                flight["done"].set()
+    else:
+        abort_event = options.get("abort_event")
+        while not flight["done"].wait(FOLLOWER_POLL_SECONDS):
+            if abort_event is None or not abort_event.is_set():
+                continue
+            with _inflight_lock:
+                # A follower that leaves takes no share of the usage.
+                if not flight["done"].is_set():
+                    flight["members"].remove(member)
+                    raise RequestCancelled("Request cancelled while waiting for a shared request")
+
+    if flight["error"] is not None:
+        abort_event = options.get("abort_event")
+        if (
+            not is_leader
+            and isinstance(flight["error"], RequestCancelled)
+            and not (abort_event is not None and abort_event.is_set())
+        ):
+            # The leader's job was cancelled; this job still wants the answer.
+            return _send_completion(payload, api_key, coalesce=coalesce, **options)
+        raise flight["error"]
+    participants = len(flight["members"])
+    position = flight["members"].index(member)
+    result = dict(flight["result"])
+    if not is_leader:
+        metrics.inc("openrouter_coalesced_total", model=result.get("model", ""))
+    result["usage"] = _split_usage(result.get("usage") or {}, position, participants)
+    result["coalesced"] = not is_leader
+    result["shared_with"] = participants - 1
+    return result
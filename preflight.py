@@ -0,0 +1,471 @@
+import os, math, struct, time
+from concurrent.futures import ThreadPoolExecutor
+
+TEXT_EXTENSIONS = {".txt", ".md"}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tif", ".tiff"}
+
+BYTES_PER_TEXT_TOKEN = 4
+IMAGE_TILE_SIZE = 512
+IMAGE_BASE_TOKENS = 85
+IMAGE_TILE_TOKENS = 170
+UNKNOWN_IMAGE_TOKENS = 1105
+REQUEST_OVERHEAD_BYTES = 2048
+PER_PART_OVERHEAD_BYTES = 128
+OVERSIZE_POLICIES = ("chunk", "subsample", "reject")
+VALIDATION_WORKERS = 8
+VALIDATION_REPORT_LIMIT = 200
+
+# Limits are matched by the longest model id prefix. max_input_tokens leaves
+# room in the context window for the completion itself.
+MODEL_LIMITS = {
+    "": {"max_input_tokens": 100000, "max_images": 20, "max_request_bytes": 20 * 1024 * 1024},
+    "google/gemini": {"max_input_tokens": 900000, "max_images": 3000, "max_request_bytes": 20 * 1024 * 1024},
+    "openai/gpt-5": {"max_input_tokens": 250000, "max_images": 500, "max_request_bytes": 50 * 1024 * 1024},
+    "anthropic/claude": {"max_input_tokens": 180000, "max_images": 100, "max_request_bytes": 32 * 1024 * 1024},
+    "x-ai/grok-4": {"max_input_tokens": 230000, "max_images": 50, "max_request_bytes": 20 * 1024 * 1024},
+    "mistralai/": {"max_input_tokens": 110000, "max_images": 8, "max_request_bytes": 10 * 1024 * 1024}
+}
+
+def model_limits(model):
+    model = model or ""
+    best_prefix = ""
+    for prefix in MODEL_LIMITS:
+        if model.startswith(prefix) and len(prefix) > len(best_prefix):
+            best_prefix = prefix
+    return dict(MODEL_LIMITS[best_prefix])
+
+def _png_dimensions(header):
+    if header[:8] == b"\x89PNG\r\n\x1a\n" and header[12:16] == b"IHDR":
+        return struct.unpack(">II", header[16:24])
+    return None
+
+def _jpeg_dimensions(f):
+    f.seek(0)
+    if f.read(2) != b"\xff\xd8":
+        return None
+    while True:
+        marker_start = f.read(1)
+        if not marker_start:
+            return None
+        if marker_start != b"\xff":
+            continue
+        marker = f.read(1)
+        while marker == b"\xff":
+            marker = f.read(1)
+        if not marker:
+            return None
+        code = marker[0]
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) != 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if code in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+            data = f.read(5)
+            if len(data) != 5:
+                return None
+            height, width = struct.unpack(">HH", data[1:5])
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+def image_dimensions(path):
+    try:
+        with open(path, "rb") as f:
+            header = f.read(32)
+            dimensions = _png_dimensions(header)
+            if dimensions is None and header[:2] == b"\xff\xd8":
+                dimensions = _jpeg_dimensions(f)
+    except OSError:
+        return None
+    if not dimensions or not all(dimensions):
+        return None
+    return dimensions
+
+def estimate_image_tokens(path):
+    # Approximates high-detail tiling: fit into 2048x2048, scale the short side
+    # to 768, then charge a base cost plus a fixed cost per 512px tile.
+    dimensions = image_dimensions(path)
+    if dimensions is None:
+        return UNKNOWN_IMAGE_TOKENS
+    width, height = (float(value) for value in dimensions)
+    scale = min(1.0, 2048.0 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768.0 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / IMAGE_TILE_SIZE) * math.ceil(height / IMAGE_TILE_SIZE)
+    return IMAGE_BASE_TOKENS + IMAGE_TILE_TOKENS * tiles
+
+def estimate_file(path):
+    ext = os.path.splitext(path)[1].lower()
+    size = os.path.getsize(path)
+    if ext in TEXT_EXTENSIONS:
+        return {
+            "tokens": math.ceil(size / BYTES_PER_TEXT_TOKEN),
+            "images": 0,
+            "bytes": size + PER_PART_OVERHEAD_BYTES
+        }
+    if ext in IMAGE_EXTENSIONS:
+        return {
+            "tokens": estimate_image_tokens(path),
+            "images": 1,
+            "bytes": math.ceil(size / 3) * 4 + PER_PART_OVERHEAD_BYTES
+        }
+    return {"tokens": 0, "images": 0, "bytes": 0}
+
+def _sum_estimates(estimates, base_tokens, base_bytes):
+    return {
+        "tokens": base_tokens + sum(item["tokens"] for item in estimates),
+        "images": sum(item["images"] for item in estimates),
+        "bytes": base_bytes + sum(item["bytes"] for item in estimates)
+    }
+
+def _fits(total, limits):
+    return (
+        total["tokens"] <= limits["max_input_tokens"]
+        and total["images"] <= limits["max_images"]
+        and total["bytes"] <= limits["max_request_bytes"]
+    )
+
+def _describe_overflow(total, limits):
+    reasons = []
+    if total["tokens"] > limits["max_input_tokens"]:
+        reasons.append(f"~{total['tokens']} tokens > {limits['max_input_tokens']}")
+    if total["images"] > limits["max_images"]:
+        reasons.append(f"{total['images']} images > {limits['max_images']}")
+    if total["bytes"] > limits["max_request_bytes"]:
+        reasons.append(f"~{total['bytes']} bytes > {limits['max_request_bytes']}")
+    return ", ".join(reasons)
+
+def _chunk_indices(estimates, limits, base_tokens, base_bytes):
+    chunks = []
+    current = []
+    total = _sum_estimates([], base_tokens, base_bytes)
+    for idx, estimate in enumerate(estimates):
+        candidate_total = {key: total[key] + estimate[key] for key in total}
+        if current and not _fits(candidate_total, limits):
+            chunks.append(current)
+            current = []
+            candidate_total = _sum_estimates([estimate], base_tokens, base_bytes)
+        current.append(idx)
+        total = candidate_total
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _evenly_spaced(count, keep):
+    if keep >= count:
+        return list(range(count))
+    if keep <= 1:
+        return [0]
+    return sorted({round(i * (count - 1) / (keep - 1)) for i in range(keep)})
+
+def _subsample_indices(estimates, limits, base_tokens, base_bytes):
+    low, high = 1, len(estimates)
+    best = [0]
+    while low <= high:
+        keep = (low + high) // 2
+        indices = _evenly_spaced(len(estimates), keep)
+        total = _sum_estimates([estimates[i] for i in indices], base_tokens, base_bytes)
+        if _fits(total, limits):
+            best = indices
+            low = keep + 1
+        else:
+            high = keep - 1
+    return best
+
+def apply_size_limits(groups, model, system_prompt="", policy="chunk"):
+    if policy not in OVERSIZE_POLICIES:
+        policy = "chunk"
+    limits = model_limits(model)
+    prompt_bytes = len((system_prompt or "").encode("utf-8"))
+    base_tokens = math.ceil(prompt_bytes / BYTES_PER_TEXT_TOKEN)
+    base_bytes = REQUEST_OVERHEAD_BYTES + prompt_bytes
+
+    planned = []
+    report = []
+    for group in groups:
+        if not group["files"]:
+            planned.append(group)
+            continue
+        estimates = [estimate_file(fpath) for fpath in group["files"]]
+        total = _sum_estimates(estimates, base_tokens, base_bytes)
+        if _fits(total, limits):
+            planned.append(group)
+            continue
+
+        entry = {
+            "group": group["id"],
+            "files": len(group["files"]),
+            "estimated_tokens": total["tokens"],
+            "estimated_images": total["images"],
+            "estimated_bytes": total["bytes"],
+            "reason": _describe_overflow(total, limits),
+            "action": policy
+        }
+        if policy == "subsample" and len(group["files"]) > 1:
+            indices = _subsample_indices(estimates, limits, base_tokens, base_bytes)
+            kept = _sum_estimates([estimates[i] for i in indices], base_tokens, base_bytes)
+            if _fits(kept, limits):
+                planned.append(dict(group, files=[group["files"][i] for i in indices]))
+                entry["kept_files"] = len(indices)
+                report.append(entry)
+                continue
+        elif policy == "chunk" and len(group["files"]) > 1:
+            chunks = _chunk_indices(estimates, limits, base_tokens, base_bytes)
+            base_id = group["id"].rstrip("/")
+            suffix = "/" if group["is_folder"] else ""
+            for part, indices in enumerate(chunks, start=1):
+                part_group = dict(
+                    group,
+                    id=f"{base_id}__part{part}{suffix}",
+                    files=[group["files"][i] for i in indices]
+                )
+                part_total = _sum_estimates([estimates[i] for i in indices], base_tokens, base_bytes)
+                if not _fits(part_total, limits):
+                    part_group["skip_reason"] = (
+                        f"Group exceeds model limits ({_describe_overflow(part_total, limits)})"
+                    )
+                planned.append(part_group)
+            entry["parts"] = len(chunks)
+            report.append(entry)
+            continue
+
+        entry["action"] = "reject"
+        planned.append(dict(group, skip_reason=f"Group exceeds model limits ({entry['reason']})"))
+        report.append(entry)
+    return planned, report
+
+def sniff_mime(header):
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header.startswith((b"II*\x00", b"MM\x00*")):
+        return "image/tiff"
+    if header.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if header.startswith(b"RIFF") and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header.startswith(b"%PDF"):
+        return "application/pdf"
+    if header.startswith(b"PK\x03\x04"):
+        return "application/zip"
+    return None
+
+SCAN_CHUNK_BYTES = 1024 * 1024
+_TIFF_TYPE_FORMATS = {3: ("H", 2), 4: ("I", 4), 16: ("Q", 8)}
+_TIFF_EXTENT_TAGS = ((273, 279), (324, 325))
+
+def _png_is_complete(f, size):
+    # Walks the chunk list; anything after IEND (trailers, padding) is fine.
+    offset = 8
+    while offset + 8 <= size:
+        f.seek(offset)
+        length, chunk_type = struct.unpack(">I4s", f.read(8))
+        offset += 12 + length
+        if chunk_type == b"IEND":
+            return offset <= size
+    return False
+
+def _jpeg_is_complete(f, size):
+    # Segments are skipped by length up to the start of scan, so an EXIF
+    # thumbnail's markers are never mistaken for the main image's. Entropy-
+    # coded data escapes 0xFF bytes, so the first FFD9 after that is the end
+    # of the image, whatever trailing data follows it.
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) != 2 or marker[0] != 0xFF:
+            return False
+        if marker[1] == 0xDA:
+            break
+        length_bytes = f.read(2)
+        if len(length_bytes) != 2:
+            return False
+        f.seek(struct.unpack(">H", length_bytes)[0] - 2, os.SEEK_CUR)
+    data = b""
+    while True:
+        chunk = f.read(SCAN_CHUNK_BYTES)
+        if not chunk:
+            return False
+        data = data[-1:] + chunk
+        if b"\xff\xd9" in data:
+            return True
+
+def _tiff_values(f, fmt, value_type, count, value_field):
+    code, width = _TIFF_TYPE_FORMATS[value_type]
+    if count * width > len(value_field):
+        f.seek(struct.unpack(fmt + ("Q" if len(value_field) == 8 else "I"), value_field)[0])
+        raw = f.read(count * width)
+    else:
+        raw = value_field[:count * width]
+    if len(raw) != count * width:
+        return None
+    return struct.unpack(fmt + code * count, raw)
+
+def _tiff_is_complete(f, size):
+    # Checks that the first image's strips or tiles lie inside the file.
+    f.seek(0)
+    header = f.read(16)
+    fmt = "<" if header[:2] == b"II" else ">"
+    big = struct.unpack(fmt + "H", header[2:4])[0] == 43
+    if big:
+        ifd_offset = struct.unpack(fmt + "Q", header[8:16])[0]
+        count_format, entry_size = "Q", 20
+    else:
+        ifd_offset = struct.unpack(fmt + "I", header[4:8])[0]
+        count_format, entry_size = "H", 12
+    f.seek(ifd_offset)
+    count_bytes = f.read(struct.calcsize(count_format))
+    if len(count_bytes) != struct.calcsize(count_format):
+        return False
+    entry_count = struct.unpack(fmt + count_format, count_bytes)[0]
+    entries = f.read(entry_count * entry_size)
+    if len(entries) != entry_count * entry_size:
+        return False
+    fields = {}
+    for idx in range(entry_count):
+        entry = entries[idx * entry_size:(idx + 1) * entry_size]
+        if big:
+            tag, value_type, count = struct.unpack(fmt + "HHQ", entry[:12])
+            value_field = entry[12:]
+        else:
+            tag, value_type, count = struct.unpack(fmt + "HHI", entry[:8])
+            value_field = entry[8:]
+        fields[tag] = (value_type, count, value_field)
+    for offsets_tag, counts_tag in _TIFF_EXTENT_TAGS:
+        if offsets_tag not in fields or counts_tag not in fields:
+            continue
+        if any(fields[tag][0] not in _TIFF_TYPE_FORMATS for tag in (offsets_tag, counts_tag)):
+            return True
+        offsets = _tiff_values(f, fmt, *fields[offsets_tag])
+        counts = _tiff_values(f, fmt, *fields[counts_tag])
+        if offsets is None or counts is None:
+            return False
+        return all(offset + count <= size for offset, count in zip(offsets, counts))
+    return True
+
+def _image_is_truncated(path, mime, size):
+    checks = {"image/jpeg": _jpeg_is_complete, "image/png": _png_is_complete, "image/tiff": _tiff_is_complete}
+    check = checks.get(mime)
+    if check is None:
+        return False
+    try:
+        with open(path, "rb") as f:
+            return not check(f, size)
+    except (OSError, struct.error):
+        return True
+
+def validate_file(path, max_text_bytes=None):
+    ext = os.path.splitext(path)[1].lower()
+    result = {"path": path, "mime": None, "issue": None, "warning": None, "supported": True}
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            header = f.read(32)
+    except OSError as e:
+        result["issue"] = f"unreadable: {e}"
+        return result
+    result["mime"] = sniff_mime(header)
+
+    if ext in TEXT_EXTENSIONS:
+        if result["mime"] is not None:
+            result["issue"] = f"text file contains {result['mime']} data"
+            return result
+        if max_text_bytes is not None and size > max_text_bytes:
+            result["issue"] = f"text file is {size} bytes"
+            return result
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                f.read()
+        except UnicodeDecodeError as e:
+            result["issue"] = f"not valid UTF-8 at byte {e.start}"
+            return result
+        result["mime"] = "text/plain"
+    elif ext in IMAGE_EXTENSIONS:
+        if size == 0:
+            result["issue"] = "empty image"
+        elif result["mime"] is None or not result["mime"].startswith("image/"):
+            result["issue"] = "not a recognised image format"
+        elif _image_is_truncated(path, result["mime"], size):
+            # A false positive would silently drop a good page, so suspect
+            # images are reported but still sent.
+            result["warning"] = "image appears truncated"
+    else:
+        result["supported"] = False
+    return result
+
+def validate_groups(groups, input_dir, max_workers=VALIDATION_WORKERS):
+    started = time.monotonic()
+    paths = sorted({fpath for group in groups for fpath in group["files"]})
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = {item["path"]: item for item in pool.map(validate_file, paths)}
+
+    def rel(path):
+        return os.path.relpath(path, input_dir).replace(os.sep, "/")
+
+    invalid_files = []
+    suspect_files = []
+    unsupported_files = []
+    mime_mismatches = 0
+    for path in paths:
+        item = results[path]
+        if item["issue"]:
+            invalid_files.append({"file": rel(path), "issue": item["issue"]})
+        if item["warning"]:
+            suspect_files.append({"file": rel(path), "issue": item["warning"]})
+        elif not item["supported"]:
+            unsupported_files.append(rel(path))
+        elif item["mime"] and item["mime"].startswith("image/"):
+            ext = os.path.splitext(path)[1].lower().lstrip(".")
+            expected = {"jpg": "jpeg", "tif": "tiff"}.get(ext, ext)
+            if item["mime"] != f"image/{expected}":
+                mime_mismatches += 1
+
+    validated_groups = []
+    flagged_groups = []
+    for group in groups:
+        if not group["files"]:
+            flagged_groups.append({"group": group["id"], "issue": "empty group"})
+            validated_groups.append(group)
+            continue
+        if group.get("skip_reason"):
+            flagged_groups.append({"group": group["id"], "issue": group["skip_reason"]})
+            validated_groups.append(group)
+            continue
+        sendable = [
+            fpath for fpath in group["files"]
+            if not results[fpath]["issue"] and results[fpath]["supported"]
+        ]
+        dropped = [fpath for fpath in group["files"] if results[fpath]["issue"]]
+        if not sendable:
+            issues = "; ".join(f"{rel(fpath)}: {results[fpath]['issue']}" for fpath in dropped[:5])
+            reason = f"Validation failed ({issues})" if issues else "No supported files"
+            flagged_groups.append({"group": group["id"], "issue": reason})
+            validated_groups.append(dict(group, skip_reason=reason) if dropped else group)
+            continue
+        if dropped:
+            flagged_groups.append({
+                "group": group["id"],
+                "issue": f"{len(dropped)} invalid file(s) left out of the request"
+            })
+            group = dict(group, files=sendable, dropped_files=[rel(fpath) for fpath in dropped])
+        validated_groups.append(group)
+
+    report = {
+        "checked_files": len(paths),
+        "valid_files": sum(1 for item in results.values() if not item["issue"] and item["supported"]),
+        "invalid_file_count": len(invalid_files),
+        "suspect_file_count": len(suspect_files),
+        "unsupported_file_count": len(unsupported_files),
+        "mime_mismatches": mime_mismatches,
+        "flagged_group_count": len(flagged_groups),
+        "invalid_files": invalid_files[:VALIDATION_REPORT_LIMIT],
+        "suspect_files": suspect_files[:VALIDATION_REPORT_LIMIT],
+        "unsupported_files": unsupported_files[:VALIDATION_REPORT_LIMIT],
+        "flagged_groups": flagged_groups[:VALIDATION_REPORT_LIMIT],
+        "elapsed_seconds": round(time.monotonic() - started, 3)
+    }
+    file_mimes = {path: item["mime"] for path, item in results.items() if item["mime"]}
+    return validated_groups, report, file_mimes
@@ -0,0 +1,144 @@
+import os, io, csv, json, zipfile, threading
+from collections import OrderedDict
+
+# Read-only access to results_*.zip members without extracting the archive.
+# Open archives are cached with their parsed central directory, keyed by path
+# and invalidated when the file's size or mtime changes.
+
+RESULTS_ARCHIVE_CACHE_SIZE = 32
+MEMBER_CHUNK_BYTES = 64 * 1024
+MAX_PAGE_SIZE = 1000
+JSON_READ_CHARS = 64 * 1024
+
+_archives = OrderedDict()
+_archives_lock = threading.Lock()
+
+def _archive_stamp(zip_path):
+    stat = os.stat(zip_path)
+    return stat.st_size, stat.st_mtime_ns
+
+def _open_archive(zip_path):
+    stamp = _archive_stamp(zip_path)
+    with _archives_lock:
+        cached = _archives.get(zip_path)
+        if cached is not None and cached["stamp"] == stamp:
+            _archives.move_to_end(zip_path)
+            return cached
+    archive = zipfile.ZipFile(zip_path, "r")
+    members = [
+        {
+            "name": info.filename,
+            "size": info.file_size,
+            "compressed_size": info.compress_size,
+            "modified_at": "%04d-%02d-%02d %02d:%02d:%02d" % info.date_time
+        }
+        for info in archive.infolist()
+        if not info.is_dir()
+    ]
+    cached = {"stamp": stamp, "archive": archive, "members": members}
+    with _archives_lock:
+        previous = _archives.pop(zip_path, None)
+        _archives[zip_path] = cached
+        evicted = [previous] if previous is not None else []
+        while len(_archives) > RESULTS_ARCHIVE_CACHE_SIZE:
+            evicted.append(_archives.popitem(last=False)[1])
+    # ZipFile.close leaves members that are still being streamed readable.
+    for entry in evicted:
+        entry["archive"].close()
+    return cached
+
+def list_results_members(zip_path, offset=0, limit=100, prefix=""):
+    members = _open_archive(zip_path)["members"]
+    if prefix:
+        members = [member for member in members if member["name"].startswith(prefix)]
+    offset = max(0, offset)
+    limit = max(1, min(MAX_PAGE_SIZE, limit))
+    return {
+        "total": len(members),
+        "offset": offset,
+        "limit": limit,
+        "members": members[offset:offset + limit]
+    }
+
+def results_member_info(zip_path, name):
+    archive = _open_archive(zip_path)["archive"]
+    try:
+        return archive.getinfo(name)
+    except KeyError:
+        return None
+
+def iter_results_member(zip_path, name):
+    archive = _open_archive(zip_path)["archive"]
+    with archive.open(name, "r") as src:
+        while True:
+            chunk = src.read(MEMBER_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+def _iter_json_array(text_stream):
+    # Decodes one array element at a time, so a slice near the start of a
+    # large output.json never loads the rest of it.
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    started = False
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position >= len(buffer) and not eof:
+            chunk = text_stream.read(JSON_READ_CHARS)
+            buffer = buffer[position:] + chunk
+            position = 0
+            eof = not chunk
+            continue
+        if position >= len(buffer):
+            return
+        if not started:
+            if buffer[position] != "[":
+                raise ValueError("Expected a JSON array")
+            started = True
+            position += 1
+            continue
+        if buffer[position] == "]":
+            return
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except ValueError:
+            if eof:
+                raise
+            chunk = text_stream.read(JSON_READ_CHARS)
+            buffer = buffer[position:] + chunk
+            position = 0
+            eof = not chunk
+            continue
+        yield value
+        position = end
+
+def read_results_rows(zip_path, name, start=0, stop=100):
+    # Rows [start, stop) of a CSV or JSON-array member. One extra row is read
+    # to tell the caller whether more follow.
+    start = max(0, start)
+    stop = max(start, min(stop, start + MAX_PAGE_SIZE))
+    archive = _open_archive(zip_path)["archive"]
+    rows = []
+    columns = None
+    has_more = False
+    with archive.open(name, "r") as raw:
+        text_stream = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+        if name.lower().endswith(".csv"):
+            reader = csv.reader(text_stream)
+            columns = next(reader, [])
+            records = (dict(zip(columns, record)) for record in reader)
+        elif name.lower().endswith(".json"):
+            records = _iter_json_array(text_stream)
+        else:
+            raise ValueError("Row ranges are only available for .csv and .json members")
+        for idx, record in enumerate(records):
+            if idx >= stop:
+                has_more = True
+                break
+            if idx >= start:
+                rows.append(record)
+    return {"columns": columns, "start": start, "stop": start + len(rows), "has_more": has_more, "rows": rows}
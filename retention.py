@@ -0,0 +1,120 @@
+import os, time, shutil
+
+# Retention planning for data/jobs and data/zips. A plan is computed from a
+# snapshot of the directories and then applied by app.run_retention, which
+# owns the registry lock and knows which jobs are still active.
+
+LAST_ACCESS_FILE = ".last_access"
+TRASH_DIR_NAME = ".trash"
+DAY_SECONDS = 24 * 3600
+
+def touch_last_access(path):
+    # Directory mtimes only move when files are added, and atime is usually
+    # disabled, so reads are recorded in a marker file.
+    marker = os.path.join(path, LAST_ACCESS_FILE)
+    try:
+        with open(marker, "a"):
+            pass
+        os.utime(marker, None)
+    except OSError:
+        pass
+
+def _directory_bytes(path):
+    total = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                continue
+    return total
+
+def _job_last_access(job_dir):
+    stamps = [os.path.getmtime(job_dir)]
+    marker = os.path.join(job_dir, LAST_ACCESS_FILE)
+    if os.path.isfile(marker):
+        stamps.append(os.path.getmtime(marker))
+    return max(stamps)
+
+def scan_jobs(jobs_folder):
+    entries = []
+    if not os.path.isdir(jobs_folder):
+        return entries
+    for job_id in os.listdir(jobs_folder):
+        job_dir = os.path.join(jobs_folder, job_id)
+        if job_id == TRASH_DIR_NAME or not os.path.isdir(job_dir):
+            continue
+        try:
+            entries.append({
+                "name": job_id,
+                "bytes": _directory_bytes(job_dir),
+                "last_access": _job_last_access(job_dir)
+            })
+        except OSError:
+            continue
+    return entries
+
+def scan_zips(zips_folder, registry_entries):
+    last_used = {
+        entry.get("zip_name"): float(entry.get("last_used_at") or 0)
+        for entry in registry_entries
+    }
+    entries = []
+    if not os.path.isdir(zips_folder):
+        return entries
+    for filename in os.listdir(zips_folder):
+        zip_path = os.path.join(zips_folder, filename)
+        if not filename.lower().endswith(".zip") or not os.path.isfile(zip_path):
+            continue
+        try:
+            entries.append({
+                "name": filename,
+                "bytes": os.path.getsize(zip_path),
+                "last_access": max(os.path.getmtime(zip_path), last_used.get(filename, 0.0))
+            })
+        except OSError:
+            continue
+    return entries
+
+def plan_evictions(entries, protected, max_age_days=0, max_count=0, max_bytes=0, grace_seconds=0, now=None):
+    # Age first, then least recently used until the count and byte limits
+    # hold. A limit of 0 is off. Protected entries, and entries used within
+    # the grace period, are never evicted but still count towards the limits.
+    now = time.time() if now is None else now
+    protected = set(protected) | {
+        entry["name"] for entry in entries if now - entry["last_access"] < grace_seconds
+    }
+    evict = []
+    kept = []
+    for entry in sorted(entries, key=lambda item: item["last_access"]):
+        age_days = (now - entry["last_access"]) / DAY_SECONDS
+        if max_age_days and age_days > max_age_days and entry["name"] not in protected:
+            evict.append(dict(entry, reason=f"not accessed for {age_days:.0f} days"))
+        else:
+            kept.append(entry)
+
+    count = len(kept)
+    total_bytes = sum(entry["bytes"] for entry in kept)
+    for entry in kept:
+        over_count = max_count and count > max_count
+        over_bytes = max_bytes and total_bytes > max_bytes
+        if (over_count or over_bytes) and entry["name"] not in protected:
+            evict.append(dict(entry, reason="over the count limit" if over_count else "over the size limit"))
+            count -= 1
+            total_bytes -= entry["bytes"]
+    return evict, {"count": count, "bytes": total_bytes}
+
+def remove_job_directory(jobs_folder, job_id):
+    # The directory is renamed out of data/jobs first, so listings never see
+    # a half-deleted job.
+    trash_dir = os.path.join(jobs_folder, TRASH_DIR_NAME)
+    os.makedirs(trash_dir, exist_ok=True)
+    target = os.path.join(trash_dir, f"{job_id}_{time.time_ns()}")
+    os.rename(os.path.join(jobs_folder, job_id), target)
+    shutil.rmtree(target, ignore_errors=True)
+
+def empty_trash(jobs_folder):
+    trash_dir = os.path.join(jobs_folder, TRASH_DIR_NAME)
+    if os.path.isdir(trash_dir):
+        for name in os.listdir(trash_dir):
+            shutil.rmtree(os.path.join(trash_dir, name), ignore_errors=True)
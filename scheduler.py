@@ -0,0 +1,185 @@
+import threading, time
+from collections import deque
+from concurrent.futures import Future
+from config import MAX_CONCURRENT_REQUESTS, SCHEDULER_ROUTE_WEIGHTS, SCHEDULER_USER_WEIGHTS
+
+PRIORITIES = {"low": -1, "normal": 0, "high": 1}
+MIN_WEIGHT = 0.01
+
+def parse_weights(spec):
+    weights = {}
+    for item in str(spec or "").split(","):
+        name, _, value = item.partition("=")
+        try:
+            weights[name.strip()] = max(MIN_WEIGHT, float(value))
+        except ValueError:
+            continue
+    return weights
+
+ROUTE_WEIGHTS = parse_weights(SCHEDULER_ROUTE_WEIGHTS)
+USER_WEIGHTS = parse_weights(SCHEDULER_USER_WEIGHTS)
+
+def job_weight(route, user=""):
+    return ROUTE_WEIGHTS.get(route or "", 1.0) * USER_WEIGHTS.get(user or "", 1.0)
+
+class FairShareScheduler:
+    # Requests (not whole jobs) are the unit of dispatch. Within the highest
+    # priority that has queued work, jobs are served by stride scheduling: the
+    # job with the lowest pass value goes next and its pass advances by
+    # 1 / weight, so each job gets capacity in proportion to its weight.
+
+    def __init__(self, max_concurrency):
+        self._condition = threading.Condition()
+        self._jobs = {}
+        self._running = 0
+        self._max_concurrency = max(1, int(max_concurrency))
+        self._threads = []
+        for idx in range(self._max_concurrency):
+            thread = threading.Thread(target=self._worker_loop, name=f"dispatch-{idx}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def register_job(self, job_id, priority=0, weight=1.0, label=""):
+        with self._condition:
+            if job_id in self._jobs:
+                return
+            active_passes = [job["pass"] for job in self._jobs.values() if job["queue"]]
+            self._jobs[job_id] = {
+                "queue": deque(),
+                "priority": int(priority),
+                "weight": max(MIN_WEIGHT, float(weight)),
+                "pass": min(active_passes) if active_passes else 0.0,
+                "running": 0,
+                "dispatched": 0,
+                "paused": False,
+                "cancelled": False,
+                "label": label,
+                "registered_at": time.time()
+            }
+
+    def unregister_job(self, job_id):
+        with self._condition:
+            job = self._jobs.pop(job_id, None)
+        if job is None:
+            return
+        for future, _, _, _ in job["queue"]:
+            future.cancel()
+
+    def pause_job(self, job_id, paused=True):
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            if job["paused"] and not paused:
+                active_passes = [
+                    other["pass"] for other in self._jobs.values()
+                    if other["queue"] and not other["paused"]
+                ]
+                if active_passes:
+                    job["pass"] = max(job["pass"], min(active_passes))
+            job["paused"] = bool(paused)
+            self._condition.notify_all()
+            return True
+
+    def cancel_job(self, job_id):
+        # Queued tasks are cancelled and later submissions are refused, so the
+        # job's share of the dispatch slots goes straight to the other jobs.
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            job["cancelled"] = True
+            queued = list(job["queue"])
+            job["queue"].clear()
+        for future, _, _, _ in queued:
+            future.cancel()
+        return True
+
+    def submit(self, job_id, fn, *args, **kwargs):
+        future = Future()
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None:
+                raise KeyError(f"Job {job_id} is not registered with the scheduler")
+            if job["cancelled"]:
+                future.cancel()
+                return future
+            if not job["queue"]:
+                # A job that was idle must not bank credit and then burst ahead.
+                active_passes = [other["pass"] for other in self._jobs.values() if other["queue"]]
+                if active_passes:
+                    job["pass"] = max(job["pass"], min(active_passes))
+            job["queue"].append((future, fn, args, kwargs))
+            self._condition.notify()
+        return future
+
+    def _next_task_unlocked(self):
+        runnable = [(job_id, job) for job_id, job in self._jobs.items() if job["queue"] and not job["paused"]]
+        if not runnable:
+            return None
+        top_priority = max(job["priority"] for _, job in runnable)
+        job_id, job = min(
+            ((job_id, job) for job_id, job in runnable if job["priority"] == top_priority),
+            key=lambda item: (item[1]["pass"], item[1]["registered_at"])
+        )
+        job["pass"] += 1.0 / job["weight"]
+        job["running"] += 1
+        job["dispatched"] += 1
+        self._running += 1
+        return job_id, job["queue"].popleft()
+
+    def _worker_loop(self):
+        while True:
+            with self._condition:
+                task = self._next_task_unlocked()
+                while task is None:
+                    self._condition.wait()
+                    task = self._next_task_unlocked()
+            job_id, (future, fn, args, kwargs) = task
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self._condition:
+                    self._running -= 1
+                    job = self._jobs.get(job_id)
+                    if job is not None:
+                        job["running"] -= 1
+
+    def job_snapshot(self, job_id):
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {
+                "queued": len(job["queue"]),
+                "running": job["running"],
+                "dispatched": job["dispatched"],
+                "paused": job["paused"],
+                "cancelled": job["cancelled"]
+            }
+
+    def snapshot(self):
+        with self._condition:
+            return {
+                "max_concurrency": self._max_concurrency,
+                "running": self._running,
+                "queued": sum(len(job["queue"]) for job in self._jobs.values()),
+                "jobs": {
+                    job_id: {
+                        "label": job["label"],
+                        "priority": job["priority"],
+                        "weight": job["weight"],
+                        "paused": job["paused"],
+                        "queued": len(job["queue"]),
+                        "running": job["running"],
+                        "dispatched": job["dispatched"]
+                    }
+                    for job_id, job in self._jobs.items()
+                }
+            }
+
+scheduler = FairShareScheduler(MAX_CONCURRENT_REQUESTS)
@@ -0,0 +1,222 @@
+import os, re, io, csv, sys, json, time, sqlite3, zipfile, argparse
+from config import SEARCH_INDEX_PATH, UPLOAD_FOLDER
+
+# Full-text index over the per-group outputs of finished jobs, in one SQLite
+# FTS5 table. Title and author are pulled out of Aleph Sequential records so
+# they can be searched on their own; other outputs only fill `output`.
+
+SEARCH_FIELDS = ("title", "author", "file", "output")
+MAX_SEARCH_LIMIT = 200
+_ALEPH_LINE_RE = re.compile(r"^\d{9}\s+(\d{3})\S*\s+L\s+(.*)$")
+_SUBFIELD_RE = re.compile(r"\$\$([0-9a-z])")
+_TITLE_TAGS = {"245", "246"}
+_AUTHOR_TAGS = {"100", "110", "700", "710", "720"}
+_TERM_RE = re.compile(r"\w+\*?", re.UNICODE)
+
+def _connect():
+    os.makedirs(os.path.dirname(SEARCH_INDEX_PATH), exist_ok=True)
+    conn = sqlite3.connect(SEARCH_INDEX_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS outputs USING fts5("
+        "job_id UNINDEXED, file, model UNINDEXED, route UNINDEXED, title, author, output, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS indexed_jobs ("
+        "job_id TEXT PRIMARY KEY, "
+        "results_zip TEXT NOT NULL DEFAULT '', "
+        "source TEXT NOT NULL, "
+        "rows INTEGER NOT NULL, "
+        "indexed_at REAL NOT NULL)"
+    )
+    return conn
+
+def _subfield_text(value, codes):
+    # "$$aTitle :$$bsubtitle /$$cAuthor" -> "Title : subtitle" for codes "ab".
+    parts = _SUBFIELD_RE.split(value)
+    texts = [parts[idx + 1].strip() for idx in range(1, len(parts) - 1, 2) if parts[idx] in codes]
+    return " ".join(text for text in texts if text).strip(" /:;,.")
+
+def extract_record_fields(output):
+    titles = []
+    authors = []
+    for line in str(output or "").splitlines():
+        match = _ALEPH_LINE_RE.match(line.strip())
+        if not match:
+            continue
+        tag, value = match.groups()
+        if tag in _TITLE_TAGS:
+            titles.append(_subfield_text(value, "ab"))
+        elif tag in _AUTHOR_TAGS:
+            authors.append(_subfield_text(value, "a"))
+    return "\n".join(filter(None, titles)), "\n".join(filter(None, authors))
+
+def index_job_rows(job_id, rows, route="", default_model="", results_zip="", source="job"):
+    # Replaces whatever was indexed for the job, so a retried job never
+    # leaves the outputs of its earlier run behind.
+    records = []
+    for row in rows:
+        output = "" if row.get("output") is None else str(row["output"])
+        if not output or output.startswith("ERROR:"):
+            continue
+        title, author = extract_record_fields(output)
+        records.append((job_id, row.get("file", ""), row.get("model") or default_model, route, title, author, output))
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM outputs WHERE job_id = ?", (job_id,))
+        conn.executemany(
+            "INSERT INTO outputs (job_id, file, model, route, title, author, output) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            records
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO indexed_jobs (job_id, results_zip, source, rows, indexed_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, results_zip, source, len(records), time.time())
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return len(records)
+
+def forget_job_outputs(job_id):
+    if not os.path.exists(SEARCH_INDEX_PATH):
+        return
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM outputs WHERE job_id = ?", (job_id,))
+        conn.execute("DELETE FROM indexed_jobs WHERE job_id = ?", (job_id,))
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+def _match_expression(query, field=None):
+    # User input is reduced to quoted terms (with an optional trailing * for
+    # prefixes), so FTS5 query syntax in it cannot raise or change meaning.
+    terms = []
+    for term in _TERM_RE.findall(query or ""):
+        prefix = term.endswith("*")
+        word = term.rstrip("*")
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    if not terms:
+        return None
+    expression = " ".join(terms)
+    return f"{field} : ({expression})" if field in SEARCH_FIELDS else expression
+
+def search_outputs(query, field=None, limit=20, offset=0):
+    expression = _match_expression(query, field)
+    limit = max(1, min(MAX_SEARCH_LIMIT, limit))
+    offset = max(0, offset)
+    if expression is None or not os.path.exists(SEARCH_INDEX_PATH):
+        return {"query": query, "field": field, "total": 0, "results": []}
+    conn = _connect()
+    try:
+        total = conn.execute("SELECT COUNT(*) FROM outputs WHERE outputs MATCH ?", (expression,)).fetchone()[0]
+        rows = conn.execute(
+            "SELECT job_id, file, model, route, title, author, "
+            "snippet(outputs, 6, '[', ']', '...', 16) AS snippet, bm25(outputs) AS score "
+            "FROM outputs WHERE outputs MATCH ? ORDER BY score LIMIT ? OFFSET ?",
+            (expression, limit, offset)
+        ).fetchall()
+    finally:
+        conn.close()
+    return {
+        "query": query,
+        "field": field,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "results": [dict(row, score=round(row["score"], 4)) for row in rows]
+    }
+
+def _rows_from_results_zip(zip_path):
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        names = set(zf.namelist())
+        if "output.csv" in names:
+            with zf.open("output.csv") as raw:
+                return list(csv.DictReader(io.TextIOWrapper(raw, encoding="utf-8", newline="")))
+        if "output.json" in names:
+            with zf.open("output.json") as raw:
+                return [
+                    {"file": row.get("file_name", ""), "output": row.get("raw_output", ""), "model": row.get("model")}
+                    for row in json.load(raw)
+                ]
+        # Text-only results: one output_texts member per group.
+        return [
+            {"file": os.path.splitext(name)[0], "output": zf.read(name).decode("utf-8", errors="replace")}
+            for name in sorted(names)
+            if name.endswith(".txt") and name != "results_concatenated.txt"
+        ]
+
+def _indexed_zips(conn):
+    return {row["job_id"]: row["results_zip"] for row in conn.execute("SELECT job_id, results_zip FROM indexed_jobs")}
+
+def backfill_search_index(jobs_folder=UPLOAD_FOLDER, force=False):
+    # Indexes each job's latest results ZIP unless that same ZIP is already
+    # indexed, so it can be rerun cheaply after new archives appear.
+    conn = _connect()
+    try:
+        indexed = _indexed_zips(conn)
+    finally:
+        conn.close()
+    report = {"jobs": 0, "rows": 0, "skipped": 0, "errors": []}
+    if not os.path.isdir(jobs_folder):
+        return report
+    for job_id in sorted(os.listdir(jobs_folder)):
+        job_dir = os.path.join(jobs_folder, job_id)
+        if job_id.startswith(".") or not os.path.isdir(job_dir):
+            continue
+        zips = [name for name in os.listdir(job_dir) if name.startswith("results_") and name.endswith(".zip")]
+        if not zips:
+            continue
+        results_zip = max(zips)
+        if not force and indexed.get(job_id) == results_zip:
+            report["skipped"] += 1
+            continue
+        meta = {}
+        try:
+            with open(os.path.join(job_dir, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            pass
+        try:
+            rows = _rows_from_results_zip(os.path.join(job_dir, results_zip))
+            report["rows"] += index_job_rows(
+                job_id,
+                rows,
+                route=meta.get("source_route", ""),
+                default_model=meta.get("model", ""),
+                results_zip=results_zip,
+                source="backfill"
+            )
+            report["jobs"] += 1
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile, sqlite3.Error) as e:
+            report["errors"].append({"job_id": job_id, "error": str(e)})
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Search or backfill the cross-job output index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill = subparsers.add_parser("backfill", help="index existing results_*.zip archives")
+    backfill.add_argument("--force", action="store_true", help="reindex jobs that are already indexed")
+    search = subparsers.add_parser("search", help="query the index")
+    search.add_argument("query")
+    search.add_argument("--field", choices=SEARCH_FIELDS)
+    search.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        report = backfill_search_index(force=args.force)
+    else:
+        report = search_outputs(args.query, field=args.field, limit=args.limit)
+    json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+    print()
+
+if __name__ == "__main__":
+    main()
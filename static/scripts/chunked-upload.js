@@ -0,0 +1,320 @@
+(() => {
+  const form = document.querySelector("form");
+  const zipField = document.querySelector('input[name="zipfile"]');
+  if (!form || !zipField || !window.fetch || !window.Blob || !Blob.prototype.slice) {
+    return;
+  }
+
+  // Every file is hashed in the browser before its first byte is sent, so a
+  // ZIP the server already has is not uploaded at all. SubtleCrypto only
+  // hashes whole buffers, so larger files are hashed here slice by slice.
+  const HASH_IN_MEMORY_BYTES = 256 * 1024 * 1024;
+  const HASH_SLICE_BYTES = 8 * 1024 * 1024;
+  const MAX_RETRIES = 8;
+  const REGISTER_POLL_MS = 1000;
+  const STORAGE_PREFIX = "chunked_upload_";
+
+  const pathname = window.location.pathname || "";
+  const trimmedPath = pathname.replace(/\/+$/, "");
+  const isMarc = trimmedPath.endsWith("/marc");
+  const appBase = isMarc ? trimmedPath.slice(0, -"/marc".length) : trimmedPath;
+  const uploadsUrl = `${appBase || ""}/uploads`;
+
+  const translate = (key, vars, fallback) => {
+    const i18n = window.formCacheI18n;
+    if (i18n && typeof i18n.t === "function") {
+      return String(i18n.t(key, vars));
+    }
+    return fallback;
+  };
+
+  let statusElement = document.getElementById("upload-status");
+  if (!statusElement) {
+    statusElement = document.createElement("p");
+    statusElement.id = "upload-status";
+    statusElement.className = "existing-zip-status";
+    statusElement.setAttribute("aria-live", "polite");
+    zipField.insertAdjacentElement("afterend", statusElement);
+  }
+  const setStatus = (text) => {
+    statusElement.textContent = text;
+  };
+
+  const formatMb = (bytes) => (bytes / (1024 * 1024)).toFixed(1);
+  const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+  const SHA256_K = new Int32Array([
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
+  ]);
+
+  const createSha256 = () => {
+    const state = new Int32Array([
+      0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19
+    ]);
+    const words = new Int32Array(64);
+    const block = new Uint8Array(64);
+    let blockLength = 0;
+    let totalBytes = 0;
+
+    const compress = (bytes, start) => {
+      for (let i = 0; i < 16; i += 1) {
+        const j = start + i * 4;
+        words[i] = (bytes[j] << 24) | (bytes[j + 1] << 16) | (bytes[j + 2] << 8) | bytes[j + 3];
+      }
+      for (let i = 16; i < 64; i += 1) {
+        const x = words[i - 15];
+        const y = words[i - 2];
+        const s0 = ((x >>> 7) | (x << 25)) ^ ((x >>> 18) | (x << 14)) ^ (x >>> 3);
+        const s1 = ((y >>> 17) | (y << 15)) ^ ((y >>> 19) | (y << 13)) ^ (y >>> 10);
+        words[i] = (words[i - 16] + s0 + words[i - 7] + s1) | 0;
+      }
+      let a = state[0];
+      let b = state[1];
+      let c = state[2];
+      let d = state[3];
+      let e = state[4];
+      let f = state[5];
+      let g = state[6];
+      let h = state[7];
+      for (let i = 0; i < 64; i += 1) {
+        const s1 = ((e >>> 6) | (e << 26)) ^ ((e >>> 11) | (e << 21)) ^ ((e >>> 25) | (e << 7));
+        const t1 = (h + s1 + ((e & f) ^ (~e & g)) + SHA256_K[i] + words[i]) | 0;
+        const s0 = ((a >>> 2) | (a << 30)) ^ ((a >>> 13) | (a << 19)) ^ ((a >>> 22) | (a << 10));
+        const t2 = (s0 + ((a & b) ^ (a & c) ^ (b & c))) | 0;
+        h = g;
+        g = f;
+        f = e;
+        e = (d + t1) | 0;
+        d = c;
+        c = b;
+        b = a;
+        a = (t1 + t2) | 0;
+      }
+      state[0] = (state[0] + a) | 0;
+      state[1] = (state[1] + b) | 0;
+      state[2] = (state[2] + c) | 0;
+      state[3] = (state[3] + d) | 0;
+      state[4] = (state[4] + e) | 0;
+      state[5] = (state[5] + f) | 0;
+      state[6] = (state[6] + g) | 0;
+      state[7] = (state[7] + h) | 0;
+    };
+
+    const update = (bytes) => {
+      let offset = 0;
+      totalBytes += bytes.length;
+      if (blockLength > 0) {
+        offset = Math.min(64 - blockLength, bytes.length);
+        block.set(bytes.subarray(0, offset), blockLength);
+        blockLength += offset;
+        if (blockLength < 64) {
+          return;
+        }
+        compress(block, 0);
+        blockLength = 0;
+      }
+      for (; offset + 64 <= bytes.length; offset += 64) {
+        compress(bytes, offset);
+      }
+      block.set(bytes.subarray(offset), 0);
+      blockLength = bytes.length - offset;
+    };
+
+    const hexDigest = () => {
+      block[blockLength] = 0x80;
+      block.fill(0, blockLength + 1);
+      if (blockLength >= 56) {
+        compress(block, 0);
+        block.fill(0);
+      }
+      const view = new DataView(block.buffer);
+      view.setUint32(56, Math.floor(totalBytes / 0x20000000));
+      view.setUint32(60, (totalBytes * 8) >>> 0);
+      compress(block, 0);
+      return Array.from(state)
+        .map((value) => (value >>> 0).toString(16).padStart(8, "0"))
+        .join("");
+    };
+
+    return { update, hexDigest };
+  };
+
+  const showHashing = (done, total) => {
+    setStatus(
+      translate(
+        "upload.hashing",
+        { done: formatMb(done), total: formatMb(total) },
+        `Checking whether this ZIP is already on the server (${formatMb(done)} / ${formatMb(total)} MB)...`
+      )
+    );
+  };
+
+  const toHex = (bytes) => Array.from(bytes)
+    .map((value) => value.toString(16).padStart(2, "0"))
+    .join("");
+
+  const sha256Hex = async (file) => {
+    if (file.size <= HASH_IN_MEMORY_BYTES && window.crypto && window.crypto.subtle) {
+      showHashing(0, file.size);
+      return toHex(new Uint8Array(await window.crypto.subtle.digest("SHA-256", await file.arrayBuffer())));
+    }
+    const hasher = createSha256();
+    for (let offset = 0; offset < file.size; offset += HASH_SLICE_BYTES) {
+      showHashing(offset, file.size);
+      const slice = file.slice(offset, Math.min(offset + HASH_SLICE_BYTES, file.size));
+      hasher.update(new Uint8Array(await slice.arrayBuffer()));
+    }
+    return hasher.hexDigest();
+  };
+
+  const resumeKey = (file) => `${STORAGE_PREFIX}${file.name}_${file.size}_${file.lastModified}`;
+
+  const openSession = async (file) => {
+    const storedId = window.localStorage.getItem(resumeKey(file));
+    if (storedId) {
+      const response = await fetch(`${uploadsUrl}/${storedId}`, { cache: "no-store" });
+      if (response.ok) {
+        return response.json();
+      }
+      window.localStorage.removeItem(resumeKey(file));
+    }
+    const sha256 = await sha256Hex(file);
+    const response = await fetch(uploadsUrl, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({
+        filename: file.name,
+        size: file.size,
+        sha256,
+        source_route: isMarc ? "marc" : "index"
+      })
+    });
+    if (!response.ok) {
+      throw new Error(`HTTP ${response.status}`);
+    }
+    const session = await response.json();
+    window.localStorage.setItem(resumeKey(file), session.upload_id);
+    return session;
+  };
+
+  const uploadFile = async (file) => {
+    let session = await openSession(file);
+    let retries = 0;
+    while (!session.complete) {
+      if (session.error) {
+        window.localStorage.removeItem(resumeKey(file));
+        throw new Error(session.error);
+      }
+      if (session.registering) {
+        // Every byte has arrived; the server is checking the archive.
+        setStatus(translate("upload.registering", {}, "Checking the uploaded ZIP..."));
+        await sleep(REGISTER_POLL_MS);
+        try {
+          const statusResponse = await fetch(`${uploadsUrl}/${session.upload_id}`, { cache: "no-store" });
+          if (statusResponse.ok) {
+            session = await statusResponse.json();
+          }
+        } catch (error) {
+          // Polled again on the next pass.
+        }
+        continue;
+      }
+      const end = Math.min(session.offset + session.chunk_size, file.size);
+      setStatus(
+        translate(
+          "upload.progress",
+          { done: formatMb(session.offset), total: formatMb(file.size) },
+          `Uploading ${formatMb(session.offset)} / ${formatMb(file.size)} MB...`
+        )
+      );
+      let response;
+      try {
+        response = await fetch(`${uploadsUrl}/${session.upload_id}?offset=${session.offset}`, {
+          method: "PUT",
+          headers: { "Content-Type": "application/octet-stream" },
+          body: file.slice(session.offset, end)
+        });
+      } catch (error) {
+        response = null;
+      }
+      if (response && response.status === 409) {
+        session.offset = (await response.json()).offset;
+        continue;
+      }
+      if (!response || response.status >= 500) {
+        // Network trouble: wait, then ask the server where to continue.
+        retries += 1;
+        if (retries > MAX_RETRIES) {
+          throw new Error(translate("upload.failed", {}, "Upload failed. Submit again to resume."));
+        }
+        await sleep(Math.min(30000, 1000 * 2 ** retries));
+        try {
+          const statusResponse = await fetch(`${uploadsUrl}/${session.upload_id}`, { cache: "no-store" });
+          if (statusResponse.ok) {
+            session = await statusResponse.json();
+          }
+        } catch (error) {
+          // Still offline; the next attempt retries from the same offset.
+        }
+        continue;
+      }
+      if (!response.ok) {
+        window.localStorage.removeItem(resumeKey(file));
+        const body = await response.json().catch(() => ({}));
+        throw new Error(body.error || `HTTP ${response.status}`);
+      }
+      retries = 0;
+      session = await response.json();
+    }
+    window.localStorage.removeItem(resumeKey(file));
+    setStatus(
+      session.skipped_bytes
+        ? translate("upload.already_stored", {}, "This ZIP is already on the server; nothing was uploaded.")
+        : translate("upload.done", {}, "Upload complete.")
+    );
+    return session;
+  };
+
+  let uploading = false;
+  form.addEventListener("submit", async (event) => {
+    const file = zipField.files && zipField.files[0];
+    const existingZip = form.querySelector('input[name="existing_zip"]');
+    const existingFolder = form.querySelector('input[name="existing_folder"]');
+    const selectsExisting =
+      (existingZip && existingZip.value) || (existingFolder && existingFolder.value);
+    if (!file || selectsExisting || zipField.disabled) {
+      return;
+    }
+    event.preventDefault();
+    if (uploading) {
+      return;
+    }
+    uploading = true;
+    try {
+      const session = await uploadFile(file);
+      let uploadIdField = form.querySelector('input[name="upload_id"]');
+      if (!uploadIdField) {
+        uploadIdField = document.createElement("input");
+        uploadIdField.type = "hidden";
+        uploadIdField.name = "upload_id";
+        form.appendChild(uploadIdField);
+      }
+      uploadIdField.value = session.upload_id;
+      // The file has been sent already; the form only carries its upload id.
+      zipField.required = false;
+      zipField.disabled = true;
+      form.submit();
+    } catch (error) {
+      setStatus(error.message);
+    } finally {
+      uploading = false;
+    }
+  });
+})();
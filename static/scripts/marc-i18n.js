@@ -20,7 +20,9 @@
       "marc.upload_zip_label": "Upload ZIP (optional if choosing a folder below):",
       "marc.choose_subfolder_prefix": "Or choose a subfolder from",
       "marc.no_folders_prefix": "No folders found in",
+      "marc.listing_refreshed_prefix": "Listing refreshed at",
       "marc.separate_outputs": "Separate text files in output zip",
+      "marc.validate_records": "Check records against the Aleph Sequential template and re-request malformed ones (re-requests are billed as extra requests)",
       "marc.include_metadata": "Include metadata.json",
       "marc.save_concat_prefix": "Save concatenated results to",
       "marc.submit_job": "Submit Job",
@@ -28,10 +30,31 @@
       "marc.prompt_load_error": "Failed to load prompt from static/prompts/marc.txt.",
       "status.selected_zip": "Selected existing ZIP: {name}",
       "status.selected_folder": "Selected folder: {name}/",
+      "upload.hashing": "Checking whether this ZIP is already on the server ({done} / {total} MB)...",
+      "upload.progress": "Uploading {done} / {total} MB...",
+      "upload.failed": "Upload failed. Submit again to resume.",
+      "upload.already_stored": "This ZIP is already on the server; nothing was uploaded.",
+      "upload.registering": "Checking the uploaded ZIP...",
+      "upload.done": "Upload complete.",
       "marc.item_singular": "item",
       "marc.item_plural": "items",
       "marc.folder_meta": "{count} {item_label} | {modified_at}",
-      "marc.model_default_suffix": "(default)"
+      "marc.model_default_suffix": "(default)",
+      "options.request_legend": "Request options",
+      "options.stream_responses": "Stream responses (time-to-first-token metrics and live partial output)",
+      "options.hedge_requests": "Hedge slow requests (send a duplicate after the model's p95 latency)",
+      "options.record_cassette": "Record responses so the job can be replayed later without API calls",
+      "options.hedge_model_label": "Hedge model (optional, defaults to the selected model):",
+      "options.oversize_policy_label": "Folders over the model's size limits:",
+      "options.oversize_chunk": "Split into several requests",
+      "options.oversize_subsample": "Send an evenly spaced subset of files",
+      "options.oversize_reject": "Do not send (mark as error)",
+      "options.priority_label": "Priority when the server is busy:",
+      "options.priority_low": "Low",
+      "options.priority_normal": "Normal",
+      "options.priority_high": "High",
+      "fallback.label": "Fallback models (tried in order when the chosen model times out or is unavailable):",
+      "fallback.none": "No fallback"
     },
     lv: {
       "language.label": "Valoda:",
@@ -49,7 +72,9 @@
       "marc.upload_zip_label": "Augšupielādēt ZIP (nav obligāti, ja zemāk izvēlaties mapi):",
       "marc.choose_subfolder_prefix": "Vai izvēlieties apakšmapi no",
       "marc.no_folders_prefix": "Mapes nav atrastas šeit",
+      "marc.listing_refreshed_prefix": "Saraksts atjaunināts",
       "marc.separate_outputs": "Atdalīt teksta failus rezultātu zip arhīvā",
+      "marc.validate_records": "Pārbaudīt ierakstus pret Aleph Sequential veidni un atkārtoti pieprasīt kļūdainos (atkārtotie pieprasījumi tiek apmaksāti kā papildu pieprasījumi)",
       "marc.include_metadata": "Iekļaut metadata.json",
       "marc.save_concat_prefix": "Saglabāt apvienotos rezultātus šeit",
       "marc.submit_job": "Iesniegt darbu",
@@ -57,10 +82,31 @@
       "marc.prompt_load_error": "Neizdevās ielādēt uzvedni no static/prompts/marc.txt.",
       "status.selected_zip": "Izvēlēts esošs ZIP: {name}",
       "status.selected_folder": "Izvēlēta mape: {name}/",
+      "upload.hashing": "Pārbauda, vai šis ZIP jau ir serverī ({done} / {total} MB)...",
+      "upload.progress": "Augšupielādē {done} / {total} MB...",
+      "upload.failed": "Augšupielāde neizdevās. Iesniedziet vēlreiz, lai turpinātu.",
+      "upload.already_stored": "Šis ZIP jau ir serverī; nekas netika augšupielādēts.",
+      "upload.registering": "Pārbauda augšupielādēto ZIP...",
+      "upload.done": "Augšupielāde pabeigta.",
       "marc.item_singular": "vienība",
       "marc.item_plural": "vienības",
       "marc.folder_meta": "{count} {item_label} | {modified_at}",
-      "marc.model_default_suffix": "(noklusējums)"
+      "marc.model_default_suffix": "(noklusējums)",
+      "options.request_legend": "Pieprasījumu iestatījumi",
+      "options.stream_responses": "Straumēt atbildes (laiks līdz pirmajam marķierim un daļēja izvade reāllaikā)",
+      "options.hedge_requests": "Dublēt lēnus pieprasījumus (sūtīt kopiju pēc modeļa p95 latentuma)",
+      "options.record_cassette": "Ierakstīt atbildes, lai darbu vēlāk varētu atkārtot bez API izsaukumiem",
+      "options.hedge_model_label": "Dublēšanas modelis (nav obligāts, pēc noklusējuma izvēlētais modelis):",
+      "options.oversize_policy_label": "Mapes, kas pārsniedz modeļa izmēra ierobežojumus:",
+      "options.oversize_chunk": "Sadalīt vairākos pieprasījumos",
+      "options.oversize_subsample": "Sūtīt vienmērīgi izvēlētu failu apakškopu",
+      "options.oversize_reject": "Nesūtīt (atzīmēt kā kļūdu)",
+      "options.priority_label": "Prioritāte, kad serveris ir noslogots:",
+      "options.priority_low": "Zema",
+      "options.priority_normal": "Parasta",
+      "options.priority_high": "Augsta",
+      "fallback.label": "Rezerves modeļi (tiek izmēģināti pēc kārtas, ja izvēlētais modelis nereaģē vai nav pieejams):",
+      "fallback.none": "Bez rezerves modeļa"
     }
   };
 
@@ -0,0 +1,101 @@
+import json
+
+# Structured-output mode for the json output format: the request carries a
+# response_format and every reply is parsed strictly as it arrives, instead
+# of being dug out of free text after the job. Schemas are checked for the
+# subset of JSON Schema that strict response formats use (type, properties,
+# required, additionalProperties, items, enum); anything else is left to the
+# provider.
+
+STRUCTURED_RETRIES_PER_GROUP = 2
+# Repair requests per job, as a share of its groups (at least the minimum).
+STRUCTURED_RETRY_BUDGET_SHARE = 0.25
+STRUCTURED_RETRY_BUDGET_MIN = 3
+STRUCTURED_OUTPUT_FILE = "output.jsonl"
+SCHEMA_NAME = "file_result"
+MAX_REPORTED_ERRORS = 20
+
+_JSON_TYPES = {"object": dict, "array": list, "string": str, "boolean": bool, "null": type(None)}
+
+def parse_json_schema(text):
+    # Returns None for an empty field, raises ValueError for anything that
+    # cannot be sent as a schema.
+    text = str(text or "").strip()
+    if not text:
+        return None
+    try:
+        schema = json.loads(text)
+    except ValueError as e:
+        raise ValueError(f"JSON schema is not valid JSON: {e}")
+    if not isinstance(schema, dict):
+        raise ValueError("JSON schema must be a JSON object.")
+    if schema.get("type", "object") != "object":
+        raise ValueError("JSON schema must describe an object (\"type\": \"object\").")
+    return schema
+
+def response_format_for(schema=None):
+    if not schema:
+        return {"type": "json_object"}
+    return {"type": "json_schema", "json_schema": {"name": SCHEMA_NAME, "strict": True, "schema": schema}}
+
+def _matches_type(value, name):
+    if name == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    if name == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    expected = _JSON_TYPES.get(name)
+    return expected is None or isinstance(value, expected)
+
+def _schema_errors(value, schema, path="$"):
+    expected = schema.get("type")
+    if expected:
+        names = expected if isinstance(expected, list) else [expected]
+        if not any(_matches_type(value, name) for name in names):
+            return [f"{path}: expected {' or '.join(names)}"]
+    errors = []
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: not one of {json.dumps(schema['enum'], ensure_ascii=False)}")
+    if isinstance(value, dict):
+        properties = schema.get("properties") or {}
+        for key in schema.get("required") or []:
+            if key not in value:
+                errors.append(f"{path}: missing required property '{key}'")
+        for key, item in value.items():
+            if key in properties:
+                errors.extend(_schema_errors(item, properties[key], f"{path}.{key}"))
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{path}: unexpected property '{key}'")
+    if isinstance(value, list) and isinstance(schema.get("items"), dict):
+        for idx, item in enumerate(value):
+            errors.extend(_schema_errors(item, schema["items"], f"{path}[{idx}]"))
+    return errors
+
+def validate_json_reply(reply, schema=None):
+    # Returns (value, errors). No trailing-comma or code-fence clean-up: a
+    # reply that needs it is sent back instead.
+    try:
+        value = json.loads(str(reply or ""))
+    except ValueError as e:
+        return None, [f"not valid JSON: {e}"]
+    if schema:
+        return value, _schema_errors(value, schema)
+    if not isinstance(value, dict):
+        return value, ["$: expected object"]
+    return value, []
+
+def structured_retry_budget(group_count):
+    return max(STRUCTURED_RETRY_BUDGET_MIN, int(group_count * STRUCTURED_RETRY_BUDGET_SHARE))
+
+def json_repair_messages(reply, errors):
+    listed = "\n".join(f"- {error}" for error in errors[:MAX_REPORTED_ERRORS])
+    return [
+        {"role": "assistant", "content": reply},
+        {
+            "role": "user",
+            "content": (
+                "The reply above is not valid for the required JSON format:\n"
+                f"{listed}\n"
+                "Return the complete corrected JSON object only, with no surrounding text."
+            )
+        }
+    ]
@@ -0,0 +1,109 @@
+import os, sys, csv, json, tempfile, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# The modules live flat in the repository root, and config.py creates its
+# data directories on import, so both are set up before any test imports.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["BATCH_DATA_DIR"] = tempfile.mkdtemp(prefix="batch-tests-")
+
+class _OpenRouterHandler(BaseHTTPRequestHandler):
+    # `server.respond(body)` returns a status and either a JSON document or
+    # an iterable of raw chunks. Chunks are flushed one at a time, with
+    # chunked encoding unless a content length is returned as well.
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            self.server.requests.append(body)
+        status, content, *length = self.server.respond(body)
+        if isinstance(content, dict):
+            content = [json.dumps(content).encode("utf-8")]
+            length = [len(content[0])]
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if length:
+            self.send_header("Content-Length", str(length[0]))
+        else:
+            self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for chunk in content:
+                if not length:
+                    chunk = b"%x\r\n%s\r\n" % (len(chunk), chunk)
+                self.wfile.write(chunk)
+                self.wfile.flush()
+            if not length:
+                self.wfile.write(b"0\r\n\r\n")
+        except OSError:
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def openrouter(monkeypatch):
+    import openrouter_client
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _OpenRouterHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = []
+    server.respond = lambda body: (200, {"choices": [{"message": {"content": "ok"}}], "usage": {}})
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(openrouter_client, "OPENROUTER_URL", f"http://127.0.0.1:{server.server_port}/")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def run_job(monkeypatch, tmp_path):
+    # Runs worker.process_job over `files` ({relative path: text}). Requests
+    # go to `reply(payload)`, which returns the reply text or raises.
+    import worker
+    monkeypatch.setattr(worker, "UPLOAD_FOLDER", str(tmp_path))
+    lock = threading.Lock()
+
+    def run(files, reply=lambda payload: "ok", job_id="job", **options):
+        sent = []
+
+        def send_completion(payload, api_key, **kwargs):
+            with lock:
+                sent.append(payload)
+            return {
+                "reply": reply(payload),
+                "usage": {"total_tokens": 10},
+                "model": payload.get("model", ""),
+                "latency": 0.01,
+                "timeout": 30,
+                "streamed": False,
+                "ttfb": 0.01,
+                "ttft": None,
+                "tokens_per_second": None,
+                "hedged": False,
+                "hedge_won": False,
+                "coalesced": False,
+                "shared_with": 0
+            }
+
+        monkeypatch.setattr(worker, "send_completion", send_completion)
+        job_dir = tmp_path / job_id
+        for rel_path, text in files.items():
+            path = job_dir / "input" / rel_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(text)
+        meta = dict({
+            "system_prompt": "Summarize the input.",
+            "api_key": "key",
+            "model": "test/model",
+            "source_route": "index",
+            "output_formats": ["csv"]
+        }, **options)
+        worker.process_job(job_id, meta)
+        with open(job_dir / "output.csv", newline="", encoding="utf-8") as f:
+            rows = {row["file"]: row["output"] for row in csv.DictReader(f)}
+        return meta, rows, sent
+
+    return run
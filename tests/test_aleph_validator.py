@@ -0,0 +1,112 @@
+import pytest
+import aleph_validator
+from aleph_validator import validate_aleph_record
+
+LDR = "^^^^^nam^a22^^^^^^i^4500"
+F008 = "^^^^^^s1925^^^^lv^^^^^^^^^^^^^^000^0^lav"
+
+def _record(*lines):
+    return "\n".join(f"000000001 {line}" for line in lines)
+
+VALID = _record(
+    "FMT   L BK",
+    f"LDR   L {LDR}",
+    f"008   L {F008}",
+    "040   L $$aLV-RiVB$$blav$$erda",
+    "1001  L $$aBērziņš, Jānis$$4aut",
+    "24510 L $$aDzeja un proza :$$bizlase /$$cJānis Bērziņš.",
+    "264 1 L $$aRīga :$$bValters un Rapa,$$c1925.",
+)
+
+def _errors(text):
+    return [(error["line"], error["tag"], error["error"]) for error in validate_aleph_record(text)]
+
+def test_template_lengths_match_the_checks():
+    assert len(LDR) == 24
+    assert len(F008) == 40
+
+def test_valid_record_has_no_errors():
+    assert validate_aleph_record(VALID) == []
+    assert validate_aleph_record(VALID + "\n\n") == []
+
+@pytest.mark.parametrize("text, expected", [
+    (
+        VALID.replace("000000001 040", "000000002 040"),
+        (4, "040", "record number 000000002 instead of 000000001"),
+    ),
+    (
+        VALID.replace("264 1 L", "26X 1 L"),
+        (7, "26X", "tag is not FMT, LDR or three digits"),
+    ),
+    (
+        VALID.replace("264 1 L", "264x1 L"),
+        (7, "264", "indicators 'x1' must be digits or blanks"),
+    ),
+    (
+        VALID.replace(LDR, LDR[:-2]),
+        (2, "LDR", "22 characters instead of 24"),
+    ),
+    (
+        VALID.replace("FMT   L", "FMT 1 L"),
+        (1, "FMT", "control fields take no indicators"),
+    ),
+    (
+        VALID.replace("$$aLV-RiVB", "LV-RiVB"),
+        (4, "040", "data does not start with a $$ subfield code"),
+    ),
+    (
+        VALID.replace("$$blav", "$$Blav"),
+        (4, "040", "$$ not followed by a subfield code"),
+    ),
+    (
+        VALID + "\nthis is a comment",
+        (8, "", "not an Aleph Sequential line (expected '<9 digits> <tag><ind> L <data>')"),
+    ),
+])
+def test_field_errors(text, expected):
+    assert _errors(text) == [expected]
+
+def test_record_level_errors():
+    no_title = "\n".join(line for line in VALID.splitlines() if " 245" not in line)
+    assert _errors(no_title) == [(0, "245", "245 is missing")]
+
+    two_titles = VALID + "\n000000001 24510 L $$aOther title."
+    assert _errors(two_titles) == [(8, "245", "2 245 fields; only one is allowed")]
+
+    two_main_entries = VALID + "\n000000001 1101  L $$aSome society."
+    assert _errors(two_main_entries) == [(8, "110", "2 main entry (1XX) fields; only one is allowed")]
+
+    fmt_last = "\n".join(VALID.splitlines()[1:] + VALID.splitlines()[:1])
+    assert _errors(fmt_last) == [(1, "FMT", "record does not start with FMT")]
+
+    no_ldr = "\n".join(line for line in VALID.splitlines() if " LDR" not in line)
+    assert _errors(no_ldr) == [(0, "LDR", "LDR is missing")]
+
+    assert _errors("") == [(0, "", "no Aleph Sequential lines")]
+
+def test_lines_can_be_fed_as_they_arrive():
+    validator = aleph_validator.AlephRecordValidator()
+    for line in VALID.splitlines(keepends=True):
+        validator.feed_line(line)
+    validator.feed_line("000000001 500   L no subfield")
+    assert validator.finish() == [{"line": 8, "tag": "500", "error": "data does not start with a $$ subfield code"}]
+
+def test_retry_budget():
+    assert aleph_validator.record_retry_budget(0) == aleph_validator.RECORD_RETRY_BUDGET_MIN
+    assert aleph_validator.record_retry_budget(4) == aleph_validator.RECORD_RETRY_BUDGET_MIN
+    assert aleph_validator.record_retry_budget(100) == 25
+
+def test_repair_messages():
+    errors = [
+        {"line": 0, "tag": "245", "error": "245 is missing"},
+        {"line": 3, "tag": "", "error": "not an Aleph Sequential line"},
+    ]
+    messages = aleph_validator.record_repair_messages("bad reply", errors)
+    assert messages[0] == {"role": "assistant", "content": "bad reply"}
+    assert messages[1]["role"] == "user"
+    assert "- line 0 (245): 245 is missing\n- line 3: not an Aleph Sequential line\n" in messages[1]["content"]
+
+def test_repair_messages_cap_the_error_list():
+    errors = [{"line": idx, "tag": "500", "error": "bad"} for idx in range(50)]
+    content = aleph_validator.record_repair_messages("reply", errors)[1]["content"]
+    assert content.count("- line ") == aleph_validator.MAX_REPORTED_ERRORS
@@ -0,0 +1,69 @@
+import gzip
+
+import pytest
+import requests
+import cassette
+import openrouter_client
+
+PAYLOAD = {"model": "test/model", "messages": [{"role": "user", "content": "hello"}]}
+
+def _result(reply):
+    return {"reply": reply, "usage": {"total_tokens": 3}, "model": "test/model", "latency": 0.5}
+
+def test_recorded_replies_replay_in_order(tmp_path):
+    path = str(tmp_path / cassette.CASSETTE_FILE)
+    recorder = cassette.Cassette(path, "record")
+    recorder.record(PAYLOAD, _result("first"))
+    recorder.record(PAYLOAD, _result("second"))
+
+    player = cassette.Cassette(path, "replay", latency_scale=0)
+    assert player.replaying
+    replies = [player.replay(PAYLOAD) for _ in range(3)]
+    assert [result["reply"] for result in replies] == ["first", "second", "second"]
+    assert replies[0]["usage"] == {"total_tokens": 3}
+    assert replies[0]["replayed"] and not replies[0]["coalesced"]
+
+def test_unrecorded_request_is_a_replay_miss(tmp_path):
+    player = cassette.Cassette(str(tmp_path / cassette.CASSETTE_FILE), "replay")
+    with pytest.raises(openrouter_client.ReplayMiss):
+        player.replay(PAYLOAD)
+
+def test_recorded_errors_replay_as_the_same_failure(tmp_path):
+    path = str(tmp_path / cassette.CASSETTE_FILE)
+    recorder = cassette.Cassette(path, "record")
+    response = requests.Response()
+    response.status_code = 429
+    recorder.record_error(PAYLOAD, requests.HTTPError("429 error", response=response))
+    other = dict(PAYLOAD, model="test/other")
+    recorder.record_error(other, requests.Timeout("timed out"))
+    recorder.record_error(other, openrouter_client.RequestCancelled("stop"))
+
+    player = cassette.Cassette(path, "replay", latency_scale=0)
+    with pytest.raises(requests.HTTPError) as error:
+        player.replay(PAYLOAD)
+    assert error.value.response.status_code == 429
+    with pytest.raises(requests.Timeout):
+        player.replay(other)
+
+def test_truncated_last_entry_is_skipped(tmp_path):
+    path = str(tmp_path / cassette.CASSETTE_FILE)
+    cassette.Cassette(path, "record").record(PAYLOAD, _result("kept"))
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        f.write('{"fingerprint": "trunc')
+    assert cassette.Cassette(path, "replay", latency_scale=0).replay(PAYLOAD)["reply"] == "kept"
+
+def test_send_completion_records_then_replays_without_network(openrouter, tmp_path):
+    path = str(tmp_path / cassette.CASSETTE_FILE)
+    recorded = openrouter_client.send_completion(PAYLOAD, "key", coalesce=False, cassette=cassette.Cassette(path, "record"))
+    assert len(openrouter.requests) == 1
+
+    replayed = openrouter_client.send_completion(PAYLOAD, "key", cassette=cassette.Cassette(path, "replay", latency_scale=0))
+    assert replayed["reply"] == recorded["reply"] == "ok"
+    assert len(openrouter.requests) == 1
+
+def test_record_mode_starts_a_fresh_cassette(tmp_path):
+    (tmp_path / cassette.CASSETTE_FILE).write_bytes(b"old")
+    assert cassette.open_job_cassette(str(tmp_path), {}) is None
+    recorder = cassette.open_job_cassette(str(tmp_path), {"cassette_mode": "record"})
+    assert recorder.mode == "record"
+    assert not (tmp_path / cassette.CASSETTE_FILE).exists()
@@ -0,0 +1,86 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+import openrouter_client
+
+PAYLOAD = {"model": "a", "messages": [{"role": "user", "content": "same question"}]}
+
+def _slow_reply(seconds, usage):
+    def respond(body):
+        time.sleep(seconds)
+        return 200, {"choices": [{"message": {"content": "shared answer"}}], "usage": usage}
+    return respond
+
+def _send_together(count, **options):
+    # The first call leads; the others start while it is still in flight.
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        futures = [pool.submit(openrouter_client.send_completion, dict(PAYLOAD), "key", **options)]
+        time.sleep(0.1)
+        futures += [pool.submit(openrouter_client.send_completion, dict(PAYLOAD), "key", **options) for _ in range(count - 1)]
+        return [future.result(timeout=10) for future in futures]
+
+def test_split_usage_adds_up():
+    usage = {"prompt_tokens": 10, "cost": 0.3, "details": {"cached_tokens": 5}}
+    shares = [openrouter_client._split_usage(usage, position, 3) for position in range(3)]
+    assert sum(share["prompt_tokens"] for share in shares) == 10
+    assert sum(share["details"]["cached_tokens"] for share in shares) == 5
+    assert all(share["cost"] == pytest.approx(0.1) for share in shares)
+
+def test_followers_get_the_leaders_result(openrouter):
+    openrouter.respond = _slow_reply(0.5, {"total_tokens": 9})
+    leader, *followers = _send_together(3)
+    assert len(openrouter.requests) == 1
+    assert not leader["coalesced"]
+    assert all(follower["coalesced"] for follower in followers)
+    assert all(result["reply"] == "shared answer" for result in [leader] + followers)
+    assert all(result["shared_with"] == 2 for result in [leader] + followers)
+    assert sum(result["usage"]["total_tokens"] for result in [leader] + followers) == 9
+    assert openrouter_client.inflight_request_count() == 0
+
+def test_requests_do_not_coalesce_when_turned_off(openrouter):
+    openrouter.respond = _slow_reply(0.3, {})
+    results = _send_together(2, coalesce=False)
+    assert len(openrouter.requests) == 2
+    assert not any(result["coalesced"] for result in results)
+
+def test_leader_error_reaches_followers(openrouter):
+    def respond(body):
+        time.sleep(0.3)
+        return 400, {"error": {"message": "bad request"}}
+
+    openrouter.respond = respond
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(openrouter_client.send_completion, dict(PAYLOAD), "key")
+        time.sleep(0.1)
+        follower = pool.submit(openrouter_client.send_completion, dict(PAYLOAD), "key")
+        for future in (leader, follower):
+            with pytest.raises(requests.HTTPError):
+                future.result(timeout=5)
+    assert len(openrouter.requests) == 1
+
+def test_different_send_options_do_not_coalesce(openrouter):
+    openrouter.respond = _slow_reply(0.3, {})
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        plain = pool.submit(openrouter_client.send_completion, dict(PAYLOAD), "key")
+        time.sleep(0.1)
+        hedged = pool.submit(openrouter_client.send_completion, dict(PAYLOAD), "key", hedge=True, hedge_model="b")
+        assert not plain.result(timeout=10)["coalesced"]
+        assert not hedged.result(timeout=10)["coalesced"]
+    assert len(openrouter.requests) == 2
+
+def test_aborted_follower_leaves_without_a_share(openrouter):
+    openrouter.respond = _slow_reply(1.0, {"total_tokens": 8})
+    abort_event = threading.Event()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(openrouter_client.send_completion, dict(PAYLOAD), "key")
+        time.sleep(0.1)
+        follower = pool.submit(openrouter_client.send_completion, dict(PAYLOAD), "key", abort_event=abort_event)
+        time.sleep(0.1)
+        abort_event.set()
+        with pytest.raises(openrouter_client.RequestCancelled):
+            follower.result(timeout=5)
+        assert leader.result(timeout=5)["usage"] == {"total_tokens": 8}
+    assert len(openrouter.requests) == 1
@@ -0,0 +1,34 @@
+import csv
+
+import pytest
+from worker import _write_csv
+
+COLUMNS = ["file", "output", "model"]
+ROWS = [
+    {"file": "a.jpg", "output": "plain", "model": "m"},
+    {"file": "b, c.jpg", "output": 'says "hi"', "model": None},
+    {"file": "d.jpg", "output": "line one\nline two\r\nline three", "model": ""},
+    {"file": "Ērģeles ščūka.png", "output": "日本語 — ok", "model": "m"},
+    {"file": "e.jpg", "output": " leading and trailing ", "model": "m"},
+]
+
+def test_matches_pandas_to_csv(tmp_path):
+    pd = pytest.importorskip("pandas")
+    ours = tmp_path / "ours.csv"
+    theirs = tmp_path / "theirs.csv"
+    _write_csv(str(ours), ROWS, COLUMNS)
+    pd.DataFrame(ROWS, columns=COLUMNS).to_csv(theirs, index=False)
+    assert ours.read_bytes() == theirs.read_bytes()
+
+def test_round_trips_through_csv_reader(tmp_path):
+    path = tmp_path / "out.csv"
+    _write_csv(str(path), ROWS, COLUMNS)
+    with open(path, encoding="utf-8", newline="") as f:
+        read_back = list(csv.DictReader(f))
+    expected = [{column: row[column] or "" for column in COLUMNS} for row in ROWS]
+    assert read_back == expected
+
+def test_missing_columns_are_empty(tmp_path):
+    path = tmp_path / "out.csv"
+    _write_csv(str(path), [{"file": "a.jpg"}], COLUMNS)
+    assert path.read_text(encoding="utf-8") == "file,output,model\na.jpg,,\n"
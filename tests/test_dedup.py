@@ -0,0 +1,41 @@
+import worker
+
+def _user_text(payload):
+    return " ".join(part.get("text", "") for part in payload["messages"][-1]["content"])
+
+def _group(paths, is_folder=False):
+    return {"id": "group", "files": [str(path) for path in paths], "is_folder": is_folder}
+
+def test_fingerprint_ignores_names_but_not_order(tmp_path):
+    (tmp_path / "a.txt").write_text("first page")
+    (tmp_path / "b.txt").write_text("second page")
+    (tmp_path / "copy.txt").write_text("first page")
+    a, b, copy = tmp_path / "a.txt", tmp_path / "b.txt", tmp_path / "copy.txt"
+    assert worker._group_fingerprint(_group([a])) == worker._group_fingerprint(_group([copy]))
+    assert worker._group_fingerprint(_group([a, b])) != worker._group_fingerprint(_group([b, a]))
+    assert worker._group_fingerprint(_group([a], is_folder=True)) != worker._group_fingerprint(_group([a]))
+
+def test_identical_files_share_one_request(run_job):
+    files = {"a.txt": "same text", "b.txt": "same text", "c.txt": "other text"}
+    meta, rows, sent = run_job(files, reply=lambda payload: "same" if "same text" in _user_text(payload) else "other")
+    assert len(sent) == 2
+    assert meta["deduplicated_groups"] == 1
+    assert rows == {"a.txt": "same", "b.txt": "same", "c.txt": "other"}
+
+def test_deduplication_can_be_turned_off(run_job):
+    meta, rows, sent = run_job({"a.txt": "same text", "b.txt": "same text"}, deduplicate_groups=False)
+    assert len(sent) == 2
+    assert meta["deduplicated_groups"] == 0
+
+def test_failed_primary_is_not_resent_for_its_duplicates(run_job):
+    def reply(payload):
+        if "broken" in _user_text(payload):
+            raise RuntimeError("provider error")
+        return "ok"
+
+    files = {"a.txt": "broken", "b.txt": "broken", "c.txt": "broken", "d.txt": "fine"}
+    meta, rows, sent = run_job(files, reply=reply)
+    assert len(sent) == 2
+    assert rows["a.txt"] == rows["b.txt"] == rows["c.txt"] == "ERROR: provider error"
+    assert rows["d.txt"] == "ok"
+    assert meta["deduplicated_groups"] == 2
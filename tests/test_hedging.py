@@ -0,0 +1,107 @@
+import json
+import threading
+import time
+
+import pytest
+import requests
+import openrouter_client
+
+def _completion(text, **usage):
+    return {"choices": [{"message": {"content": text}}], "usage": usage}
+
+def _trickle(document, pieces, delay):
+    # Sent with a content length, so the client reads it in one go.
+    body = json.dumps(document).encode("utf-8")
+    size = len(body) // pieces + 1
+
+    def chunks():
+        for start in range(0, len(body), size):
+            time.sleep(delay)
+            yield body[start:start + size]
+
+    return 200, chunks(), len(body)
+
+def test_timeout_follows_model_latency():
+    model = "test/timeout-model"
+    assert openrouter_client.request_timeout_for(model) == openrouter_client.DEFAULT_REQUEST_TIMEOUT
+    for seconds in (10, 20, 30, 40, 50):
+        openrouter_client.record_model_latency(model, seconds)
+    assert openrouter_client.request_timeout_for(model) == 125.0
+    upload = openrouter_client.UPLOAD_BYTES_PER_SECOND * 4
+    assert openrouter_client.request_timeout_for(model, upload) == 129.0
+
+def test_fast_primary_is_not_hedged(openrouter, monkeypatch):
+    monkeypatch.setattr(openrouter_client, "hedge_delay_for", lambda model: 5)
+    openrouter.respond = lambda body: (200, _completion("primary"))
+    result = openrouter_client.send_completion({"model": "a", "messages": []}, "key", hedge=True, hedge_model="b")
+    assert result["reply"] == "primary"
+    assert not result["hedged"]
+    assert [body["model"] for body in openrouter.requests] == ["a"]
+
+def test_slow_primary_loses_to_the_hedge(openrouter, monkeypatch):
+    monkeypatch.setattr(openrouter_client, "hedge_delay_for", lambda model: 0.1)
+
+    def respond(body):
+        if body["model"] == "a":
+            time.sleep(0.6)
+        return 200, _completion(body["model"], total_tokens=5)
+
+    openrouter.respond = respond
+    extra = []
+    result = openrouter_client.send_completion(
+        {"model": "a", "messages": []}, "key", hedge=True, hedge_model="b", on_extra_usage=extra.append
+    )
+    assert result["reply"] == "b"
+    assert result["hedged"] and result["hedge_won"]
+    deadline = time.monotonic() + 5
+    while not extra and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert len(extra) == 1
+
+def test_losing_attempt_hangs_up(openrouter, monkeypatch):
+    monkeypatch.setattr(openrouter_client, "hedge_delay_for", lambda model: 0.1)
+
+    def respond(body):
+        if body["model"] == "a":
+            return _trickle(_completion("slow"), pieces=20, delay=0.1)
+        return 200, _completion("fast")
+
+    openrouter.respond = respond
+    extra = []
+    attempts = openrouter_client.HedgeAttempts()
+    started = time.monotonic()
+    result = openrouter_client.send_completion(
+        {"model": "a", "messages": []},
+        "key",
+        hedge=True,
+        hedge_model="b",
+        on_extra_usage=extra.append,
+        hedge_attempts=attempts
+    )
+    assert result["reply"] == "fast"
+    assert attempts.drain(5) == 0
+    # The primary would take two seconds to send its whole body.
+    assert time.monotonic() - started < 1.5
+    assert extra == [{}]
+
+def test_no_hedge_without_a_spare_request_slot(openrouter, monkeypatch):
+    monkeypatch.setattr(openrouter_client, "hedge_delay_for", lambda model: 0.1)
+    monkeypatch.setattr(openrouter_client, "_request_slots", threading.BoundedSemaphore(1))
+
+    def respond(body):
+        time.sleep(0.4)
+        return 200, _completion(body["model"])
+
+    openrouter.respond = respond
+    result = openrouter_client.send_completion({"model": "a", "messages": []}, "key", hedge=True, hedge_model="b")
+    assert result["reply"] == "a"
+    assert not result["hedged"]
+    assert [body["model"] for body in openrouter.requests] == ["a"]
+
+def test_deadline_covers_a_trickling_body(openrouter, monkeypatch):
+    monkeypatch.setattr(openrouter_client, "request_timeout_for", lambda model, payload_bytes=0: 1.0)
+    openrouter.respond = lambda body: _trickle(_completion("slow"), pieces=30, delay=0.1)
+    started = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        openrouter_client.send_completion({"model": "a", "messages": []}, "key")
+    assert time.monotonic() - started < 2
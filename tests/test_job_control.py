@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+
+import pytest
+import openrouter_client
+import worker
+
+def _files(count):
+    return {f"f{idx:02d}.txt": f"text {idx}" for idx in range(count)}
+
+def _start(run_job, files, reply, job_id):
+    done = []
+    thread = threading.Thread(target=lambda: done.append(run_job(files, reply=reply, job_id=job_id)))
+    thread.start()
+    return thread, done
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+def test_cancel_stops_groups_not_yet_sent(run_job):
+    gate = threading.Event()
+    calls = []
+
+    def reply(payload):
+        calls.append(payload)
+        gate.wait(5)
+        return "ok"
+
+    thread, done = _start(run_job, _files(20), reply, "cancelled-job")
+    _wait_for(lambda: calls)
+    time.sleep(0.2)
+    worker.cancel_job("cancelled-job")
+    gate.set()
+    thread.join(10)
+    meta, rows, sent = done[0]
+    assert meta["job_state"] == "cancelled"
+    assert meta["cancelled_groups"] == 20 - len(sent)
+    assert meta["cancelled_groups"] > 0
+    assert sum(1 for output in rows.values() if output == worker.CANCELLED_GROUP_OUTPUT) == meta["cancelled_groups"]
+
+def test_abort_stops_requests_in_flight(run_job):
+    def reply(payload):
+        _wait_for(lambda: (worker.get_job_control("aborted-job") or {}).get("aborted"))
+        raise openrouter_client.RequestCancelled("Request cancelled")
+
+    thread, done = _start(run_job, _files(3), reply, "aborted-job")
+    time.sleep(0.2)
+    worker.cancel_job("aborted-job", abort_in_flight=True)
+    thread.join(10)
+    meta, rows, sent = done[0]
+    assert meta["job_state"] == "cancelled"
+    assert all(output.startswith("ERROR:") for output in rows.values())
+
+def test_pause_holds_requests_until_resumed(run_job):
+    calls = []
+    worker.pause_job("paused-job")
+
+    def reply(payload):
+        calls.append(payload)
+        return "ok"
+
+    thread, done = _start(run_job, _files(3), reply, "paused-job")
+    time.sleep(0.3)
+    assert calls == []
+    worker.resume_job("paused-job")
+    thread.join(10)
+    meta, rows, sent = done[0]
+    assert rows == {name: "ok" for name in _files(3)}
+    assert "job_state" not in meta
+
+def test_control_file_reaches_the_job(tmp_path):
+    worker.write_job_control_file(str(tmp_path), "pause")
+    worker.apply_job_control_file("file-job", str(tmp_path))
+    assert worker.get_job_control("file-job") == {"paused": True, "cancelled": False, "aborted": False}
+    worker.write_job_control_file(str(tmp_path), "cancel", abort_in_flight=True)
+    worker.apply_job_control_file("file-job", str(tmp_path))
+    assert worker.get_job_control("file-job") == {"paused": False, "cancelled": True, "aborted": True}
+    worker._job_controls.pop("file-job", None)
+
+def test_abort_stops_a_stream_in_flight(openrouter):
+    def events():
+        for _ in range(40):
+            time.sleep(0.1)
+            yield f"data: {json.dumps({'choices': [{'delta': {'content': 'x'}}]})}\n\n".encode("utf-8")
+        yield b"data: [DONE]\n\n"
+
+    openrouter.respond = lambda body: (200, events())
+    abort_event = threading.Event()
+    threading.Timer(0.3, abort_event.set).start()
+    started = time.monotonic()
+    with pytest.raises(openrouter_client.RequestCancelled):
+        openrouter_client.send_completion({"model": "a", "messages": []}, "key", stream=True, abort_event=abort_event)
+    assert time.monotonic() - started < 1.5
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+import job_queue
+
+@pytest.fixture(autouse=True)
+def queue_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_QUEUE_PATH", str(tmp_path / "queue.sqlite3"))
+
+def _enqueue(*job_ids):
+    for job_id in job_ids:
+        job_queue.enqueue_job(job_id, f"key-{job_id}")
+        time.sleep(0.01)
+
+def test_jobs_are_claimed_in_order():
+    assert job_queue.claim_job("w1") is None
+    _enqueue("first", "second")
+    claimed = job_queue.claim_job("w1")
+    assert claimed["job_id"] == "first"
+    assert claimed["api_key"] == "key-first"
+    assert claimed["attempt"] == 1
+    assert job_queue.claim_job("w2")["job_id"] == "second"
+    assert job_queue.claim_job("w3") is None
+    assert job_queue.queue_summary() == {"running": 2}
+
+def test_lease_token_is_required():
+    _enqueue("job")
+    claimed = job_queue.claim_job("w1")
+    assert not job_queue.renew_lease("job", "other-token")
+    assert job_queue.renew_lease("job", claimed["lease_token"])
+    assert not job_queue.finish_job("job", "other-token")
+    assert job_queue.finish_job("job", claimed["lease_token"])
+    state = job_queue.job_state("job")
+    assert state["state"] == "finished"
+    assert state["lease_owner"] is None
+    assert not job_queue.renew_lease("job", claimed["lease_token"])
+
+def test_failed_job_keeps_its_error():
+    _enqueue("job")
+    claimed = job_queue.claim_job("w1")
+    assert job_queue.finish_job("job", claimed["lease_token"], "boom")
+    assert job_queue.job_state("job")["state"] == "failed"
+    assert job_queue.job_state("job")["error"] == "boom"
+
+def test_expired_lease_is_reclaimed_and_old_holder_cannot_finish():
+    _enqueue("job")
+    stale = job_queue.claim_job("w1", lease_seconds=-1)
+    reclaimed = job_queue.claim_job("w2", max_attempts=3)
+    assert reclaimed["job_id"] == "job"
+    assert reclaimed["attempt"] == 2
+    assert reclaimed["lease_token"] != stale["lease_token"]
+    assert not job_queue.finish_job("job", stale["lease_token"])
+    assert job_queue.finish_job("job", reclaimed["lease_token"])
+
+def test_lease_expired_on_last_attempt_fails_the_job():
+    _enqueue("job")
+    job_queue.claim_job("w1", lease_seconds=-1)
+    assert job_queue.claim_job("w2", max_attempts=1) is None
+    assert job_queue.expire_abandoned_jobs(max_attempts=1) == ["job"]
+    state = job_queue.job_state("job")
+    assert state["state"] == "failed"
+    assert state["error"] == "Worker lease expired after 1 attempts"
+    assert job_queue.expire_abandoned_jobs(max_attempts=1) == []
+
+def test_cancel_and_forget():
+    _enqueue("claimed", "waiting")
+    assert job_queue.claim_job("w1")["job_id"] == "claimed"
+    assert not job_queue.cancel_queued_job("claimed")
+    assert not job_queue.forget_job("claimed")
+    assert not job_queue.forget_job("waiting")
+    assert job_queue.cancel_queued_job("waiting")
+    assert job_queue.job_state("waiting")["state"] == "cancelled"
+    assert job_queue.forget_job("waiting")
+    assert job_queue.job_state("waiting") is None
+    assert job_queue.forget_job("missing")
+
+def test_queue_file_is_private(tmp_path):
+    path = tmp_path / "queue.sqlite3"
+    path.touch(mode=0o644)
+    path.chmod(0o644)
+    _enqueue("job")
+    assert path.stat().st_mode & 0o777 == 0o600
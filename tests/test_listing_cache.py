@@ -0,0 +1,52 @@
+import os
+
+import listing_cache
+
+def _builder(built):
+    def build_entry(path, name, stat):
+        built.append(name)
+        return {"name": name, "bytes": stat.st_size}
+    return build_entry
+
+def _touch(path, text, mtime):
+    path.write_text(text)
+    os.utime(path, (mtime, mtime))
+
+def test_unchanged_children_are_not_rebuilt(tmp_path):
+    _touch(tmp_path / "a.zip", "a", 100)
+    _touch(tmp_path / "b.zip", "bb", 200)
+    _touch(tmp_path / "notes.txt", "skip", 300)
+    built = []
+    cache = listing_cache.ListingCache(str(tmp_path), _builder(built), suffix=".zip")
+    entries, refreshed_at = cache.snapshot()
+    assert [entry["name"] for entry in entries] == ["b.zip", "a.zip"]
+    assert refreshed_at
+    assert sorted(built) == ["a.zip", "b.zip"]
+
+    built.clear()
+    _touch(tmp_path / "a.zip", "changed", 400)
+    cache.refresh()
+    assert built == ["a.zip"]
+    assert cache.snapshot()[0][0] == {"name": "a.zip", "bytes": 7}
+
+def test_directories_listing_skips_excluded_names(tmp_path):
+    for name in ("batch-1", "results"):
+        (tmp_path / name).mkdir()
+    (tmp_path / "file.txt").write_text("x")
+    cache = listing_cache.ListingCache(str(tmp_path), _builder([]), want_dirs=True, excluded_names={"results"})
+    assert [entry["name"] for entry in cache.snapshot()[0]] == ["batch-1"]
+    assert cache.child_dirs() == [str(tmp_path / "batch-1")]
+
+def test_refresh_listings_shows_new_files_at_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(listing_cache, "_ensure_refresher", lambda: None)
+    root = str(tmp_path)
+    build_entry = _builder([])
+    assert listing_cache.get_listing(root, build_entry, suffix=".zip")[0] == []
+    _touch(tmp_path / "new.zip", "n", 100)
+    assert listing_cache.get_listing(root, build_entry, suffix=".zip")[0] == []
+    listing_cache.refresh_listings(root)
+    assert [entry["name"] for entry in listing_cache.get_listing(root, build_entry, suffix=".zip")[0]] == ["new.zip"]
+
+def test_missing_root_lists_nothing(tmp_path):
+    cache = listing_cache.ListingCache(str(tmp_path / "missing"), _builder([]))
+    assert cache.snapshot()[0] == []
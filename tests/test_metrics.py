@@ -0,0 +1,66 @@
+import metrics
+
+def _samples(prefix):
+    return [line for line in metrics.render_metrics().splitlines() if line.startswith(prefix)]
+
+def test_counters_add_up_per_label_set():
+    metrics.inc("batch_jobs_total", route="test-route", status="finished")
+    metrics.inc("batch_jobs_total", 2, status="finished", route="test-route")
+    metrics.inc("batch_jobs_total", route="test-route", status="failed")
+    assert _samples('batch_jobs_total{route="test-route"') == [
+        'batch_jobs_total{route="test-route",status="failed"} 1',
+        'batch_jobs_total{route="test-route",status="finished"} 3'
+    ]
+
+def test_histograms_are_cumulative():
+    for seconds in (0.05, 0.3, 7, 5000):
+        metrics.observe("batch_stage_seconds", seconds, stage="test-stage")
+    metrics.observe("batch_stage_seconds", None, stage="test-stage")
+    lines = _samples('batch_stage_seconds_bucket{stage="test-stage"')
+    assert 'batch_stage_seconds_bucket{stage="test-stage",le="0.05"} 1' in lines
+    assert 'batch_stage_seconds_bucket{stage="test-stage",le="0.5"} 2' in lines
+    assert 'batch_stage_seconds_bucket{stage="test-stage",le="3600"} 3' in lines
+    assert 'batch_stage_seconds_bucket{stage="test-stage",le="+Inf"} 4' in lines
+    assert _samples('batch_stage_seconds_count{stage="test-stage"}') == ['batch_stage_seconds_count{stage="test-stage"} 4']
+
+def test_label_values_are_escaped():
+    metrics.inc("batch_groups_total", result='quote " and \\ and\nnewline')
+    assert _samples('batch_groups_total{result="quote') == [
+        'batch_groups_total{result="quote \\" and \\\\ and\\nnewline"} 1'
+    ]
+
+def test_collectors_are_read_at_scrape_time():
+    values = {"queued": 1}
+
+    def collector():
+        return [("test_queue_depth", "gauge", "Test gauge.", [({}, values["queued"])])]
+
+    metrics.register_collector(collector)
+    try:
+        assert _samples("test_queue_depth ") == ["test_queue_depth 1"]
+        values["queued"] = 4
+        assert _samples("test_queue_depth ") == ["test_queue_depth 4"]
+        assert "# TYPE test_queue_depth gauge" in metrics.render_metrics()
+    finally:
+        metrics._collectors.remove(collector)
+
+def test_app_serves_metrics():
+    import app
+    response = app.app.test_client().get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert b"# TYPE batch_jobs_total counter" in response.data
+
+def test_worker_daemon_serves_metrics():
+    import requests
+    import worker_daemon
+    server = worker_daemon.start_metrics_server(0, host="127.0.0.1")
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        response = requests.get(f"{base}/metrics", timeout=5)
+        assert response.status_code == 200
+        assert "# TYPE openrouter_retries_total counter" in response.text
+        assert requests.get(f"{base}/other", timeout=5).status_code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
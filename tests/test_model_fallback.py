@@ -0,0 +1,59 @@
+import pytest
+import requests
+import openrouter_client
+
+def _http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(f"{status_code} error", response=response)
+
+@pytest.mark.parametrize("error, failure", [
+    (requests.Timeout("slow"), "timeout"),
+    (requests.ConnectionError("reset"), "connection_error"),
+    (_http_error(429), "rate_limited"),
+    (_http_error(503), "overloaded"),
+    (_http_error(404), "model_unavailable"),
+    (_http_error(500), "server_error"),
+    (_http_error(401), "client_error"),
+    (KeyError("content"), "invalid_response"),
+    (openrouter_client.RequestCancelled("stop"), "cancelled")
+])
+def test_classify_failure(error, failure):
+    assert openrouter_client.classify_failure(error) == failure
+
+def test_unhealthy_models_are_tried_last():
+    for _ in range(openrouter_client.HEALTH_MIN_SAMPLES):
+        openrouter_client.record_model_outcome("test/failing", False)
+        openrouter_client.record_model_outcome("test/healthy", True, 1.0)
+    assert openrouter_client.model_health("test/failing")["score"] == 0
+    assert openrouter_client.model_health("test/healthy")["score"] == 1.0
+    assert openrouter_client.model_health("test/unseen")["score"] is None
+    order = openrouter_client.order_models_by_health(["test/failing", "test/unseen", "test/healthy"])
+    assert order == ["test/unseen", "test/healthy", "test/failing"]
+
+def test_old_outcomes_age_out(monkeypatch):
+    for _ in range(openrouter_client.HEALTH_MIN_SAMPLES):
+        openrouter_client.record_model_outcome("test/recovered", False)
+    monkeypatch.setattr(openrouter_client, "HEALTH_MAX_AGE", -1)
+    assert openrouter_client.model_health("test/recovered")["score"] is None
+    assert openrouter_client.order_models_by_health(["test/recovered", "test/other"]) == ["test/recovered", "test/other"]
+
+def test_failed_request_falls_back_to_the_next_model(run_job):
+    def reply(payload):
+        if payload["model"] == "test/primary":
+            raise requests.Timeout("timed out")
+        return "from fallback"
+
+    meta, rows, sent = run_job({"a.txt": "text"}, reply=reply, model="test/primary", fallback_models=["test/backup"])
+    assert [payload["model"] for payload in sent] == ["test/primary", "test/backup"]
+    assert rows["a.txt"] == "from fallback"
+    assert meta["answered_by"] == {"test/backup": 1}
+    assert meta["cost_summary"]["fallback_answers"] == 1
+
+def test_client_errors_do_not_fall_back(run_job):
+    def reply(payload):
+        raise _http_error(401)
+
+    meta, rows, sent = run_job({"a.txt": "text"}, reply=reply, model="test/primary", fallback_models=["test/backup"])
+    assert [payload["model"] for payload in sent] == ["test/primary"]
+    assert rows["a.txt"].startswith("ERROR:")
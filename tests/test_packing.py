@@ -0,0 +1,71 @@
+import json
+import re
+
+import worker
+
+SECTION_RE = re.compile(r"<<<FILE id=(\d+)>>>\n(.*?)\n<<<END FILE id=\1>>>", re.S)
+
+def _is_pack(payload):
+    return payload.get("response_format") == worker.PACK_RESPONSE_FORMAT
+
+def _user_text(payload):
+    return " ".join(part.get("text", "") for part in payload["messages"][-1]["content"])
+
+def _pack_reply(payload, skip=()):
+    results = [
+        {"id": section_id, "output": f"packed {text}"}
+        for section_id, text in SECTION_RE.findall(_user_text(payload))
+        if text not in skip
+    ]
+    return json.dumps({"results": results})
+
+def _group(path):
+    return {"id": path.name, "files": [str(path)], "is_folder": False}
+
+def test_packs_respect_budget_and_file_limit(tmp_path):
+    groups = []
+    for idx, size in enumerate([100, 100, 100, 300, 100]):
+        path = tmp_path / f"f{idx}.txt"
+        path.write_text("x" * size)
+        groups.append(_group(path))
+    image = tmp_path / "scan.png"
+    image.write_bytes(b"\x89PNG")
+    groups.append(_group(image))
+    packs = worker._build_packs(groups, budget_bytes=600, max_files=3)
+    assert [[group["id"] for group in pack] for pack in packs] == [["f0.txt", "f1.txt", "f2.txt"], ["f3.txt", "f4.txt"]]
+    assert worker._build_packs(groups, budget_bytes=600, max_files=1) == []
+
+def test_parse_pack_reply_keeps_the_first_output_per_section():
+    reply = json.dumps({"results": [{"id": 1, "output": "a"}, {"id": "1", "output": "b"}, {"id": 2, "output": 3}]})
+    assert worker._parse_pack_reply(reply) == {"1": "a"}
+    assert worker._parse_pack_reply("not json") == {}
+
+def test_small_files_share_one_request(run_job):
+    files = {f"f{idx}.txt": f"text {idx}" for idx in range(4)}
+    meta, rows, sent = run_job(files, reply=_pack_reply, pack_small_files=True)
+    assert len(sent) == 1
+    assert rows == {f"f{idx}.txt": f"packed text {idx}" for idx in range(4)}
+    assert meta["cost_summary"]["packed_files"] == 4
+
+def test_file_missing_from_the_pack_reply_gets_its_own_request(run_job):
+    def reply(payload):
+        return _pack_reply(payload, skip={"text 2"}) if _is_pack(payload) else "single"
+
+    files = {f"f{idx}.txt": f"text {idx}" for idx in range(4)}
+    meta, rows, sent = run_job(files, reply=reply, pack_small_files=True)
+    assert len(sent) == 2
+    assert rows["f2.txt"] == "single"
+    assert rows["f0.txt"] == "packed text 0"
+    assert meta["cost_summary"]["pack_fallback_files"] == 1
+
+def test_failed_pack_falls_back_to_per_file_requests(run_job):
+    def reply(payload):
+        if _is_pack(payload):
+            raise RuntimeError("pack failed")
+        return "single"
+
+    files = {f"f{idx}.txt": f"text {idx}" for idx in range(3)}
+    meta, rows, sent = run_job(files, reply=reply, pack_small_files=True)
+    assert len(sent) == 4
+    assert rows == {f"f{idx}.txt": "single" for idx in range(3)}
+    assert meta["cost_summary"]["pack_fallback_files"] == 3
@@ -0,0 +1,56 @@
+import io, json, time, zipfile, threading
+
+import worker
+
+def _journal(job_dir, rows, tail=""):
+    job_dir.mkdir(parents=True, exist_ok=True)
+    with open(job_dir / worker.PARTIAL_ROWS_FILE, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+        f.write(tail)
+    return str(job_dir)
+
+def _row(idx, output):
+    return {"index": idx, "file": f"f{idx}.txt", "is_folder": False, "output": output, "model": "test/model"}
+
+def _unzip(job_dir, meta):
+    return zipfile.ZipFile(io.BytesIO(b"".join(worker.iter_partial_results_zip(job_dir, meta))))
+
+def test_rows_come_back_in_input_order(tmp_path):
+    job_dir = _journal(tmp_path / "job", [_row(2, "two"), _row(0, "zero")], tail='{"index": 1, "fi')
+    assert [row["output"] for row in worker.load_partial_rows(job_dir)] == ["zero", "two"]
+    assert worker.load_partial_rows(str(tmp_path / "missing")) is None
+
+def test_partial_zip_holds_the_finished_rows(tmp_path):
+    job_dir = _journal(tmp_path / "job", [_row(1, "one"), _row(0, "zero")])
+    archive = _unzip(job_dir, {"source_route": "index", "output_formats": ["csv", "json", "text"]})
+    assert archive.read("output.csv").decode("utf-8") == "file,output\nf0.txt,zero\nf1.txt,one\n"
+    assert [row["raw_output"] for row in json.loads(archive.read("output.json"))] == ["zero", "one"]
+    assert sorted(name for name in archive.namelist() if name.endswith(".txt")) == ["f0.txt", "f1.txt"]
+    assert archive.read("f1.txt") == b"one"
+
+def test_marc_records_keep_their_position_in_the_job(tmp_path):
+    job_dir = _journal(tmp_path / "job", [_row(0, "000000001 LDR"), _row(2, "000000001 LDR")])
+    archive = _unzip(job_dir, {"source_route": "marc"})
+    assert archive.read("results_concatenated.txt").decode("utf-8") == "000000001 LDR\n000000003 LDR"
+
+def test_running_job_journals_rows_until_it_finishes(run_job, tmp_path):
+    gate = threading.Event()
+
+    def reply(payload):
+        if "slow" in json.dumps(payload):
+            gate.wait(5)
+        return "done"
+
+    thread = threading.Thread(target=run_job, args=({"a.txt": "fast", "b.txt": "slow"},), kwargs={"reply": reply})
+    thread.start()
+    journal = tmp_path / "job" / worker.PARTIAL_ROWS_FILE
+    deadline = time.monotonic() + 5
+    while not (journal.exists() and journal.read_text()):
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    archive = _unzip(str(tmp_path / "job"), {"source_route": "index", "output_formats": ["csv"]})
+    assert archive.read("output.csv").decode("utf-8") == "file,output\na.txt,done\n"
+    gate.set()
+    thread.join(10)
+    assert not journal.exists()
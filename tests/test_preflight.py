@@ -0,0 +1,122 @@
+import struct
+import zlib
+
+import pytest
+import preflight
+
+def _text_files(tmp_path, sizes):
+    paths = []
+    for idx, size in enumerate(sizes):
+        path = tmp_path / f"f{idx:02d}.txt"
+        path.write_text("x" * size)
+        paths.append(str(path))
+    return paths
+
+def _group(paths, group_id="folder/"):
+    return {"id": group_id, "files": paths, "is_folder": True}
+
+def test_model_limits_use_longest_prefix():
+    assert preflight.model_limits("google/gemini-2.5-flash")["max_input_tokens"] == 900000
+    assert preflight.model_limits("someone/unknown") == preflight.MODEL_LIMITS[""]
+    assert preflight.model_limits(None) == preflight.MODEL_LIMITS[""]
+
+def test_group_within_limits_is_unchanged(tmp_path):
+    group = _group(_text_files(tmp_path, [100, 200]))
+    planned, report = preflight.apply_size_limits([group], "mistralai/small")
+    assert planned == [group]
+    assert report == []
+
+def test_oversized_group_is_chunked(tmp_path):
+    # 110000 tokens max: three 40000-token files need two requests.
+    paths = _text_files(tmp_path, [160000, 160000, 160000])
+    planned, report = preflight.apply_size_limits([_group(paths)], "mistralai/small", policy="chunk")
+    assert [group["id"] for group in planned] == ["folder__part1/", "folder__part2/"]
+    assert [len(group["files"]) for group in planned] == [2, 1]
+    assert not any(group.get("skip_reason") for group in planned)
+    assert report[0]["parts"] == 2
+
+def test_oversized_group_is_subsampled_evenly(tmp_path):
+    paths = _text_files(tmp_path, [160000] * 5)
+    planned, report = preflight.apply_size_limits([_group(paths)], "mistralai/small", policy="subsample")
+    assert planned[0]["files"] == [paths[0], paths[4]]
+    assert report[0]["kept_files"] == 2
+
+def test_single_oversized_file_is_rejected(tmp_path):
+    paths = _text_files(tmp_path, [500000])
+    planned, report = preflight.apply_size_limits([_group(paths)], "mistralai/small", policy="chunk")
+    assert planned[0]["skip_reason"].startswith("Group exceeds model limits")
+    assert report[0]["action"] == "reject"
+
+def test_unknown_policy_falls_back_to_chunk(tmp_path):
+    paths = _text_files(tmp_path, [160000, 160000, 160000])
+    planned, _ = preflight.apply_size_limits([_group(paths)], "mistralai/small", policy="bogus")
+    assert len(planned) == 2
+
+def _png():
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    pixels = b"".join(b"\0" + b"\x10\x20\x30" * 4 for _ in range(4))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", 4, 4, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(pixels))
+        + chunk(b"IEND", b"")
+    )
+
+def _jpeg():
+    def segment(marker, data):
+        return b"\xff" + bytes([marker]) + struct.pack(">H", len(data) + 2) + data
+    # The EXIF thumbnail carries its own SOS and EOI markers.
+    thumbnail = b"\xff\xd8" + segment(0xDA, b"\0" * 8) + b"\x01\x02\xff\xd9"
+    return (
+        b"\xff\xd8"
+        + segment(0xE1, b"Exif\0\0" + thumbnail)
+        + segment(0xC0, b"\x08\x00\x04\x00\x04\x03" + b"\0" * 9)
+        + segment(0xDA, b"\0" * 10)
+        + b"\x12\x34\xff\x00" * 3000
+        + b"\xff\xd9"
+    )
+
+def _tiff(strip=b"\x80" * 3000):
+    entries = [(256, 3, 1, 4), (257, 3, 1, 4), (273, 4, 1, 8 + 2 + 4 * 12 + 4), (279, 4, 1, len(strip))]
+    ifd = struct.pack("<H", len(entries)) + b"".join(struct.pack("<HHII", *entry) for entry in entries) + b"\0" * 4
+    return b"II*\x00" + struct.pack("<I", 8) + ifd + strip
+
+@pytest.mark.parametrize("name, data, warning", [
+    ("whole.png", _png(), None),
+    ("trailer.png", _png() + b"\0" * 500, None),
+    ("cut.png", _png()[:-6], "image appears truncated"),
+    ("whole.jpg", _jpeg(), None),
+    ("trailer.jpg", _jpeg() + b"X" * 100000, None),
+    ("cut.jpg", _jpeg()[:-500], "image appears truncated"),
+    ("whole.tif", _tiff(), None),
+    ("cut.tif", _tiff()[:-100], "image appears truncated"),
+])
+def test_truncation_is_judged_by_the_end_marker(tmp_path, name, data, warning):
+    path = tmp_path / name
+    path.write_bytes(data)
+    result = preflight.validate_file(str(path))
+    assert result["issue"] is None
+    assert result["warning"] == warning
+
+def test_invalid_files_are_dropped_and_suspect_ones_kept(tmp_path):
+    cut = tmp_path / "cut.jpg"
+    cut.write_bytes(_jpeg()[:-500])
+    fake = tmp_path / "fake.png"
+    fake.write_bytes(b"not an image")
+    text = tmp_path / "page.txt"
+    text.write_text("hello")
+    group = _group([str(cut), str(fake), str(text)])
+
+    groups, report, mimes = preflight.validate_groups([group], str(tmp_path))
+
+    assert groups[0]["files"] == [str(cut), str(text)]
+    assert groups[0]["dropped_files"] == ["fake.png"]
+    assert report["invalid_files"] == [{"file": "fake.png", "issue": "not a recognised image format"}]
+    assert report["suspect_files"] == [{"file": "cut.jpg", "issue": "image appears truncated"}]
+    assert mimes[str(text)] == "text/plain"
+
+def test_text_file_must_be_utf8(tmp_path):
+    path = tmp_path / "latin.txt"
+    path.write_bytes("café".encode("latin-1"))
+    assert preflight.validate_file(str(path))["issue"] == "not valid UTF-8 at byte 3"
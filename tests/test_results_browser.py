@@ -0,0 +1,52 @@
+import os, json, zipfile
+
+import pytest
+import results_browser
+
+def _results_zip(path, rows):
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("output.csv", "file,output\n" + "".join(f"f{idx}.txt,row {idx}\n" for idx in range(rows)))
+        archive.writestr("output.json", json.dumps([{"file": f"f{idx}.txt", "output": f"row {idx}"} for idx in range(rows)]))
+        archive.writestr("input/a.txt", "a")
+        archive.writestr("input/b.txt", "b")
+    return str(path)
+
+def test_members_are_listed_in_pages(tmp_path):
+    zip_path = _results_zip(tmp_path / "results.zip", 3)
+    listing = results_browser.list_results_members(zip_path, offset=1, limit=2)
+    assert listing["total"] == 4
+    assert [member["name"] for member in listing["members"]] == ["output.json", "input/a.txt"]
+    listing = results_browser.list_results_members(zip_path, prefix="input/")
+    assert [member["name"] for member in listing["members"]] == ["input/a.txt", "input/b.txt"]
+
+def test_member_is_streamed(tmp_path, monkeypatch):
+    monkeypatch.setattr(results_browser, "MEMBER_CHUNK_BYTES", 4)
+    zip_path = _results_zip(tmp_path / "results.zip", 3)
+    assert results_browser.results_member_info(zip_path, "missing.txt") is None
+    chunks = list(results_browser.iter_results_member(zip_path, "output.csv"))
+    assert len(chunks) > 1
+    assert b"".join(chunks).startswith(b"file,output\nf0.txt,row 0\n")
+
+@pytest.mark.parametrize("name", ["output.csv", "output.json"])
+def test_row_ranges(tmp_path, name):
+    zip_path = _results_zip(tmp_path / "results.zip", 250)
+    page = results_browser.read_results_rows(zip_path, name, start=100, stop=102)
+    assert [row["output"] for row in page["rows"]] == ["row 100", "row 101"]
+    assert page["stop"] == 102 and page["has_more"]
+    page = results_browser.read_results_rows(zip_path, name, start=249, stop=400)
+    assert [row["file"] for row in page["rows"]] == ["f249.txt"]
+    assert not page["has_more"]
+
+def test_rewritten_archive_is_reopened(tmp_path):
+    zip_path = _results_zip(tmp_path / "results.zip", 1)
+    assert results_browser.list_results_members(zip_path)["total"] == 4
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        archive.writestr("output.csv", "file,output\n")
+    stat = os.stat(zip_path)
+    os.utime(zip_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert results_browser.list_results_members(zip_path)["total"] == 1
+
+def test_rows_need_a_table_member(tmp_path):
+    zip_path = _results_zip(tmp_path / "results.zip", 1)
+    with pytest.raises(ValueError):
+        results_browser.read_results_rows(zip_path, "input/a.txt")
@@ -0,0 +1,63 @@
+import os
+
+import retention
+
+NOW = 1_000_000_000
+
+def _entry(name, days_ago, size=10):
+    return {"name": name, "bytes": size, "last_access": NOW - days_ago * retention.DAY_SECONDS}
+
+def _names(evict):
+    return [entry["name"] for entry in evict]
+
+def test_old_entries_go_first_then_least_recently_used():
+    entries = [_entry("new", 1), _entry("old", 40), _entry("mid", 10), _entry("older", 50)]
+    evict, remaining = retention.plan_evictions(entries, [], max_age_days=30, max_count=1, now=NOW)
+    assert _names(evict) == ["older", "old", "mid"]
+    assert evict[0]["reason"] == "not accessed for 50 days"
+    assert evict[2]["reason"] == "over the count limit"
+    assert remaining == {"count": 1, "bytes": 10}
+
+def test_size_limit_evicts_until_it_holds():
+    entries = [_entry("a", 3, 50), _entry("b", 2, 50), _entry("c", 1, 50)]
+    evict, remaining = retention.plan_evictions(entries, [], max_bytes=100, now=NOW)
+    assert _names(evict) == ["a"]
+    assert evict[0]["reason"] == "over the size limit"
+    assert remaining["bytes"] == 100
+
+def test_protected_and_recent_entries_are_kept_but_counted():
+    entries = [_entry("active", 90), _entry("fresh", 0.01), _entry("idle", 5)]
+    evict, remaining = retention.plan_evictions(
+        entries, ["active"], max_age_days=30, max_count=1, grace_seconds=3600, now=NOW
+    )
+    assert _names(evict) == ["idle"]
+    assert remaining["count"] == 2
+
+def test_no_limits_evict_nothing():
+    assert retention.plan_evictions([_entry("a", 999)], [], now=NOW)[0] == []
+
+def test_scans_use_the_latest_access(tmp_path):
+    jobs = tmp_path / "jobs"
+    (jobs / "job-a").mkdir(parents=True)
+    (jobs / "job-a" / "output.csv").write_text("12345")
+    (jobs / retention.TRASH_DIR_NAME).mkdir()
+    os.utime(jobs / "job-a", (100, 100))
+    retention.touch_last_access(str(jobs / "job-a"))
+    [job] = retention.scan_jobs(str(jobs))
+    assert job["name"] == "job-a" and job["bytes"] == 5
+    assert job["last_access"] > 100
+
+    zips = tmp_path / "zips"
+    zips.mkdir()
+    (zips / "a.zip").write_bytes(b"zip")
+    (zips / "notes.txt").write_text("ignored")
+    os.utime(zips / "a.zip", (100, 100))
+    [entry] = retention.scan_zips(str(zips), [{"zip_name": "a.zip", "last_used_at": 500}])
+    assert entry == {"name": "a.zip", "bytes": 3, "last_access": 500}
+
+def test_removed_job_leaves_no_trace(tmp_path):
+    (tmp_path / "job-a" / "input").mkdir(parents=True)
+    retention.remove_job_directory(str(tmp_path), "job-a")
+    retention.empty_trash(str(tmp_path))
+    assert os.listdir(tmp_path) == [retention.TRASH_DIR_NAME]
+    assert os.listdir(tmp_path / retention.TRASH_DIR_NAME) == []
@@ -0,0 +1,55 @@
+import worker
+
+def _user_text(payload):
+    return " ".join(part.get("text", "") for part in payload["messages"][-1]["content"])
+
+def _files(count):
+    return {f"f{idx}.txt": f"text {idx}" for idx in range(count)}
+
+def test_retry_sends_only_failed_groups(run_job):
+    def flaky(payload):
+        if "text 1" in _user_text(payload):
+            raise RuntimeError("rate limited")
+        return "first run"
+
+    meta, rows, sent = run_job(_files(3), reply=flaky)
+    assert len(sent) == 3
+    assert rows["f1.txt"] == "ERROR: rate limited"
+    assert meta["failed_groups"] == 1
+
+    meta, rows, sent = run_job(_files(3), reply=lambda payload: "retried", **dict(meta, retry_failed_only=True))
+    assert len(sent) == 1
+    assert "text 1" in _user_text(sent[0])
+    assert rows == {"f0.txt": "first run", "f1.txt": "retried", "f2.txt": "first run"}
+    assert meta["failed_groups"] == 0
+    assert meta["retried_groups"] == 1
+    assert not meta["retry_failed_only"]
+
+def test_retry_resends_rows_that_failed_validation(run_job):
+    options = {
+        "output_formats": ["csv", "json"],
+        "structured_output": True,
+        "json_schema": {"type": "object", "properties": {"title": {"type": "string"}}, "required": ["title"]}
+    }
+
+    def reply(payload):
+        return "not json" if "text 2" in _user_text(payload) else '{"title": "ok"}'
+
+    meta, rows, sent = run_job(_files(3), reply=reply, **options)
+    assert meta["failed_groups"] == 0
+    assert meta["invalid_groups"] == 1
+
+    meta, rows, sent = run_job(_files(3), reply=lambda payload: '{"title": "fixed"}', **dict(meta, retry_failed_only=True))
+    assert len(sent) == 1
+    assert "text 2" in _user_text(sent[0])
+    assert rows["f2.txt"] == '{"title": "fixed"}'
+    assert meta["invalid_groups"] == 0
+
+def test_row_needs_retry():
+    structured = {"source_route": "index", "output_formats": ["json"], "structured_output": True}
+    assert worker.row_needs_retry({"output": "ERROR: timeout"}, {})
+    assert worker.row_needs_retry({"output": "FMT   L BK", "record_errors": [{"error": "bad"}]}, {})
+    assert not worker.row_needs_retry({"output": "FMT   L BK", "record_errors": []}, {})
+    assert worker.row_needs_retry({"output": "{broken"}, structured)
+    assert not worker.row_needs_retry({"output": "{broken"}, {})
+    assert not worker.row_needs_retry({"output": "{}"}, structured)
@@ -0,0 +1,74 @@
+import threading
+
+import scheduler
+from scheduler import FairShareScheduler
+
+def _blocked_scheduler():
+    # One dispatch slot, held by a gate task until the test has queued its work.
+    pool = FairShareScheduler(1)
+    gate = threading.Event()
+    pool.register_job("gate")
+    pool.submit("gate", gate.wait, 5)
+    return pool, gate
+
+def test_parse_weights_skips_bad_entries():
+    weights = scheduler.parse_weights("index=2, marc=0, bad, user=x,big=4.5")
+    assert weights == {"index": 2.0, "marc": scheduler.MIN_WEIGHT, "big": 4.5}
+    assert scheduler.parse_weights("") == {}
+
+def test_job_weight_multiplies_route_and_user(monkeypatch):
+    monkeypatch.setattr(scheduler, "ROUTE_WEIGHTS", {"marc": 2.0})
+    monkeypatch.setattr(scheduler, "USER_WEIGHTS", {"alice": 3.0})
+    assert scheduler.job_weight("marc", "alice") == 6.0
+    assert scheduler.job_weight("index", "alice") == 3.0
+    assert scheduler.job_weight("marc") == 2.0
+    assert scheduler.job_weight(None, None) == 1.0
+
+def test_capacity_is_shared_by_weight():
+    pool, gate = _blocked_scheduler()
+    order = []
+    pool.register_job("a", weight=3)
+    pool.register_job("b", weight=1)
+    futures = [pool.submit(job_id, order.append, job_id) for _ in range(8) for job_id in ("a", "b")]
+    gate.set()
+    for future in futures:
+        future.result(timeout=5)
+    assert order[:8].count("a") == 6
+    assert order[:8].count("b") == 2
+
+def test_higher_priority_goes_first():
+    pool, gate = _blocked_scheduler()
+    order = []
+    pool.register_job("low", priority=scheduler.PRIORITIES["low"])
+    pool.register_job("high", priority=scheduler.PRIORITIES["high"])
+    futures = [pool.submit("low", order.append, "low") for _ in range(3)]
+    futures += [pool.submit("high", order.append, "high") for _ in range(3)]
+    gate.set()
+    for future in futures:
+        future.result(timeout=5)
+    assert order == ["high"] * 3 + ["low"] * 3
+
+def test_cancel_job_cancels_queued_work_and_refuses_more():
+    pool, gate = _blocked_scheduler()
+    pool.register_job("a")
+    queued = [pool.submit("a", lambda: None) for _ in range(3)]
+    assert pool.cancel_job("a")
+    assert all(future.cancelled() for future in queued)
+    assert pool.submit("a", lambda: None).cancelled()
+    assert pool.job_snapshot("a")["queued"] == 0
+    assert not pool.cancel_job("missing")
+    gate.set()
+
+def test_paused_job_is_not_dispatched():
+    pool, gate = _blocked_scheduler()
+    pool.register_job("a")
+    pool.register_job("b")
+    pool.pause_job("a")
+    paused = pool.submit("a", lambda: "a")
+    running = pool.submit("b", lambda: "b")
+    gate.set()
+    assert running.result(timeout=5) == "b"
+    assert not paused.done()
+    assert pool.job_snapshot("a")["queued"] == 1
+    pool.pause_job("a", paused=False)
+    assert paused.result(timeout=5) == "a"
@@ -0,0 +1,62 @@
+import pytest
+import search_index
+
+RECORD = "\n".join([
+    "000000001 FMT   L BK",
+    "000000001 1001  L $$aBerzinš, Jānis,$$d1900-1980.",
+    "000000001 24510 L $$aDzeja un proza :$$bizlase /$$cJānis Bērziņš.",
+])
+
+@pytest.fixture(autouse=True)
+def index_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(search_index, "SEARCH_INDEX_PATH", str(tmp_path / "search.sqlite3"))
+
+@pytest.mark.parametrize("query, field, expected", [
+    ("riga", None, '"riga"'),
+    ("riga latvia", None, '"riga" "latvia"'),
+    ("lat*", None, '"lat"*'),
+    ('riga" OR title:x NEAR(', None, '"riga" "OR" "title" "x" "NEAR"'),
+    ("riga", "title", 'title : ("riga")'),
+    ("riga", "job_id", '"riga"'),
+    ("*** ()", None, None),
+    ("", None, None),
+])
+def test_match_expression_quotes_user_terms(query, field, expected):
+    assert search_index._match_expression(query, field) == expected
+
+def test_extract_record_fields():
+    title, author = search_index.extract_record_fields(RECORD)
+    assert title == "Dzeja un proza : izlase"
+    assert author == "Berzinš, Jānis"
+
+def test_index_and_search():
+    rows = [
+        {"file": "book.jpg", "output": RECORD, "model": "m1"},
+        {"file": "note.txt", "output": "Rīga harbour plan"},
+        {"file": "failed.jpg", "output": "ERROR: timed out"},
+    ]
+    assert search_index.index_job_rows("job1", rows, route="marc", default_model="m0") == 2
+
+    found = search_index.search_outputs("proza", field="title")
+    assert found["total"] == 1
+    assert found["results"][0]["file"] == "book.jpg"
+    assert found["results"][0]["model"] == "m1"
+    assert search_index.search_outputs("proza", field="author")["total"] == 0
+
+    # Diacritics are folded, prefixes match.
+    found = search_index.search_outputs("riga harb*")
+    assert [result["file"] for result in found["results"]] == ["note.txt"]
+    assert found["results"][0]["model"] == "m0"
+    assert search_index.search_outputs("timed")["total"] == 0
+    assert search_index.search_outputs('"unbalanced')["total"] == 0
+
+def test_reindexing_replaces_earlier_rows():
+    search_index.index_job_rows("job1", [{"file": "a.txt", "output": "first run"}])
+    search_index.index_job_rows("job1", [{"file": "a.txt", "output": "second run"}])
+    assert search_index.search_outputs("first")["total"] == 0
+    assert search_index.search_outputs("second")["total"] == 1
+    search_index.forget_job_outputs("job1")
+    assert search_index.search_outputs("second")["total"] == 0
+
+def test_search_without_index():
+    assert search_index.search_outputs("anything")["total"] == 0
@@ -0,0 +1,57 @@
+import json
+import time
+
+import pytest
+import requests
+import openrouter_client
+
+def _events(*events, delay=0.0):
+    for event in events:
+        if delay:
+            time.sleep(delay)
+        if isinstance(event, bytes):
+            yield event
+        else:
+            yield f"data: {json.dumps(event)}\n\n".encode("utf-8")
+    yield b"data: [DONE]\n\n"
+
+def _delta(text):
+    return {"choices": [{"delta": {"content": text}}]}
+
+def test_stream_collects_deltas_and_usage(openrouter):
+    openrouter.respond = lambda body: (200, _events(
+        b": OPENROUTER PROCESSING\n\n",
+        _delta("Hel"),
+        _delta("lo"),
+        {"choices": [], "usage": {"completion_tokens": 2}},
+        delay=0.05
+    ))
+    partials = []
+    result = openrouter_client.send_completion(
+        {"model": "a", "messages": []}, "key", stream=True, on_delta=partials.append
+    )
+    assert openrouter.requests[0]["stream"] is True
+    assert result["reply"] == "Hello"
+    assert result["usage"] == {"completion_tokens": 2}
+    assert result["streamed"]
+    assert result["ttft"] is not None
+    assert partials == ["Hel", "Hello"]
+
+def test_stream_error_event_fails_the_request(openrouter):
+    openrouter.respond = lambda body: (200, _events(_delta("Hel"), {"error": {"message": "provider went away"}}))
+    with pytest.raises(RuntimeError, match="provider went away"):
+        openrouter_client.send_completion({"model": "a", "messages": []}, "key", stream=True)
+
+def test_stream_without_content_is_invalid(openrouter):
+    openrouter.respond = lambda body: (200, _events({"choices": [], "usage": {}}))
+    with pytest.raises(KeyError):
+        openrouter_client.send_completion({"model": "a", "messages": []}, "key", stream=True)
+
+def test_stalled_stream_times_out(openrouter, monkeypatch):
+    monkeypatch.setattr(openrouter_client, "STREAM_STALL_TIMEOUT", 0.5)
+    keep_alives = [b": OPENROUTER PROCESSING\n\n"] * 20
+    openrouter.respond = lambda body: (200, _events(_delta("Hel"), *keep_alives, delay=0.2))
+    started = time.monotonic()
+    with pytest.raises(requests.Timeout, match="stalled"):
+        openrouter_client.send_completion({"model": "a", "messages": []}, "key", stream=True)
+    assert time.monotonic() - started < 2
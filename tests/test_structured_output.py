@@ -0,0 +1,65 @@
+import pytest
+import structured_output
+from structured_output import parse_json_schema, response_format_for, validate_json_reply
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "year": {"type": ["integer", "null"]},
+        "kind": {"type": "string", "enum": ["book", "map"]},
+        "pages": {"type": "array", "items": {"type": "integer"}},
+    },
+    "required": ["title", "kind"],
+    "additionalProperties": False,
+}
+
+def test_parse_json_schema():
+    assert parse_json_schema("") is None
+    assert parse_json_schema("  ") is None
+    assert parse_json_schema('{"properties": {}}') == {"properties": {}}
+    with pytest.raises(ValueError, match="not valid JSON"):
+        parse_json_schema("{")
+    with pytest.raises(ValueError, match="must be a JSON object"):
+        parse_json_schema("[]")
+    with pytest.raises(ValueError, match="must describe an object"):
+        parse_json_schema('{"type": "array"}')
+
+def test_response_format():
+    assert response_format_for(None) == {"type": "json_object"}
+    response_format = response_format_for(SCHEMA)
+    assert response_format["type"] == "json_schema"
+    assert response_format["json_schema"] == {
+        "name": structured_output.SCHEMA_NAME, "strict": True, "schema": SCHEMA
+    }
+
+def test_valid_reply():
+    value, errors = validate_json_reply('{"title": "Atlas", "year": null, "kind": "map", "pages": [1, 2]}', SCHEMA)
+    assert errors == []
+    assert value["kind"] == "map"
+
+@pytest.mark.parametrize("reply, expected", [
+    ('{"kind": "book"}', ["$: missing required property 'title'"]),
+    ('{"title": "A", "kind": "poem"}', ['$.kind: not one of ["book", "map"]']),
+    ('{"title": "A", "kind": "book", "year": 1.5}', ["$.year: expected integer or null"]),
+    ('{"title": "A", "kind": "book", "year": true}', ["$.year: expected integer or null"]),
+    ('{"title": "A", "kind": "book", "pages": [1, "2"]}', ["$.pages[1]: expected integer"]),
+    ('{"title": "A", "kind": "book", "extra": 1}', ["$: unexpected property 'extra'"]),
+    ('["A"]', ["$: expected object"]),
+])
+def test_schema_errors(reply, expected):
+    assert validate_json_reply(reply, SCHEMA)[1] == expected
+
+def test_reply_must_be_strict_json():
+    value, errors = validate_json_reply('```json\n{"title": "A"}\n```')
+    assert value is None
+    assert errors[0].startswith("not valid JSON")
+    assert validate_json_reply('{"a": 1,}')[1][0].startswith("not valid JSON")
+    assert validate_json_reply("[1]") == ([1], ["$: expected object"])
+    assert validate_json_reply('{"a": 1}') == ({"a": 1}, [])
+
+def test_repair_messages():
+    errors = [f"$.field{idx}: expected string" for idx in range(30)]
+    messages = structured_output.json_repair_messages("{}", errors)
+    assert messages[0] == {"role": "assistant", "content": "{}"}
+    assert messages[1]["content"].count("- $.field") == structured_output.MAX_REPORTED_ERRORS
@@ -0,0 +1,44 @@
+import json
+
+import tracing
+
+def test_summary_groups_spans_by_category_and_name(tmp_path):
+    trace = tracing.JobTrace("job", str(tmp_path))
+    trace.add_span("send", "request", 10.0, 11.0, model="a")
+    trace.add_span("send", "request", 20.0, 23.0, model="a", hedged=None)
+    trace.add_span("validate", "stage", 5.0, 5.5)
+    summary = trace.summary()
+    assert summary["request"]["send"]["count"] == 2
+    assert summary["request"]["send"]["total"] == 4.0
+    assert summary["stage"]["validate"]["p95"] == 0.5
+    journal = [json.loads(line) for line in (tmp_path / tracing.TRACE_JOURNAL_FILE).read_text().splitlines()]
+    assert [span["name"] for span in journal] == ["send", "send", "validate"]
+    assert journal[1]["args"] == {"model": "a"}
+
+def test_chrome_trace_export(tmp_path):
+    trace = tracing.start_job_trace("export-job", str(tmp_path))
+    with trace.span("build_groups", groups=3):
+        pass
+    path = tracing.finish_job_trace("export-job")
+    with open(path, encoding="utf-8") as f:
+        exported = json.load(f)
+    complete, thread_name = exported["traceEvents"]
+    assert complete["ph"] == "X" and complete["name"] == "build_groups"
+    assert complete["args"] == {"groups": 3}
+    assert thread_name["ph"] == "M"
+    assert exported["otherData"] == {"job_id": "export-job"}
+    assert tracing.finish_job_trace("export-job") is None
+
+def test_job_records_stage_and_request_timings(run_job, tmp_path):
+    meta, rows, sent = run_job({"a.txt": "one", "b.txt": "two"}, job_id="traced")
+    stages = meta["timing_summary"]["stage"]
+    assert {"build_groups", "validate", "dispatch", "write_outputs"} <= set(stages)
+    assert meta["timing_summary"]["request"]["send"]["count"] == 2
+    spans = [json.loads(line) for line in (tmp_path / "traced" / tracing.TRACE_JOURNAL_FILE).read_text().splitlines()]
+    sends = [span for span in spans if span["name"] == "send"]
+    assert {span["args"]["group"] for span in sends} == {"a.txt", "b.txt"}
+    assert all(span["args"]["outcome"] == "ok" for span in sends)
+
+def test_timing_summary_includes_the_zip_stage(run_job):
+    meta, rows, sent = run_job({"a.txt": "one"}, job_id="zipped")
+    assert "zip" in meta["timing_summary"]["stage"]
@@ -0,0 +1,94 @@
+import io, time, uuid, zipfile, hashlib
+
+import pytest
+import upload_sessions
+
+def _zip_bytes():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("a.txt", f"unique {uuid.uuid4().hex}")
+    return buffer.getvalue()
+
+def test_chunks_append_at_the_server_offset():
+    data = b"0123456789"
+    session = upload_sessions.create_upload_session("a.zip", len(data))
+    assert upload_sessions.append_upload_chunk(session, 0, io.BytesIO(data[:4])) is None
+    with pytest.raises(upload_sessions.UploadOffsetMismatch) as error:
+        upload_sessions.append_upload_chunk(session, 0, io.BytesIO(data[:4]))
+    assert error.value.offset == 4
+    digest = upload_sessions.append_upload_chunk(session, 4, io.BytesIO(data[4:]))
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert upload_sessions.load_upload_session(session["upload_id"])["offset"] == len(data)
+    upload_sessions.discard_upload_session(session["upload_id"])
+    assert upload_sessions.load_upload_session(session["upload_id"]) is None
+
+def test_hash_is_rebuilt_from_the_part_file_after_a_restart():
+    data = b"resumable upload"
+    session = upload_sessions.create_upload_session("a.zip", len(data))
+    upload_sessions.append_upload_chunk(session, 0, io.BytesIO(data[:6]))
+    upload_sessions._hashers.clear()
+    session = upload_sessions.load_upload_session(session["upload_id"])
+    assert session["offset"] == 6
+    assert upload_sessions.append_upload_chunk(session, 6, io.BytesIO(data[6:])) == hashlib.sha256(data).hexdigest()
+    upload_sessions.discard_upload_session(session["upload_id"])
+
+def test_unknown_upload_ids_are_not_loaded():
+    assert upload_sessions.load_upload_session("../../etc/passwd") is None
+    assert upload_sessions.load_upload_session(uuid.uuid4().hex) is None
+
+def _upload(client, data, sha256=""):
+    response = client.post("/uploads", json={"filename": "batch.zip", "size": len(data), "sha256": sha256})
+    assert response.status_code == 201
+    session = response.get_json()
+    offset = session["offset"]
+    while not session["complete"] and offset < len(data):
+        response = client.put(f"/uploads/{session['upload_id']}?offset={offset}", data=data[offset:offset + 5])
+        assert response.status_code in (200, 202)
+        session = response.get_json()
+        offset = session["offset"]
+    deadline = time.monotonic() + 5
+    while not session["complete"] and not session["error"]:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+        session = client.get(f"/uploads/{session['upload_id']}").get_json()
+    return session
+
+def test_uploaded_zip_is_registered_once():
+    import app
+    client = app.app.test_client()
+    data = _zip_bytes()
+    first = _upload(client, data)
+    assert first["complete"] and first["zip_name"]
+    assert first["skipped_bytes"] == 0
+
+    again = _upload(client, data, sha256=hashlib.sha256(data).hexdigest())
+    assert again["zip_name"] == first["zip_name"]
+    assert again["skipped_bytes"] == len(data)
+
+def test_resumed_upload_gets_the_server_offset():
+    import app
+    client = app.app.test_client()
+    upload_id = client.post("/uploads", json={"filename": "batch.zip", "size": 20}).get_json()["upload_id"]
+    client.put(f"/uploads/{upload_id}?offset=0", data=b"12345")
+    response = client.put(f"/uploads/{upload_id}?offset=0", data=b"12345")
+    assert response.status_code == 409
+    assert response.get_json()["offset"] == 5
+    assert client.delete(f"/uploads/{upload_id}").get_json()["discarded"]
+    assert client.get(f"/uploads/{upload_id}").status_code == 404
+
+def test_last_chunk_registers_in_the_background():
+    import app
+    client = app.app.test_client()
+    upload_id = client.post("/uploads", json={"filename": "batch.zip", "size": 8}).get_json()["upload_id"]
+    response = client.put(f"/uploads/{upload_id}?offset=0", data=b"not a zip")
+    assert response.status_code == 202
+    assert response.get_json()["registering"]
+    deadline = time.monotonic() + 5
+    session = response.get_json()
+    while session["registering"]:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+        session = client.get(f"/uploads/{upload_id}").get_json()
+    assert not session["complete"]
+    assert "not a valid ZIP" in session["error"]
+    assert client.put(f"/uploads/{upload_id}?offset=0", data=b"x").status_code == 422
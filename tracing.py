@@ -0,0 +1,119 @@
+import os, json, time, threading
+from contextlib import contextmanager
+from openrouter_client import percentile
+import metrics
+
+TRACE_JOURNAL_FILE = "trace.jsonl"
+CHROME_TRACE_FILE = "trace.json"
+
+_job_traces = {}
+_job_traces_lock = threading.Lock()
+
+class JobTrace:
+    # Spans are appended to trace.jsonl as they finish, so a journal survives
+    # a crashed job; the Chrome trace export is written once the job ends.
+
+    def __init__(self, job_id, job_dir):
+        self.job_id = job_id
+        self.job_dir = job_dir
+        self.journal_path = os.path.join(job_dir, TRACE_JOURNAL_FILE)
+        self._spans = []
+        self._lock = threading.Lock()
+
+    def add_span(self, name, category, start, end=None, **args):
+        end = time.time() if end is None else end
+        span = {
+            "name": name,
+            "cat": category,
+            "start": round(start, 6),
+            "duration": round(max(0.0, end - start), 6),
+            "thread": threading.current_thread().name,
+            "args": {key: value for key, value in args.items() if value is not None}
+        }
+        if category == "stage":
+            metrics.observe("batch_stage_seconds", span["duration"], stage=name)
+        with self._lock:
+            self._spans.append(span)
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(span, ensure_ascii=False) + "\n")
+        return span
+
+    @contextmanager
+    def span(self, name, category="stage", **args):
+        start = time.time()
+        try:
+            yield args
+        finally:
+            self.add_span(name, category, start, **args)
+
+    def summary(self):
+        with self._lock:
+            spans = list(self._spans)
+        durations = {}
+        for span in spans:
+            durations.setdefault((span["cat"], span["name"]), []).append(span["duration"])
+        summary = {}
+        for (category, name), values in sorted(durations.items()):
+            summary.setdefault(category, {})[name] = {
+                "count": len(values),
+                "total": round(sum(values), 3),
+                "p50": round(percentile(values, 50), 3),
+                "p95": round(percentile(values, 95), 3),
+                "p99": round(percentile(values, 99), 3)
+            }
+        return summary
+
+    def export_chrome_trace(self):
+        # Trace Event Format "complete" events, loadable in chrome://tracing,
+        # Perfetto or speedscope.
+        with self._lock:
+            spans = list(self._spans)
+        thread_ids = {}
+        events = []
+        for span in spans:
+            thread_id = thread_ids.setdefault(span["thread"], len(thread_ids) + 1)
+            events.append({
+                "name": span["name"],
+                "cat": span["cat"],
+                "ph": "X",
+                "ts": int(span["start"] * 1000000),
+                "dur": int(span["duration"] * 1000000),
+                "pid": 1,
+                "tid": thread_id,
+                "args": span["args"]
+            })
+        for thread_name, thread_id in thread_ids.items():
+            events.append({
+                "name": "thread_name",
+                "ph": "M",
+                "pid": 1,
+                "tid": thread_id,
+                "args": {"name": thread_name}
+            })
+        trace_path = os.path.join(self.job_dir, CHROME_TRACE_FILE)
+        with open(trace_path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "otherData": {"job_id": self.job_id}}, f)
+        return trace_path
+
+def start_job_trace(job_id, job_dir):
+    trace = JobTrace(job_id, job_dir)
+    # A re-run starts a fresh journal.
+    if os.path.exists(trace.journal_path):
+        os.remove(trace.journal_path)
+    with _job_traces_lock:
+        _job_traces[job_id] = trace
+    return trace
+
+def get_job_trace(job_id, job_dir):
+    with _job_traces_lock:
+        trace = _job_traces.get(job_id)
+    if trace is None:
+        trace = start_job_trace(job_id, job_dir)
+    return trace
+
+def finish_job_trace(job_id):
+    with _job_traces_lock:
+        trace = _job_traces.pop(job_id, None)
+    if trace is None:
+        return None
+    return trace.export_chrome_trace()
@@ -0,0 +1,198 @@
+import os, re, json, time, uuid, hashlib, threading
+from config import UPLOAD_SESSIONS_FOLDER
+
+# Resumable chunked uploads. Each session is a <id>.part file that chunks are
+# appended to plus a <id>.json record; the part file's size is the resume
+# offset, so a session survives a restart of the web process.
+
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+UPLOAD_SESSION_MAX_AGE = 7 * 24 * 3600
+_READ_BYTES = 1024 * 1024
+_UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+# Running SHA-256 per session, kept with the offset it covers. A missing or
+# stale hasher (after a restart or a failed write) is rebuilt from the part file.
+_hashers = {}
+_upload_locks = {}
+_upload_locks_guard = threading.Lock()
+
+class UploadOffsetMismatch(Exception):
+    def __init__(self, offset):
+        super().__init__(f"Upload continues at byte {offset}")
+        self.offset = offset
+
+def _paths(upload_id):
+    return (
+        os.path.join(UPLOAD_SESSIONS_FOLDER, f"{upload_id}.json"),
+        os.path.join(UPLOAD_SESSIONS_FOLDER, f"{upload_id}.part")
+    )
+
+def _upload_lock(upload_id):
+    with _upload_locks_guard:
+        lock = _upload_locks.get(upload_id)
+        if lock is None:
+            lock = threading.Lock()
+            _upload_locks[upload_id] = lock
+        return lock
+
+def _save_session(session):
+    session_path, _ = _paths(session["upload_id"])
+    temp_path = f"{session_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(session, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, session_path)
+
+def upload_part_path(upload_id):
+    return _paths(upload_id)[1]
+
+def upload_offset(upload_id):
+    part_path = upload_part_path(upload_id)
+    return os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+
+def load_upload_session(upload_id):
+    upload_id = (upload_id or "").strip().lower()
+    if not _UPLOAD_ID_RE.match(upload_id):
+        return None
+    session_path, _ = _paths(upload_id)
+    if not os.path.isfile(session_path):
+        return None
+    with open(session_path, encoding="utf-8") as f:
+        session = json.load(f)
+    session["offset"] = session["size"] if session.get("complete") else upload_offset(upload_id)
+    return session
+
+def expire_upload_sessions(max_age=UPLOAD_SESSION_MAX_AGE):
+    cutoff = time.time() - max_age
+    for filename in os.listdir(UPLOAD_SESSIONS_FOLDER):
+        upload_id, ext = os.path.splitext(filename)
+        if ext != ".json" or not _UPLOAD_ID_RE.match(upload_id):
+            continue
+        if os.path.getmtime(os.path.join(UPLOAD_SESSIONS_FOLDER, filename)) < cutoff:
+            discard_upload_session(upload_id)
+
+def pending_upload_zip_names():
+    # ZIPs of finished uploads whose form has not been submitted yet.
+    names = set()
+    if not os.path.isdir(UPLOAD_SESSIONS_FOLDER):
+        return names
+    for filename in os.listdir(UPLOAD_SESSIONS_FOLDER):
+        upload_id, ext = os.path.splitext(filename)
+        if ext != ".json" or not _UPLOAD_ID_RE.match(upload_id):
+            continue
+        try:
+            session = load_upload_session(upload_id)
+        except (OSError, ValueError):
+            continue
+        if session and session.get("complete") and session.get("zip_name"):
+            names.add(session["zip_name"])
+    return names
+
+def create_upload_session(filename, size, sha256="", source_route="index"):
+    os.makedirs(UPLOAD_SESSIONS_FOLDER, exist_ok=True)
+    expire_upload_sessions()
+    session = {
+        "upload_id": uuid.uuid4().hex,
+        "filename": filename,
+        "size": int(size),
+        "declared_sha256": (sha256 or "").strip().lower(),
+        "sha256": "",
+        "source_route": source_route,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "complete": False,
+        "registering": False,
+        "error": "",
+        "zip_name": "",
+        "skipped_bytes": 0
+    }
+    open(upload_part_path(session["upload_id"]), "wb").close()
+    _save_session(session)
+    session["offset"] = 0
+    return session
+
+def complete_upload_session(session, zip_name, skipped_bytes=0):
+    # The part file has been moved into the registry (or was not needed).
+    session["complete"] = True
+    session["registering"] = False
+    session["zip_name"] = zip_name
+    session["skipped_bytes"] = skipped_bytes
+    session.pop("offset", None)
+    _save_session(session)
+    session["offset"] = session["size"]
+    _hashers.pop(session["upload_id"], None)
+    part_path = upload_part_path(session["upload_id"])
+    if os.path.isfile(part_path):
+        os.remove(part_path)
+    return session
+
+def mark_upload_registering(session, sha256):
+    # Every byte has arrived. The part file is checked and moved into the
+    # registry off the request thread while the client polls the session.
+    session["sha256"] = sha256
+    session["registering"] = True
+    session.pop("offset", None)
+    _save_session(session)
+    session["offset"] = session["size"]
+    return session
+
+def fail_upload_session(session, error):
+    # Kept with its error so a polling client can show it; expired later.
+    upload_id = session["upload_id"]
+    session_path, part_path = _paths(upload_id)
+    if not os.path.isfile(session_path):
+        return session
+    _hashers.pop(upload_id, None)
+    if os.path.isfile(part_path):
+        os.remove(part_path)
+    session["registering"] = False
+    session["error"] = error
+    session.pop("offset", None)
+    _save_session(session)
+    session["offset"] = 0
+    return session
+
+def _running_hasher(upload_id, offset):
+    state = _hashers.get(upload_id)
+    if state is not None and state[0] == offset:
+        return state[1]
+    hasher = hashlib.sha256()
+    with open(upload_part_path(upload_id), "rb") as f:
+        while True:
+            chunk = f.read(_READ_BYTES)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher
+
+def append_upload_chunk(session, offset, stream):
+    # Returns the finished SHA-256 once the last byte has arrived, else None.
+    upload_id = session["upload_id"]
+    with _upload_lock(upload_id):
+        current = upload_offset(upload_id)
+        finished = session.get("complete") or session.get("registering")
+        if finished or offset != current:
+            raise UploadOffsetMismatch(session["size"] if finished else current)
+        hasher = _running_hasher(upload_id, current)
+        _hashers.pop(upload_id, None)
+        remaining = session["size"] - current
+        with open(upload_part_path(upload_id), "ab") as f:
+            while remaining > 0:
+                chunk = stream.read(min(_READ_BYTES, remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                hasher.update(chunk)
+                current += len(chunk)
+                remaining -= len(chunk)
+        _hashers[upload_id] = (current, hasher)
+        session["offset"] = current
+        if current < session["size"]:
+            return None
+        return hasher.hexdigest()
+
+def discard_upload_session(upload_id):
+    _hashers.pop(upload_id, None)
+    for path in _paths(upload_id):
+        if os.path.isfile(path):
+            os.remove(path)
+    with _upload_locks_guard:
+        _upload_locks.pop(upload_id, None)
@@ -1,13 +1,202 @@
-import os, requests, pandas as pd, time, json, zipfile, re
+import os, io, csv, time, json, zipfile, re, threading, hashlib
+from functools import partial
+from concurrent.futures import CancelledError, as_completed
 import base64
 import mimetypes
 from datetime import datetime
 from config import UPLOAD_FOLDER
+from openrouter_client import (
+    FALLBACK_FAILURES,
+    HedgeAttempts,
+    send_completion,
+    classify_failure,
+    order_models_by_health,
+    model_latency_snapshot,
+    model_health_snapshot,
+    percentile
+)
+from preflight import TEXT_EXTENSIONS, IMAGE_EXTENSIONS, apply_size_limits, validate_groups
+from scheduler import scheduler, PRIORITIES, job_weight
+from tracing import get_job_trace, CHROME_TRACE_FILE
+from search_index import index_job_rows
+from aleph_validator import (
+    RECORD_RETRIES_PER_GROUP,
+    validate_aleph_record,
+    record_retry_budget,
+    record_repair_messages
+)
+from structured_output import (
+    STRUCTURED_RETRIES_PER_GROUP,
+    STRUCTURED_OUTPUT_FILE,
+    response_format_for,
+    structured_retry_budget,
+    validate_json_reply,
+    json_repair_messages
+)
+from cassette import open_job_cassette
+import metrics
+LIVE_PARTIAL_MAX_CHARS = 4000
+HEDGE_DRAIN_SECONDS = 30
+PACK_DEFAULT_TOKEN_BUDGET = 6000
+PACK_BYTES_PER_TOKEN = 4
+PACK_MAX_FILES = 25
+PACK_INSTRUCTIONS = (
+    "The user message contains several independent input files, each enclosed between "
+    "<<<FILE id=N>>> and <<<END FILE id=N>>> markers. Apply the instructions above to each "
+    "file on its own, exactly as if it had been sent alone. Reply with a JSON object whose "
+    "\"results\" array holds one {\"id\": \"N\", \"output\": \"...\"} entry per file, where "
+    "output is the complete answer for that file."
+)
+PACK_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "packed_file_results",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "results": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "string"},
+                            "output": {"type": "string"}
+                        },
+                        "required": ["id", "output"],
+                        "additionalProperties": False
+                    }
+                }
+            },
+            "required": ["results"],
+            "additionalProperties": False
+        }
+    }
+}
+
+_live_partials = {}
+_live_partials_lock = threading.Lock()
+
+def _set_live_partial(job_id, group_id, text):
+    with _live_partials_lock:
+        _live_partials.setdefault(job_id, {})[group_id] = {
+            "output": text[-LIVE_PARTIAL_MAX_CHARS:],
+            "chars": len(text),
+            "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+def _clear_live_partial(job_id, group_id=None):
+    with _live_partials_lock:
+        if group_id is None:
+            _live_partials.pop(job_id, None)
+            return
+        job_partials = _live_partials.get(job_id)
+        if job_partials is not None:
+            job_partials.pop(group_id, None)
+
+def get_live_partials(job_id):
+    with _live_partials_lock:
+        job_partials = dict(_live_partials.get(job_id) or {})
+    return [
+        {"group": group_id, **partial}
+        for group_id, partial in sorted(job_partials.items())
+    ]
+
+JOB_CONTROL_FILE = "control.json"
+ROWS_FILE = "rows.json"
+PARTIAL_ROWS_FILE = "partial_rows.jsonl"
+PARTIAL_CSV_FLUSH_ROWS = 200
+INPUT_CSV_COLUMNS = ["file_name", "full_path", "file_type", "file_size"]
+RECORD_ERRORS_FILE = "record_errors.csv"
+CANCELLED_GROUP_OUTPUT = "ERROR: Job was cancelled before this group was sent"
+
+_job_controls = {}
+_job_controls_lock = threading.Lock()
+
+class JobAbandoned(Exception):
+    pass
 
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+def _job_control_unlocked(job_id):
+    control = _job_controls.get(job_id)
+    if control is None:
+        control = {"paused": False, "cancelled": False, "abandoned": False, "abort": threading.Event()}
+        _job_controls[job_id] = control
+    return control
 
-TEXT_EXTENSIONS = {".txt", ".md"}
-IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tif", ".tiff"}
+def _job_abandoned(job_id):
+    # Lock-free: cancel_job holds the lock while cancelled futures run their
+    # callbacks, and those callbacks ask this.
+    control = _job_controls.get(job_id)
+    return control is not None and control["abandoned"]
+
+def pause_job(job_id):
+    with _job_controls_lock:
+        control = _job_control_unlocked(job_id)
+        if control["cancelled"]:
+            return
+        control["paused"] = True
+        scheduler.pause_job(job_id, True)
+
+def resume_job(job_id):
+    with _job_controls_lock:
+        control = _job_control_unlocked(job_id)
+        control["paused"] = False
+        scheduler.pause_job(job_id, False)
+
+def cancel_job(job_id, abort_in_flight=False):
+    with _job_controls_lock:
+        control = _job_control_unlocked(job_id)
+        control["cancelled"] = True
+        control["paused"] = False
+        if abort_in_flight:
+            control["abort"].set()
+        scheduler.cancel_job(job_id)
+
+def abandon_job(job_id):
+    # The job now belongs to another worker: stop it, and write nothing more
+    # into its directory.
+    with _job_controls_lock:
+        _job_control_unlocked(job_id)["abandoned"] = True
+    cancel_job(job_id, abort_in_flight=True)
+
+def get_job_control(job_id):
+    with _job_controls_lock:
+        control = _job_controls.get(job_id)
+        if control is None:
+            return None
+        return {
+            "paused": control["paused"],
+            "cancelled": control["cancelled"],
+            "aborted": control["abort"].is_set()
+        }
+
+def apply_job_control_file(job_id, job_dir):
+    # Used by worker processes that cannot be reached through function calls;
+    # the web tier writes the requested action into the job directory.
+    control_path = os.path.join(job_dir, JOB_CONTROL_FILE)
+    try:
+        with open(control_path, encoding="utf-8") as f:
+            request = json.load(f)
+    except (OSError, ValueError):
+        return
+    action = request.get("action")
+    if action == "cancel":
+        cancel_job(job_id, abort_in_flight=bool(request.get("abort")))
+    elif action == "pause":
+        pause_job(job_id)
+    elif action == "resume":
+        resume_job(job_id)
+
+def write_job_control_file(job_dir, action, abort_in_flight=False):
+    control_path = os.path.join(job_dir, JOB_CONTROL_FILE)
+    temp_path = control_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "action": action,
+            "abort": bool(abort_in_flight),
+            "requested_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }, f)
+    os.replace(temp_path, control_path)
 
 def _normalize_rel(path, base_dir):
     return os.path.relpath(path, base_dir).replace(os.sep, "/")
@@ -49,6 +238,28 @@ def _build_groups(input_dir, group_by_subfolder):
 
     return groups
 
+def _file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _group_fingerprint(group):
+    # Only file contents and their order matter; names are ignored so that
+    # re-scanned copies of the same pages collapse into one request.
+    digest = hashlib.sha256()
+    digest.update(b"folder" if group["is_folder"] else b"file")
+    for fpath in group["files"]:
+        digest.update(b"\0")
+        digest.update(os.path.splitext(fpath)[1].lower().encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(_file_sha256(fpath).encode("ascii"))
+    return digest.hexdigest()
+
 def _collect_input_rows(input_dir):
     input_rows = []
     for root, _, filenames in os.walk(input_dir):
@@ -66,7 +277,7 @@ def _collect_input_rows(input_dir):
     input_rows.sort(key=lambda row: row["full_path"])
     return input_rows
 
-def _build_user_content(file_paths, input_dir, label_files):
+def _build_user_content(file_paths, input_dir, label_files, file_mimes=None):
     user_content = []
     supported = 0
 
@@ -82,7 +293,9 @@ def _build_user_content(file_paths, input_dir, label_files):
             user_content.append({"type": "text", "text": text})
             supported += 1
         elif ext in IMAGE_EXTENSIONS:
-            mime, _ = mimetypes.guess_type(fpath)
+            mime = (file_mimes or {}).get(fpath)
+            if mime is None:
+                mime, _ = mimetypes.guess_type(fpath)
             if mime is None:
                 mime = "image/png"
             with open(fpath, "rb") as img_file:
@@ -97,14 +310,85 @@ def _build_user_content(file_paths, input_dir, label_files):
 
     return user_content, supported
 
+def _build_payload(model, system_prompt, user_content, reasoning_mode):
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content}
+        ]
+    }
+    if reasoning_mode in {"true", "false"}:
+        payload["reasoning"] = {"enabled": reasoning_mode == "true"}
+    return payload
+
+def _is_pack_candidate(group, budget_bytes):
+    if group["is_folder"] or len(group["files"]) != 1 or group.get("skip_reason"):
+        return False
+    fpath = group["files"][0]
+    if os.path.splitext(fpath)[1].lower() not in TEXT_EXTENSIONS:
+        return False
+    return os.path.getsize(fpath) <= budget_bytes // 2
+
+def _build_packs(groups, budget_bytes, max_files):
+    packs = []
+    current = []
+    current_bytes = 0
+    for group in groups:
+        if not _is_pack_candidate(group, budget_bytes):
+            continue
+        size = os.path.getsize(group["files"][0])
+        if current and (current_bytes + size > budget_bytes or len(current) >= max_files):
+            packs.append(current)
+            current = []
+            current_bytes = 0
+        current.append(group)
+        current_bytes += size
+    if current:
+        packs.append(current)
+    # A pack of one file is just a normal request with extra overhead.
+    return [pack for pack in packs if len(pack) > 1]
+
+def _build_pack_payload(model, system_prompt, pack, reasoning_mode):
+    sections = []
+    for section_id, group in enumerate(pack, start=1):
+        with open(group["files"][0], "r", encoding="utf-8") as f:
+            text = f.read()
+        sections.append(f"<<<FILE id={section_id}>>>\n{text}\n<<<END FILE id={section_id}>>>")
+    payload = _build_payload(
+        model,
+        f"{system_prompt}\n\n{PACK_INSTRUCTIONS}",
+        [{"type": "text", "text": "\n\n".join(sections)}],
+        reasoning_mode
+    )
+    payload["response_format"] = PACK_RESPONSE_FORMAT
+    return payload
+
+def _parse_pack_reply(reply):
+    parsed = _parsed_json_value(reply)
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("results"), list):
+        return {}
+    outputs = {}
+    for item in parsed["results"]:
+        if not isinstance(item, dict):
+            continue
+        section_id = str(item.get("id", "")).strip()
+        output = item.get("output")
+        if section_id and isinstance(output, str) and section_id not in outputs:
+            outputs[section_id] = output
+    return outputs
+
 def _write_meta(job_dir, meta):
     meta_for_disk = dict(meta)
     api_key = meta_for_disk.get("api_key", "")
     meta_for_disk.pop("api_key", None)
     meta_for_disk["api_key_last8"] = api_key[-8:] if api_key else ""
     meta_file = os.path.join(job_dir, "meta.json")
-    with open(meta_file, "w", encoding="utf-8") as f:
+    # /progress reads meta.json while jobs write it, so it is swapped in whole.
+    temp_path = f"{meta_file}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
         json.dump(meta_for_disk, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, meta_file)
     return meta_file
 
 def _new_cost_summary():
@@ -127,7 +411,18 @@ def _new_cost_summary():
         "output_image_tokens": 0,
         "upstream_inference_cost": 0.0,
         "upstream_inference_prompt_cost": 0.0,
-        "upstream_inference_completions_cost": 0.0
+        "upstream_inference_completions_cost": 0.0,
+        "hedged_requests": 0,
+        "hedge_wins": 0,
+        "hedge_extra_requests": 0,
+        "hedge_extra_cost": 0.0,
+        "hedge_extra_tokens": 0,
+        "coalesced_requests": 0,
+        "shared_requests": 0,
+        "packed_requests": 0,
+        "packed_files": 0,
+        "pack_fallback_files": 0,
+        "fallback_answers": 0
     }
 
 def _add_cost_summary_usage(cost_summary, usage):
@@ -175,6 +470,35 @@ def _add_cost_summary_usage(cost_summary, usage):
     if usage.get("is_byok") is True:
         cost_summary["byok_requests"] += 1
 
+def _add_hedge_extra_usage(cost_summary, usage):
+    cost_summary["hedge_extra_requests"] += 1
+    try:
+        cost_summary["hedge_extra_tokens"] += int(usage.get("total_tokens") or 0)
+    except (TypeError, ValueError):
+        pass
+    try:
+        cost_summary["hedge_extra_cost"] = round(
+            cost_summary["hedge_extra_cost"] + float(usage.get("cost") or 0.0), 12
+        )
+    except (TypeError, ValueError):
+        pass
+
+def _append_jsonl(path, record):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def _summarize_stream_stats(samples):
+    ttfts = [sample["ttft"] for sample in samples]
+    rates = [sample["tokens_per_second"] for sample in samples]
+    return {
+        "streamed_requests": len(samples),
+        "ttft_p50": percentile(ttfts, 50),
+        "ttft_p95": percentile(ttfts, 95),
+        "ttft_max": max((value for value in ttfts if value is not None), default=None),
+        "tokens_per_second_p50": percentile(rates, 50),
+        "tokens_per_second_p5": percentile(rates, 5)
+    }
+
 def _output_filename(group_id, is_folder):
     normalized = group_id.rstrip("/")
     base = os.path.basename(normalized) if normalized else "output"
@@ -206,35 +530,187 @@ def _parsed_json_value(raw_output):
     except Exception:
         return False
 
-def _build_json_output_rows(rows):
+def _build_json_output_rows(rows, json_schema=None, strict=False):
     json_rows = []
     for row in rows:
         raw_output = "" if row.get("output") is None else str(row.get("output"))
-        json_rows.append({
+        json_row = {
             "file_name": row.get("file", ""),
-            "raw_output": raw_output,
-            "parsed_json": _parsed_json_value(raw_output)
-        })
+            "raw_output": raw_output
+        }
+        if strict:
+            value, errors = validate_json_reply(raw_output, json_schema)
+            json_row["parsed_json"] = False if value is None else value
+            json_row["json_errors"] = errors
+        else:
+            json_row["parsed_json"] = _parsed_json_value(raw_output)
+        if "model" in row:
+            json_row["model"] = row["model"]
+        json_rows.append(json_row)
     return json_rows
 
-def _save_concatenated_results(rows, output_dir, replace_sequence_token=False, sequence_token="000000001"):
-    os.makedirs(output_dir, exist_ok=True)
-    filename = datetime.now().strftime("results_%Y%m%d_%H%M%S.txt")
-    output_path = os.path.join(output_dir, filename)
+def is_failed_output(output):
+    return str(output or "").startswith("ERROR:")
+
+def row_needs_retry(row, meta):
+    # "Retry failed" re-sends groups whose request failed and groups whose
+    # reply failed the job's record or JSON schema checks.
+    if is_failed_output(row.get("output")) or row.get("record_errors"):
+        return True
+    structured_output = (
+        meta.get("source_route") == "index"
+        and "json" in (meta.get("output_formats") or [])
+        and bool(meta.get("structured_output", False))
+    )
+    return structured_output and bool(validate_json_reply(row.get("output"), meta.get("json_schema"))[1])
+
+def load_job_rows(job_dir):
+    rows_path = os.path.join(job_dir, ROWS_FILE)
+    if os.path.isfile(rows_path):
+        with open(rows_path, encoding="utf-8") as f:
+            return json.load(f)
+    # Jobs finished before rows.json existed still have their output files.
+    output_path = os.path.join(job_dir, "output.csv")
+    if os.path.isfile(output_path):
+        with open(output_path, encoding="utf-8", newline="") as f:
+            return [{"file": row["file"], "output": row["output"]} for row in csv.DictReader(f)]
+    output_json_path = os.path.join(job_dir, "output.json")
+    if os.path.isfile(output_json_path):
+        with open(output_json_path, encoding="utf-8") as f:
+            return [
+                {"file": row.get("file_name", ""), "output": row.get("raw_output", "")}
+                for row in json.load(f)
+            ]
+    return None
+
+def _concatenated_outputs(rows, replace_sequence_token=False, sequence_token="000000001", positions=None):
+    # `positions` gives each row's 1-based place in the full job, so a partial
+    # file numbers its records the same way the final file will.
     token = str(sequence_token or "")
     token_width = len(token)
-    concatenated_outputs = []
     for idx, row in enumerate(rows, start=1):
         output_text = str(row.get("output", ""))
         if replace_sequence_token and token:
-            replacement = str(idx).zfill(token_width)
-            output_text = output_text.replace(token, replacement)
-        concatenated_outputs.append(output_text)
-    content = "\n".join(concatenated_outputs)
+            sequence = positions[idx - 1] if positions is not None else idx
+            output_text = output_text.replace(token, str(sequence).zfill(token_width))
+        yield output_text
+
+def _save_concatenated_results(rows, output_dir, replace_sequence_token=False, sequence_token="000000001"):
+    os.makedirs(output_dir, exist_ok=True)
+    filename = datetime.now().strftime("results_%Y%m%d_%H%M%S.txt")
+    output_path = os.path.join(output_dir, filename)
+    content = "\n".join(_concatenated_outputs(rows, replace_sequence_token, sequence_token))
     with open(output_path, "w", encoding="utf-8") as f:
         f.write(content)
     return output_path
 
+def load_partial_rows(job_dir):
+    rows_by_index = {}
+    rows_path = os.path.join(job_dir, PARTIAL_ROWS_FILE)
+    if not os.path.isfile(rows_path):
+        return None
+    with open(rows_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                # The worker may be halfway through appending the last line.
+                continue
+            rows_by_index[row["index"]] = row
+    return [rows_by_index[idx] for idx in sorted(rows_by_index)]
+
+class _ZipStreamSink(io.RawIOBase):
+    # zipfile writes data descriptors to an unseekable sink, so the archive
+    # can be sent while it is being built.
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def _write_csv(path, rows, columns):
+    # Same bytes as the pandas to_csv(index=False) this replaced: minimal
+    # quoting, "\n" line endings and empty cells for None.
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([row.get(column) for column in columns])
+
+def _partial_csv_pieces(rows, with_model):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(["file", "output", "model"] if with_model else ["file", "output"])
+    for count, row in enumerate(rows, start=1):
+        record = [row["file"], row["output"]]
+        if with_model:
+            record.append(row.get("model", ""))
+        writer.writerow(record)
+        if count % PARTIAL_CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def iter_partial_results_zip(job_dir, meta):
+    rows = load_partial_rows(job_dir) or []
+    is_main_route = meta.get("source_route") == "index"
+    with_model = bool(meta.get("fallback_models"))
+    members = []
+    if is_main_route:
+        output_formats = meta.get("output_formats") or ["csv"]
+        write_texts = "text" in output_formats
+        if "csv" in output_formats:
+            members.append(("output.csv", _partial_csv_pieces(rows, with_model)))
+        if "json" in output_formats:
+            json_rows = [
+                {"file": row["file"], "output": row["output"], **({"model": row.get("model", "")} if with_model else {})}
+                for row in rows
+            ]
+            members.append(("output.json", [json.dumps(
+                _build_json_output_rows(json_rows, meta.get("json_schema"), strict=bool(meta.get("structured_output"))),
+                indent=2,
+                ensure_ascii=False
+            )]))
+            structured_output_path = os.path.join(job_dir, STRUCTURED_OUTPUT_FILE)
+            if meta.get("structured_output") and os.path.exists(structured_output_path):
+                with open(structured_output_path, "r", encoding="utf-8") as f:
+                    members.append((STRUCTURED_OUTPUT_FILE, [f.read()]))
+    else:
+        write_texts = meta.get("separate_outputs", False)
+        if not write_texts:
+            members.append(("output.csv", _partial_csv_pieces(rows, with_model)))
+        members.append(("results_concatenated.txt", ["\n".join(_concatenated_outputs(
+            rows,
+            replace_sequence_token=True,
+            positions=[row["index"] + 1 for row in rows]
+        ))]))
+    if write_texts:
+        for row in rows:
+            members.append((_output_filename(row["file"], row.get("is_folder", False)), [row["output"]]))
+
+    sink = _ZipStreamSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, pieces in members:
+            with zf.open(name, "w", force_zip64=True) as dst:
+                for piece in pieces:
+                    dst.write(piece.encode("utf-8"))
+                    data = sink.drain()
+                    if data:
+                        yield data
+            yield sink.drain()
+    yield sink.drain()
+
 def _append_custom_footer(output_text, footer_text):
     footer = str(footer_text or "")
     if not footer.strip():
@@ -248,6 +724,8 @@ def process_job(job_id, meta):
     input_dir = os.path.join(job_dir, "input")
     output_path = os.path.join(job_dir, "output.csv")
     output_json_path = os.path.join(job_dir, "output.json")
+    stream_metrics_path = os.path.join(job_dir, "stream_metrics.jsonl")
+    partial_rows_path = os.path.join(job_dir, PARTIAL_ROWS_FILE)
 
     # Generate timestamped ZIP name
     timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
@@ -263,6 +741,17 @@ def process_job(job_id, meta):
     separate_outputs = meta.get("separate_outputs", False)
     include_metadata = meta.get("include_metadata", False)
     custom_footer = meta.get("custom_footer", "")
+    hedge_requests = bool(meta.get("hedge_requests", False))
+    hedge_model = str(meta.get("hedge_model", "") or "").strip()
+    hedge_attempts = HedgeAttempts()
+    stream_responses = bool(meta.get("stream_responses", False))
+    coalesce_requests = bool(meta.get("coalesce_requests", True))
+    model_chain = [model]
+    for fallback_model in meta.get("fallback_models") or []:
+        fallback_model = str(fallback_model).strip()
+        if fallback_model and fallback_model not in model_chain:
+            model_chain.append(fallback_model)
+    answered_by = {}
     output_formats = meta.get("output_formats", [])
     if is_main_route:
         normalized_output_formats = []
@@ -280,79 +769,482 @@ def process_job(job_id, meta):
     else:
         input_csv_path = os.path.join(job_dir, "input.csv")
 
+    trace = get_job_trace(job_id, job_dir)
+    cassette = open_job_cassette(job_dir, meta)
+
     # for progress tracking
-    groups = _build_groups(input_dir, group_by_subfolder)
+    with trace.span("build_groups"):
+        groups = _build_groups(input_dir, group_by_subfolder)
+    oversize_policy = meta.get("oversize_policy") or ("subsample" if source_route == "marc" else "chunk")
+    with trace.span("size_limits", policy=oversize_policy):
+        groups, oversize_report = apply_size_limits(groups, model, system_prompt, oversize_policy)
+    meta["oversize_policy"] = oversize_policy
+    meta["oversize_groups"] = oversize_report
+    meta["validation_status"] = "running"
+    _write_meta(job_dir, meta)
+    with trace.span("validate"):
+        groups, validation_report, file_mimes = validate_groups(groups, input_dir)
+    meta["validation"] = validation_report
+    meta["validation_status"] = "done"
     total = len(groups)
     group_is_folder = {group["id"]: group["is_folder"] for group in groups}
     meta["total_files"] = total
     meta["processed_files"] = 0
     cost_summary = _new_cost_summary()
+    cost_summary_lock = threading.Lock()
     meta["cost_summary"] = cost_summary
 
-    rows = []
-    input_rows = _collect_input_rows(input_dir) if not is_main_route else []
-
-    for idx, group in enumerate(groups, start=1):
-        group_id = group["id"]
-        file_paths = group["files"]
+    def on_hedge_extra_usage(usage):
+        with cost_summary_lock:
+            _add_hedge_extra_usage(cost_summary, usage)
 
-        if not file_paths:
-            rows.append({"file": group_id, "output": "Empty folder"})
-            meta["processed_files"] = idx
-            _write_meta(job_dir, meta)
-            time.sleep(0.2)
-            continue
+    stream_samples = []
+    validate_records = source_route == "marc" and bool(meta.get("validate_records", False))
+    record_checks = {}
+    structured_output = is_main_route and "json" in output_formats and bool(meta.get("structured_output", False))
+    json_schema = meta.get("json_schema") if structured_output else None
+    # Record and JSON repairs never run in the same job; either way the paid
+    # re-requests of a job are capped.
+    repair_retries = {
+        "remaining": structured_retry_budget(total) if structured_output else record_retry_budget(total)
+    }
+    json_checks = {}
+    deduplicate_groups = meta.get("deduplicate_groups", True)
+    meta["deduplicated_groups"] = 0
+    reasoning_mode = str(meta.get("reasoning_mode", "off")).strip().lower()
 
-        label_files = group["is_folder"] or len(file_paths) > 1
-        user_content, supported = _build_user_content(file_paths, input_dir, label_files)
+    def mark_processed(count=1):
+        with cost_summary_lock:
+            meta["processed_files"] += count
+            if stream_samples:
+                meta["stream_stats"] = _summarize_stream_stats(stream_samples)
+            if not _job_abandoned(job_id):
+                _write_meta(job_dir, meta)
 
-        if supported == 0:
-            rows.append({"file": group_id, "output": "Unsupported file type"})
-        else:
-            reasoning_mode = str(meta.get("reasoning_mode", "off")).strip().lower()
-            payload = {
-                "model": model,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_content}
-                ]
-            }
-            if reasoning_mode in {"true", "false"}:
-                payload["reasoning"] = {"enabled": reasoning_mode == "true"}
-
-            headers = {"Authorization": f"Bearer {api_key}"}
-
-            should_append_footer = False
+    def dispatch_once(payload, group_id):
+        with cost_summary_lock:
             cost_summary["api_requests"] += 1
+        started = time.time()
+        try:
+            result = send_completion(
+                payload,
+                api_key,
+                coalesce=coalesce_requests,
+                hedge=hedge_requests,
+                hedge_model=hedge_model,
+                on_extra_usage=on_hedge_extra_usage,
+                stream=stream_responses,
+                on_delta=partial(_set_live_partial, job_id, group_id) if stream_responses else None,
+                abort_event=abort_event,
+                hedge_attempts=hedge_attempts,
+                cassette=cassette
+            )
+        except Exception as e:
+            with cost_summary_lock:
+                cost_summary["failed_requests"] += 1
+            trace.add_span(
+                "send",
+                "request",
+                started,
+                group=group_id,
+                model=payload.get("model"),
+                outcome=classify_failure(e)
+            )
+            raise
+        finally:
+            _clear_live_partial(job_id, group_id)
+        trace.add_span(
+            "send",
+            "request",
+            started,
+            group=group_id,
+            model=result["model"],
+            outcome="ok",
+            ttfb=result["ttfb"],
+            ttft=result["ttft"],
+            hedged=result["hedged"] or None,
+            coalesced=result["coalesced"] or None
+        )
+
+        with cost_summary_lock:
+            if result["streamed"]:
+                stream_sample = {
+                    "group": group_id,
+                    "model": result["model"],
+                    "ttft": result["ttft"],
+                    "tokens_per_second": result["tokens_per_second"],
+                    "latency": result["latency"]
+                }
+                stream_samples.append(stream_sample)
+                _append_jsonl(stream_metrics_path, stream_sample)
+            _add_cost_summary_usage(cost_summary, result["usage"])
+            cost_summary["successful_requests"] += 1
+            if result["hedged"]:
+                cost_summary["hedged_requests"] += 1
+            if result["hedge_won"]:
+                cost_summary["hedge_wins"] += 1
+            if result["coalesced"]:
+                cost_summary["coalesced_requests"] += 1
+            if result["shared_with"]:
+                cost_summary["shared_requests"] += 1
+        return result
+
+    def dispatch(payload, group_id):
+        # Walk the job's model chain; only failures that another model could
+        # plausibly avoid (timeouts, overload, unknown model, ...) move on.
+        attempted = []
+        last_error = None
+        for attempt_model in order_models_by_health(model_chain):
+            attempted.append(attempt_model)
             try:
-                r = requests.post(OPENROUTER_URL, json=payload, headers=headers, timeout=120)
-                r.raise_for_status()
-                data = r.json()
-                usage = data.get("usage") or {}
-                choices = data.get("choices") or []
-                if not choices:
-                    raise KeyError("Missing completion choices")
-                message = choices[0].get("message") or {}
-                reply = message.get("content")
-                if reply is None:
-                    raise KeyError("Missing completion content")
-                _add_cost_summary_usage(cost_summary, usage)
-                cost_summary["successful_requests"] += 1
-                should_append_footer = True
+                result = dispatch_once(dict(payload, model=attempt_model), group_id)
             except Exception as e:
-                cost_summary["failed_requests"] += 1
-                reply = f"ERROR: {e}"
+                failure = classify_failure(e)
+                if failure not in FALLBACK_FAILURES:
+                    raise
+                if len(attempted) < len(model_chain):
+                    metrics.inc("batch_fallback_attempts_total", model=attempt_model, failure=failure)
+                    metrics.inc("openrouter_retries_total", reason="fallback")
+                last_error = e
+                continue
+            with cost_summary_lock:
+                answered_by[result["model"]] = answered_by.get(result["model"], 0) + 1
+                if attempt_model != model:
+                    cost_summary["fallback_answers"] += 1
+            return result
+        if len(attempted) > 1:
+            raise RuntimeError(f"{last_error} (tried {', '.join(attempted)})")
+        raise last_error
 
-            if should_append_footer:
-                reply = _append_custom_footer(reply, custom_footer)
+    def take_repair_retry():
+        with cost_summary_lock:
+            if repair_retries["remaining"] <= 0:
+                return False
+            repair_retries["remaining"] -= 1
+            return True
 
-            rows.append({"file": group_id, "output": reply})
+    def repair_reply(group_id, payload, result, find_errors, build_messages, retries, take_retry, reason):
+        # Only groups whose reply fails validation are sent again, with the
+        # errors attached; a repair is kept when it has fewer errors.
+        errors = find_errors(result["reply"])
+        repair_requests = 0
+        while errors and repair_requests < retries and take_retry():
+            repair_requests += 1
+            metrics.inc("openrouter_retries_total", reason=reason)
+            repair_payload = dict(payload, messages=payload["messages"] + build_messages(result["reply"], errors))
+            with trace.span("repair_reply", "request", group=group_id, errors=len(errors)):
+                try:
+                    repaired = dispatch(repair_payload, group_id)
+                except Exception:
+                    break
+            repaired_errors = find_errors(repaired["reply"])
+            if len(repaired_errors) < len(errors):
+                result, errors = repaired, repaired_errors
+        return result, errors, repair_requests
 
-        # Update progress
-        meta["processed_files"] = idx
-        _write_meta(job_dir, meta)
+    def check_record(group_id, payload, result):
+        result, errors, repair_requests = repair_reply(
+            group_id, payload, result,
+            validate_aleph_record, record_repair_messages, RECORD_RETRIES_PER_GROUP, take_repair_retry,
+            "record_repair"
+        )
+        with cost_summary_lock:
+            record_checks[group_id] = {"errors": errors, "repair_requests": repair_requests}
+        return result
 
-        time.sleep(0.2)
+    def check_json(group_id, payload, result):
+        # Replies are checked as they arrive; a broken one is re-requested
+        # straight away rather than cleaned up after the job.
+        result, errors, repair_requests = repair_reply(
+            group_id, payload, result,
+            lambda reply: validate_json_reply(reply, json_schema)[1],
+            json_repair_messages, STRUCTURED_RETRIES_PER_GROUP, take_repair_retry,
+            "json_repair"
+        )
+        with cost_summary_lock:
+            json_checks[group_id] = {"errors": errors, "repair_requests": repair_requests}
+        return result
+
+    def run_pack(pack, submitted_at):
+        pack_id = f"pack:{pack[0]['id']}..{pack[-1]['id']}"
+        started = time.time()
+        trace.add_span("queue_wait", "request", submitted_at, started, group=pack_id)
+        try:
+            with trace.span("build_payload", "request", group=pack_id):
+                payload = _build_pack_payload(model, system_prompt, pack, reasoning_mode)
+            result = dispatch(payload, pack_id)
+            return _parse_pack_reply(result["reply"]), result["model"]
+        except Exception:
+            return {}, ""
+        finally:
+            trace.add_span("request", "request", started, group=pack_id, files=len(pack))
+
+    def run_group(group, submitted_at):
+        started = time.time()
+        trace.add_span("queue_wait", "request", submitted_at, started, group=group["id"])
+        try:
+            with trace.span("build_payload", "request", group=group["id"]):
+                label_files = group["is_folder"] or len(group["files"]) > 1
+                user_content, supported = _build_user_content(group["files"], input_dir, label_files, file_mimes)
+                payload = _build_payload(model, system_prompt, user_content, reasoning_mode)
+                if structured_output:
+                    payload["response_format"] = response_format_for(json_schema)
+            if supported == 0:
+                return "Unsupported file type", False, ""
+            try:
+                result = dispatch(payload, group["id"])
+            except Exception as e:
+                return f"ERROR: {e}", False, ""
+            if validate_records:
+                result = check_record(group["id"], payload, result)
+            if structured_output:
+                result = check_json(group["id"], payload, result)
+            return _append_custom_footer(result["reply"], custom_footer), True, result["model"]
+        finally:
+            trace.add_span("request", "request", started, group=group["id"])
+
+    def collect(future):
+        try:
+            return future.result()
+        except CancelledError:
+            return CANCELLED_GROUP_OUTPUT, False, ""
+
+    partial_rows_lock = threading.Lock()
+    structured_output_path = os.path.join(job_dir, STRUCTURED_OUTPUT_FILE)
+    for stale_path in (partial_rows_path, structured_output_path):
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+
+    def record_row(idx, result):
+        # Finished rows are journaled as they complete so that
+        # /download/<job_id>?partial=1 can package them while the job runs.
+        group = groups[idx]
+        if _job_abandoned(job_id):
+            return
+        with partial_rows_lock:
+            _append_jsonl(partial_rows_path, {
+                "index": idx,
+                "file": group["id"],
+                "is_folder": group["is_folder"],
+                "output": result[0],
+                "model": result[2]
+            })
+            if structured_output and result[1]:
+                # Validated objects are streamed in completion order; `index`
+                # gives the input order back.
+                value, errors = validate_json_reply(result[0], json_schema)
+                if not errors:
+                    _append_jsonl(structured_output_path, {
+                        "index": idx,
+                        "file": group["id"],
+                        "model": result[2],
+                        "data": value
+                    })
+
+    def submit_group(idx):
+        future = scheduler.submit(job_id, run_group, groups[idx], time.time())
+        future.add_done_callback(lambda done: record_row(idx, collect(done)))
+        future.add_done_callback(lambda _: mark_processed())
+        return future
+
+    scheduler.register_job(
+        job_id,
+        priority=PRIORITIES.get(str(meta.get("priority", "normal")), 0),
+        weight=job_weight(source_route, meta.get("username")),
+        label=meta.get("username") or source_route or ""
+    )
+    # Every group gets a slot in `results` so rows keep the input order no
+    # matter in which order the scheduler completes the requests.
+    results = [None] * len(groups)
+    reused_outputs = {}
+    if meta.get("retry_failed_only"):
+        previous_rows = [row for row in load_job_rows(job_dir) or [] if not row_needs_retry(row, meta)]
+        reused_outputs = {row["file"]: (row["output"], True, row.get("model", "")) for row in previous_rows}
+        record_checks.update({
+            row["file"]: {"errors": row["record_errors"], "repair_requests": 0}
+            for row in previous_rows
+            if "record_errors" in row
+        })
+    pending_groups = [group for group in groups if group["id"] not in reused_outputs]
+    # Pause or cancel may have been requested while the input was prepared.
+    with _job_controls_lock:
+        control = _job_control_unlocked(job_id)
+        abort_event = control["abort"]
+        if control["cancelled"]:
+            scheduler.cancel_job(job_id)
+        elif control["paused"]:
+            scheduler.pause_job(job_id, True)
+    dispatch_started = time.time()
+    try:
+        packed_replies = {}
+        pack_futures = {}
+        packed_ids = set()
+        # Pack replies are split out of one JSON document, so they cannot be
+        # held to a per-file response format.
+        if is_main_route and meta.get("pack_small_files", False) and not structured_output:
+            pack_token_budget = int(meta.get("pack_token_budget") or PACK_DEFAULT_TOKEN_BUDGET)
+            packs = _build_packs(
+                pending_groups,
+                budget_bytes=pack_token_budget * PACK_BYTES_PER_TOKEN,
+                max_files=int(meta.get("pack_max_files") or PACK_MAX_FILES)
+            )
+            for pack in packs:
+                pack_futures[scheduler.submit(job_id, run_pack, pack, time.time())] = pack
+                packed_ids.update(group["id"] for group in pack)
+
+        pending = []
+        duplicates = []
+        primary_by_fingerprint = {}
+        reused_count = 0
+        group_index = {group["id"]: idx for idx, group in enumerate(groups)}
+
+        def place_group(idx):
+            nonlocal reused_count
+            group = groups[idx]
+            if group["id"] in reused_outputs:
+                results[idx] = reused_outputs[group["id"]]
+                record_row(idx, results[idx])
+                reused_count += 1
+            elif group["id"] in packed_replies:
+                results[idx] = packed_replies[group["id"]]
+                record_row(idx, results[idx])
+            elif not group["files"]:
+                results[idx] = ("Empty folder", False, "")
+                record_row(idx, results[idx])
+                mark_processed()
+            elif group.get("skip_reason"):
+                results[idx] = (f"ERROR: {group['skip_reason']}", False, "")
+                record_row(idx, results[idx])
+                mark_processed()
+            else:
+                fingerprint = _group_fingerprint(group) if deduplicate_groups else None
+                if fingerprint is not None and fingerprint in primary_by_fingerprint:
+                    duplicates.append((idx, primary_by_fingerprint[fingerprint]))
+                    return
+                if fingerprint is not None:
+                    primary_by_fingerprint[fingerprint] = idx
+                pending.append((idx, submit_group(idx)))
+
+        # Groups outside the packs go to the scheduler right away, alongside
+        # the packs; a packed file is placed once its pack has answered.
+        for idx, group in enumerate(groups):
+            if group["id"] not in packed_ids:
+                place_group(idx)
+        for future in as_completed(pack_futures):
+            pack = pack_futures[future]
+            try:
+                outputs, pack_model = future.result()
+            except CancelledError:
+                outputs, pack_model = {}, ""
+            unpacked = 0
+            for section_id, group in enumerate(pack, start=1):
+                output = outputs.get(str(section_id))
+                if output is None:
+                    continue
+                packed_replies[group["id"]] = (_append_custom_footer(output, custom_footer), True, pack_model)
+                unpacked += 1
+            with cost_summary_lock:
+                cost_summary["packed_requests"] += 1
+                cost_summary["packed_files"] += unpacked
+                cost_summary["pack_fallback_files"] += len(pack) - unpacked
+            if unpacked:
+                mark_processed(unpacked)
+            # Files the pack reply did not cover fall back to their own request.
+            for group in pack:
+                place_group(group_index[group["id"]])
+        if reused_count:
+            meta["reused_groups"] = reused_count
+            mark_processed(reused_count)
+
+        for idx, future in pending:
+            results[idx] = collect(future)
+
+        # Duplicates share the primary's outcome, failures included; a failed
+        # group and its duplicates are sent again together by "retry failed".
+        for idx, primary_idx in duplicates:
+            results[idx] = results[primary_idx]
+            if groups[primary_idx]["id"] in record_checks:
+                record_checks[groups[idx]["id"]] = dict(record_checks[groups[primary_idx]["id"]], repair_requests=0)
+            if groups[primary_idx]["id"] in json_checks:
+                json_checks[groups[idx]["id"]] = dict(json_checks[groups[primary_idx]["id"]], repair_requests=0)
+            record_row(idx, results[idx])
+            meta["deduplicated_groups"] += 1
+            mark_processed()
+    finally:
+        scheduler.unregister_job(job_id)
+        with _job_controls_lock:
+            control = _job_controls.pop(job_id, None)
+        if control is not None and control["abandoned"]:
+            raise JobAbandoned(f"Job {job_id} was taken over by another worker")
+        if control is not None and control["cancelled"]:
+            meta["job_state"] = "cancelled"
+            meta["cancelled_groups"] = sum(
+                1 for result in results
+                if result is not None and result[0] == CANCELLED_GROUP_OUTPUT
+            )
+        trace.add_span("dispatch", "stage", dispatch_started, groups=len(pending_groups))
+
+    # Losing hedges are cancelled when the other attempt wins; wait for them
+    # so any usage they still report lands in this job's cost summary.
+    undrained_hedges = hedge_attempts.drain(HEDGE_DRAIN_SECONDS)
+    if undrained_hedges:
+        meta["undrained_hedges"] = undrained_hedges
+
+    outputs_started = time.time()
+
+    rows = [
+        {"file": group["id"], "output": reply, "model": answered_model}
+        for group, (reply, _, answered_model) in zip(groups, results)
+    ]
+    if validate_records:
+        for row in rows:
+            if row["file"] in record_checks:
+                row["record_errors"] = record_checks[row["file"]]["errors"]
+        meta["record_validation"] = {
+            "checked": len(record_checks),
+            "invalid": sum(1 for check in record_checks.values() if check["errors"]),
+            "repair_requests": sum(check["repair_requests"] for check in record_checks.values()),
+            "repaired": sum(
+                1 for check in record_checks.values() if check["repair_requests"] and not check["errors"]
+            ),
+            "retry_budget": record_retry_budget(total)
+        }
+    if structured_output:
+        json_errors = {}
+        for group, (reply, succeeded, _) in zip(groups, results):
+            if succeeded:
+                json_errors[group["id"]] = validate_json_reply(reply, json_schema)[1]
+        meta["structured_output_summary"] = {
+            "checked": len(json_errors),
+            "invalid": sum(1 for errors in json_errors.values() if errors),
+            "repair_requests": sum(check["repair_requests"] for check in json_checks.values()),
+            "repaired": sum(
+                1 for group_id, check in json_checks.items()
+                if check["repair_requests"] and not json_errors.get(group_id)
+            ),
+            "retry_budget": structured_retry_budget(total)
+        }
+    # The answering model only becomes a column when the job had fallbacks.
+    output_rows = rows if len(model_chain) > 1 else [
+        {"file": row["file"], "output": row["output"]} for row in rows
+    ]
+    input_rows = _collect_input_rows(input_dir) if not is_main_route else []
+    with open(os.path.join(job_dir, ROWS_FILE), "w", encoding="utf-8") as f:
+        json.dump(rows, f, ensure_ascii=False)
+    meta["failed_groups"] = sum(1 for row in rows if is_failed_output(row["output"]))
+    meta["invalid_groups"] = sum(
+        1 for row in rows if not is_failed_output(row["output"]) and row_needs_retry(row, meta)
+    )
+    metrics.inc("batch_groups_total", len(rows) - meta["failed_groups"], result="ok")
+    metrics.inc("batch_groups_total", meta["failed_groups"], result="error")
+    if cassette is not None and cassette.replaying:
+        # Later retries make real requests and add them to the same cassette.
+        meta["cassette_mode"] = "record"
+        meta["replayed_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if meta.get("retry_failed_only"):
+        meta["retry_failed_only"] = False
+        meta["retried_groups"] = len(pending_groups)
+        metrics.inc("openrouter_retries_total", len(pending_groups), reason="failed_groups")
 
     if meta.get("source_route") == "marc" and meta.get("save_concat_results", False):
         concat_results_dir = meta.get("concat_results_dir", "")
@@ -370,18 +1262,31 @@ def process_job(job_id, meta):
                 meta["concatenated_results_saved"] = False
                 meta["concatenated_results_error"] = str(e)
 
+    output_columns = ["file", "output", "model"] if len(model_chain) > 1 else ["file", "output"]
     if is_main_route:
         if "csv" in output_formats:
-            pd.DataFrame(rows).to_csv(output_path, index=False)
+            _write_csv(output_path, output_rows, output_columns)
         if "json" in output_formats:
             with open(output_json_path, "w", encoding="utf-8") as f:
-                json.dump(_build_json_output_rows(rows), f, indent=2, ensure_ascii=False)
+                json.dump(
+                    _build_json_output_rows(output_rows, json_schema, strict=structured_output),
+                    f,
+                    indent=2,
+                    ensure_ascii=False
+                )
     else:
         # Save CSV
-        pd.DataFrame(rows).to_csv(output_path, index=False)
-        # sort input.csv rows alphabetically by full_path
-        df_input = pd.DataFrame(input_rows).sort_values(by="full_path")
-        df_input.to_csv(input_csv_path, index=False)
+        _write_csv(output_path, output_rows, output_columns)
+        record_errors_path = os.path.join(job_dir, RECORD_ERRORS_FILE)
+        record_error_rows = [
+            dict(error, file=row["file"]) for row in rows for error in row.get("record_errors") or []
+        ]
+        if record_error_rows:
+            _write_csv(record_errors_path, record_error_rows, ["file", "line", "tag", "error"])
+        elif os.path.exists(record_errors_path):
+            os.remove(record_errors_path)
+        # input.csv rows are already sorted alphabetically by full_path
+        _write_csv(input_csv_path, input_rows, INPUT_CSV_COLUMNS)
 
     output_text_files = []
     should_write_text_outputs = (
@@ -399,11 +1304,20 @@ def process_job(job_id, meta):
                 f.write(row["output"])
             output_text_files.append((fpath, filename))
 
+    _clear_live_partial(job_id)
+    meta["model_latency"] = model_latency_snapshot()
+    meta["answered_by"] = answered_by
+    meta["model_health"] = {
+        chain_model: health
+        for chain_model, health in model_health_snapshot().items()
+        if chain_model in model_chain
+    }
+
     # Save completion timestamp & elapsed time
     completed_at = datetime.now()
     meta["completed_at"] = completed_at.strftime("%Y-%m-%d %H:%M:%S")
 
-    submitted_at_str = meta.get("submitted_at")
+    submitted_at_str = meta.get("retry_started_at") or meta.get("submitted_at")
     if submitted_at_str:
         try:
             submitted_at = datetime.strptime(submitted_at_str, "%Y-%m-%d %H:%M:%S")
@@ -412,9 +1326,26 @@ def process_job(job_id, meta):
         except Exception:
             meta["elapsed_time"] = "unknown"
 
+    # A search index failure is recorded but does not fail the job.
+    try:
+        meta["search_indexed_rows"] = index_job_rows(
+            job_id,
+            rows,
+            route=meta.get("source_route", ""),
+            default_model=model,
+            results_zip=zip_filename
+        )
+        meta.pop("search_index_error", None)
+    except Exception as e:
+        meta["search_index_error"] = str(e)
+
+    trace.add_span("write_outputs", "stage", outputs_started)
+    meta["timing_summary"] = trace.summary()
+    meta["trace_file"] = CHROME_TRACE_FILE
     meta_file = _write_meta(job_dir, meta)
 
     # Create results.zip
+    zip_started = time.time()
     with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
         if is_main_route:
             for fpath, filename in output_text_files:
@@ -423,8 +1354,12 @@ def process_job(job_id, meta):
                 zf.write(output_path, arcname="output.csv")
             if "json" in output_formats and os.path.exists(output_json_path):
                 zf.write(output_json_path, arcname="output.json")
+            if structured_output and os.path.exists(structured_output_path):
+                zf.write(structured_output_path, arcname=STRUCTURED_OUTPUT_FILE)
             if include_metadata and os.path.exists(meta_file):
                 zf.write(meta_file, arcname="meta.json")
+            if include_metadata and os.path.exists(stream_metrics_path):
+                zf.write(stream_metrics_path, arcname="stream_metrics.jsonl")
         else:
             if separate_outputs:
                 for fpath, filename in output_text_files:
@@ -432,6 +1367,17 @@ def process_job(job_id, meta):
             else:
                 zf.write(output_path, arcname="output.csv")
                 zf.write(input_csv_path, arcname="input.csv")
+            if os.path.exists(record_errors_path):
+                zf.write(record_errors_path, arcname=RECORD_ERRORS_FILE)
             if include_metadata and os.path.exists(meta_file):
                 zf.write(meta_file, arcname="meta.json")
+            if include_metadata and os.path.exists(stream_metrics_path):
+                zf.write(stream_metrics_path, arcname="stream_metrics.jsonl")
+    trace.add_span("zip", "stage", zip_started)
+    # Taken again now that the zip stage is closed; only the meta.json copy
+    # inside the ZIP has to go without it.
+    meta["timing_summary"] = trace.summary()
+    _write_meta(job_dir, meta)
+    if os.path.exists(partial_rows_path):
+        os.remove(partial_rows_path)
     return zip_path
@@ -0,0 +1,174 @@
+import os, json, time, signal, threading, argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import UPLOAD_FOLDER, JOB_WORKERS, JOB_LEASE_SECONDS, WORKER_METRICS_PORT
+from job_queue import new_worker_id, claim_job, renew_lease, finish_job, expire_abandoned_jobs
+from job_runner import run_job_pipeline, persist_job_meta
+from worker import apply_job_control_file, abandon_job, JobAbandoned, JOB_CONTROL_FILE
+import metrics
+
+POLL_INTERVAL = 2.0
+CONTROL_POLL_INTERVAL = 1.0
+
+def _log(message):
+    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+
+def _load_meta(job_dir):
+    meta_file = os.path.join(job_dir, "meta.json")
+    if not os.path.isfile(meta_file):
+        return None
+    with open(meta_file, encoding="utf-8") as f:
+        return json.load(f)
+
+def _mark_failed(job_id, error):
+    job_dir = os.path.join(UPLOAD_FOLDER, job_id)
+    meta = _load_meta(job_dir)
+    if meta is None:
+        return
+    meta["queue_state"] = "failed"
+    meta["queue_error"] = error
+    persist_job_meta(job_dir, meta)
+
+def _watch_job(job_id, lease_token, stop_event, lease_lost):
+    job_dir = os.path.join(UPLOAD_FOLDER, job_id)
+    renew_every = JOB_LEASE_SECONDS / 3.0
+    last_renewed = time.monotonic()
+    while not stop_event.wait(CONTROL_POLL_INTERVAL):
+        apply_job_control_file(job_id, job_dir)
+        if time.monotonic() - last_renewed < renew_every:
+            continue
+        last_renewed = time.monotonic()
+        if not renew_lease(job_id, lease_token):
+            # Another worker may already have reclaimed the job, so this
+            # attempt stops instead of writing into the same job directory.
+            _log(f"Lost lease on job {job_id}; stopping this attempt")
+            lease_lost.set()
+            abandon_job(job_id)
+            return
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    # Jobs, requests and groups are counted in the process that runs them,
+    # so with JOB_EXECUTION_MODE=queue each worker is scraped on its own.
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_metrics_server(port, host="0.0.0.0"):
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+def run_claimed_job(claim, worker_id):
+    job_id = claim["job_id"]
+    job_dir = os.path.join(UPLOAD_FOLDER, job_id)
+    meta = _load_meta(job_dir)
+    if meta is None:
+        finish_job(job_id, claim["lease_token"], error="Job directory or meta.json is missing")
+        return
+
+    # meta.json never stores the API key, so it travels with the queue entry.
+    meta["api_key"] = claim["api_key"]
+    meta["queue_state"] = "running"
+    meta["queue_worker"] = worker_id
+    meta["queue_attempt"] = claim["attempt"]
+    persist_job_meta(job_dir, meta)
+    control_path = os.path.join(job_dir, JOB_CONTROL_FILE)
+    if os.path.isfile(control_path):
+        os.remove(control_path)
+
+    stop_event = threading.Event()
+    lease_lost = threading.Event()
+    lease_thread = threading.Thread(
+        target=_watch_job,
+        args=(job_id, claim["lease_token"], stop_event, lease_lost),
+        daemon=True
+    )
+    lease_thread.start()
+    error = None
+    result_path = None
+    try:
+        result_path = run_job_pipeline(job_id, meta)
+    except JobAbandoned:
+        pass
+    except Exception as e:
+        error = str(e) or e.__class__.__name__
+    finally:
+        stop_event.set()
+
+    if lease_lost.is_set():
+        _log(f"Job {job_id} was stopped after its lease was lost; leaving it to the worker that reclaimed it")
+        return
+    if not finish_job(job_id, claim["lease_token"], error=error):
+        _log(f"Job {job_id} was reclaimed by another worker; dropping this attempt")
+        return
+    if error:
+        meta["queue_state"] = "failed"
+        meta["queue_error"] = error
+        _log(f"Job {job_id} failed: {error}")
+    else:
+        meta["queue_state"] = "finished"
+        meta["result_zip"] = os.path.basename(result_path)
+        _log(f"Job {job_id} finished")
+    persist_job_meta(job_dir, meta)
+
+def worker_loop(worker_id, stop_event):
+    while not stop_event.is_set():
+        try:
+            for job_id in expire_abandoned_jobs():
+                _log(f"Job {job_id} failed after its worker stopped renewing the lease")
+                _mark_failed(job_id, "Worker stopped responding")
+            claim = claim_job(worker_id)
+        except Exception as e:
+            _log(f"Queue error: {e}")
+            claim = None
+        if claim is None:
+            stop_event.wait(POLL_INTERVAL)
+            continue
+        _log(f"{worker_id} claimed job {claim['job_id']} (attempt {claim['attempt']})")
+        run_claimed_job(claim, worker_id)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run queued batch jobs outside the web process.")
+    parser.add_argument("--jobs", type=int, default=JOB_WORKERS, help="jobs to run concurrently in this process")
+    parser.add_argument("--metrics-port", type=int, default=WORKER_METRICS_PORT, help="serve /metrics on this port (0 is off)")
+    args = parser.parse_args()
+
+    stop_event = threading.Event()
+
+    def request_stop(signum, frame):
+        # Finish the jobs in hand but claim nothing new; a second signal exits
+        # immediately and leaves the leases to expire and be reclaimed.
+        if stop_event.is_set():
+            os._exit(1)
+        _log("Stopping after the current jobs finish")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+        _log(f"Serving /metrics on port {args.metrics_port}")
+
+    threads = []
+    for _ in range(max(1, args.jobs)):
+        thread = threading.Thread(target=worker_loop, args=(new_worker_id(), stop_event))
+        thread.start()
+        threads.append(thread)
+    _log(f"Worker started with {len(threads)} job slots")
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(timeout=1)
+
+if __name__ == "__main__":
+    main()